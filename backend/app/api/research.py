@@ -6,11 +6,12 @@ from collections.abc import AsyncGenerator
 from fastapi import APIRouter, Depends, Request
 from fastapi import HTTPException
 from fastapi.responses import StreamingResponse
-from pydantic import BaseModel, field_validator
+from pydantic import BaseModel, Field, field_validator
 
 from ..core.deps import get_current_user
 from ..core.deps import get_optional_current_user
 from ..core.deps import resolve_guest_id
+from ..core.health import runtime_health
 from ..core.orchestrator import research_orchestrator
 from ..models.user import User
 
@@ -22,6 +23,8 @@ router = APIRouter()
 class ResearchRequest(BaseModel):
     query: str
     stream: bool | None = True
+    # 整个研究任务的截止时长（秒），不传则使用 RESEARCH_DEADLINE_SECONDS
+    deadline_seconds: float | None = Field(default=None, gt=0, le=3600)
 
     @field_validator("query")
     @classmethod
@@ -87,6 +90,7 @@ async def start_research(
                     request.query,
                     user_id=user_id,
                     guest_id=guest_id,
+                    deadline_seconds=request.deadline_seconds,
                 ):
                     yield f"data: {json.dumps(update, ensure_ascii=False)}\n\n"
             except Exception as exc:
@@ -109,6 +113,7 @@ async def start_research(
             request.query,
             user_id=user_id,
             guest_id=guest_id,
+            deadline_seconds=request.deadline_seconds,
         ):
             results.append(update)
             if update.get("type") == "report_complete" and isinstance(
@@ -271,4 +276,8 @@ async def clear_research_history(current_user: User = Depends(get_current_user))
 @router.get("/health")
 async def health_check():
     """健康检查"""
-    return {"status": "healthy", "message": "Deep Research Agent API is running"}
+    return {
+        "status": "healthy",
+        "message": "Deep Research Agent API is running",
+        **runtime_health(),
+    }
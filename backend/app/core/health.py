@@ -0,0 +1,28 @@
+from __future__ import annotations
+
+from ..services.content_extraction_service import content_extraction_service
+from ..services.deepseek_service import deepseek_service
+from ..services.search_tools import search_tools
+
+
+def runtime_health() -> dict[str, object]:
+    """Process-wide runtime state surfaced on the health endpoint."""
+    return {
+        "llm": {
+            "rate_limiter": deepseek_service.rate_limiter.snapshot(),
+            "response_cache": deepseek_service.response_cache.snapshot(),
+        },
+        "adaptive_concurrency": {
+            "llm": deepseek_service.concurrency.snapshot(),
+            "search": search_tools.concurrency.snapshot(),
+            "fetch": content_extraction_service.concurrency.snapshot(),
+        },
+        "search_cache": search_tools.cache.snapshot(),
+        "search_optional_providers": search_tools.optional_snapshot(),
+        "search_rate_limits": search_tools.rate_limit_snapshot(),
+        "search_quota": search_tools.quota.snapshot(),
+        "circuit_breakers": {
+            "deepseek": deepseek_service.circuit_breaker.snapshot(),
+            **search_tools.circuit_snapshot(),
+        },
+    }
@@ -8,6 +8,7 @@ from uuid import uuid4
 from ..models.research_task import ResearchTask
 from ..models.research_task import ResearchTaskStatus
 from ..research.agent import ResearchAgent
+from ..research.deadline import default_deadline_seconds
 from ..services.research_repository import ResearchRepository
 
 
@@ -23,12 +24,17 @@ class ResearchOrchestrator:
         query: str,
         user_id: int | None = None,
         guest_id: str | None = None,
+        deadline_seconds: float | None = None,
     ) -> AsyncGenerator[dict[str, object], None]:
         task = ResearchTask(
             id=str(uuid4()),
             user_id=user_id,
             guest_id=None if user_id is not None else guest_id,
             query=query,
+            deadline_seconds=(
+                deadline_seconds if deadline_seconds is not None
+                else default_deadline_seconds()
+            ),
         )
         task.status = ResearchTaskStatus.PLANNING
         task.touch()
@@ -43,6 +49,7 @@ class ResearchOrchestrator:
                 "guest_id": task.guest_id,
                 "query": task.query,
                 "status": task.status.value,
+                "deadline_seconds": task.deadline_seconds,
                 "timestamp": task.updated_at,
             },
         )
@@ -52,7 +59,12 @@ class ResearchOrchestrator:
     async def run_task(
         self, task: ResearchTask
     ) -> AsyncGenerator[dict[str, object], None]:
-        research_agent = ResearchAgent(query=task.query, repository=self.repository)
+        # 恢复任务沿用创建时的截止时长，从本次运行开始重新计时
+        research_agent = ResearchAgent(
+            query=task.query,
+            repository=self.repository,
+            deadline_seconds=task.deadline_seconds,
+        )
         update_queue: asyncio.Queue[dict[str, object]] = asyncio.Queue()
 
         async def produce_updates() -> None:
@@ -77,8 +89,10 @@ class ResearchOrchestrator:
                 if event_type == "update":
                     update = queued["data"]
                     if isinstance(update, dict):
-                        task.touch()
-                        self.repository.save_task(task)
+                        # 报告和初步回答的增量只用于实时展示，不逐条落库
+                        if update.get("type") not in {"report_delta", "quick_answer_delta"}:
+                            task.touch()
+                            self.repository.save_task(task)
                         yield update
                     continue
 
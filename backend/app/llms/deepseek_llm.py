@@ -1,18 +1,46 @@
+import time
+from collections.abc import AsyncIterator
+
 from langchain_core.language_models.llms import BaseLLM
 from langchain_core.outputs import Generation
+from langchain_core.outputs import GenerationChunk
 from langchain_core.outputs import LLMResult
 
+from ..services.deepseek_service import DeepSeekAPIError
+from ..services.deepseek_service import DeepSeekCompletion
 from ..services.deepseek_service import deepseek_service
+from ..services.retry_policy import RetryStats
 
 
 class DeepSeekLLM(BaseLLM):
-    """Custom LLM wrapper for DeepSeek API，优化性能."""
+    """Custom LLM wrapper for DeepSeek API，优化性能.
+
+    Callers may pass ``step`` and ``cost_tracker`` kwargs; the call (including
+    retries and failures) is then recorded on that tracker under ``step``.
+    A ``system_prompt`` kwarg is sent as a leading system message so that
+    static instructions form a cacheable prompt prefix. ``json_mode=True``
+    requests a JSON-object response and ``stop`` is forwarded as the API's
+    stop sequences.
+
+    ``profile`` names a generation profile (see ``GenerationProfile``); its
+    model, max_tokens, temperature and timeout fill any field not passed
+    explicitly.
+    """
 
     model_name: str = deepseek_service.config.model
     temperature: float = deepseek_service.config.temperature
     max_tokens: int = deepseek_service.config.max_output_tokens
+    request_timeout: float | None = None
+    profile: str | None = None
 
     def __init__(self, **kwargs) -> None:
+        profile_name = kwargs.get("profile")
+        if profile_name:
+            profile = deepseek_service.profile_for(profile_name)
+            kwargs.setdefault("model_name", profile.model)
+            kwargs.setdefault("temperature", profile.temperature)
+            kwargs.setdefault("max_tokens", profile.max_tokens)
+            kwargs.setdefault("request_timeout", profile.timeout)
         super().__init__(**kwargs)
 
     @property
@@ -28,14 +56,26 @@ class DeepSeekLLM(BaseLLM):
     ) -> LLMResult:
         """Generate text from DeepSeek API."""
         prompt = prompts[0]
-        response = deepseek_service.generate_response_sync(
-            prompt,
-            self.max_tokens,
-            model=self.model_name,
-            temperature=self.temperature,
-        )
-        generation = Generation(text=response)
-        return LLMResult(generations=[[generation]])
+        step, cost_tracker = self._pop_tracking(kwargs)
+        system_prompt = kwargs.get("system_prompt")
+        json_mode = bool(kwargs.get("json_mode", False))
+        try:
+            completion = deepseek_service.complete_sync(
+                prompt,
+                self.max_tokens,
+                model=self.model_name,
+                temperature=self.temperature,
+                system_prompt=system_prompt,
+                json_mode=json_mode,
+                stop=stop,
+                step=step,
+                timeout=self.request_timeout,
+            )
+        except DeepSeekAPIError as exc:
+            self._track_failure(cost_tracker, step, exc)
+            raise
+        self._track(cost_tracker, step, prompt, completion, system_prompt)
+        return self._to_result(completion)
 
     async def _agenerate(
         self,
@@ -46,15 +86,27 @@ class DeepSeekLLM(BaseLLM):
     ) -> LLMResult:
         """Generate text from DeepSeek API asynchronously."""
         prompt = prompts[0]
+        step, cost_tracker = self._pop_tracking(kwargs)
         temperature = kwargs.get("temperature", self.temperature)
-        response = await deepseek_service.generate_response(
-            prompt,
-            self.max_tokens,
-            model=self.model_name,
-            temperature=float(temperature) if temperature is not None else None,
-        )
-        generation = Generation(text=response)
-        return LLMResult(generations=[[generation]])
+        system_prompt = kwargs.get("system_prompt")
+        json_mode = bool(kwargs.get("json_mode", False))
+        try:
+            completion = await deepseek_service.complete(
+                prompt,
+                self.max_tokens,
+                model=self.model_name,
+                temperature=float(temperature) if temperature is not None else None,
+                system_prompt=system_prompt,
+                json_mode=json_mode,
+                stop=stop,
+                step=step,
+                timeout=self.request_timeout,
+            )
+        except DeepSeekAPIError as exc:
+            self._track_failure(cost_tracker, step, exc)
+            raise
+        self._track(cost_tracker, step, prompt, completion, system_prompt)
+        return self._to_result(completion)
 
     def _call(
         self,
@@ -76,7 +128,8 @@ class DeepSeekLLM(BaseLLM):
     ) -> str:
         """Call DeepSeek API asynchronously.
 
-        Accepts an optional ``temperature`` kwarg to override the default.
+        Accepts an optional ``temperature`` kwarg to override the default and
+        an optional ``system_prompt`` kwarg sent as the leading system message.
         """
         temperature = kwargs.pop("temperature", None)
         if temperature is not None:
@@ -89,6 +142,121 @@ class DeepSeekLLM(BaseLLM):
             result = await self._agenerate([prompt], stop, run_manager, **kwargs)
         return result.generations[0][0].text
 
+    async def _astream(
+        self,
+        prompt: str,
+        stop: list[str] | None = None,
+        run_manager: object | None = None,
+        **kwargs: object,
+    ) -> AsyncIterator[GenerationChunk]:
+        """Stream DeepSeek output chunk by chunk as it arrives on the socket."""
+        step, cost_tracker = self._pop_tracking(kwargs)
+        temperature = kwargs.get("temperature", self.temperature)
+        temperature = float(temperature) if temperature is not None else None
+        system_prompt = kwargs.get("system_prompt")
+        json_mode = bool(kwargs.get("json_mode", False))
+        cached = await deepseek_service.cached_completion(
+            prompt,
+            self.max_tokens,
+            model=self.model_name,
+            temperature=temperature,
+            system_prompt=system_prompt,
+            json_mode=json_mode,
+            stop=stop,
+            step=step,
+        )
+        if cached is not None:
+            yield GenerationChunk(text=cached.text)
+            self._track(cost_tracker, step, prompt, cached, system_prompt)
+            return
+
+        retry_stats = RetryStats()
+        usage: dict[str, int] = {}
+        parts: list[str] = []
+        started_at = time.monotonic()
+        try:
+            async for delta in deepseek_service.stream_response(
+                prompt,
+                self.max_tokens,
+                model=self.model_name,
+                temperature=temperature,
+                system_prompt=system_prompt,
+                json_mode=json_mode,
+                stop=stop,
+                retry_stats=retry_stats,
+                step=step,
+                usage=usage,
+                timeout=self.request_timeout,
+            ):
+                parts.append(delta)
+                yield GenerationChunk(text=delta)
+        except DeepSeekAPIError as exc:
+            self._track_failure(cost_tracker, step, exc)
+            raise
+        completion = DeepSeekCompletion(
+            text="".join(parts),
+            retries=retry_stats.retries,
+            retry_backoff_seconds=round(retry_stats.backoff_seconds, 3),
+            retry_reasons=dict(retry_stats.by_class),
+            cache_status=deepseek_service.cache_status_for(step),
+            prompt_tokens=usage.get("prompt_tokens"),
+            completion_tokens=usage.get("completion_tokens"),
+            prompt_cache_hit_tokens=usage.get("prompt_cache_hit_tokens"),
+            prompt_cache_miss_tokens=usage.get("prompt_cache_miss_tokens"),
+            latency_seconds=round(time.monotonic() - started_at, 3),
+        )
+        self._track(cost_tracker, step, prompt, completion, system_prompt)
+
+    def _pop_tracking(self, kwargs: dict[str, object]) -> tuple[str, object | None]:
+        step = kwargs.pop("step", None)
+        cost_tracker = kwargs.pop("cost_tracker", None)
+        return str(step or self._llm_type), cost_tracker
+
+    def _track(
+        self,
+        cost_tracker: object | None,
+        step: str,
+        prompt: str,
+        completion: DeepSeekCompletion,
+        system_prompt: object | None = None,
+    ) -> None:
+        if cost_tracker is None:
+            return
+        if system_prompt:
+            # 没有 usage 时按字符估算，system 消息同样计入输入 token
+            prompt = f"{system_prompt}\n{prompt}"
+        cost_tracker.track_llm_call(
+            step=step,
+            prompt=prompt,
+            response=completion.text,
+            completion=completion,
+            model=completion.model or self.model_name,
+        )
+
+    def _track_failure(
+        self,
+        cost_tracker: object | None,
+        step: str,
+        error: DeepSeekAPIError,
+    ) -> None:
+        if cost_tracker is None:
+            return
+        cost_tracker.track_llm_failure(step=step, error=error, model=self.model_name)
+
+    def _to_result(self, completion: DeepSeekCompletion) -> LLMResult:
+        generation = Generation(
+            text=completion.text,
+            generation_info={
+                "retries": completion.retries,
+                "retry_backoff_seconds": completion.retry_backoff_seconds,
+                "cached": completion.cached,
+                "prompt_tokens": completion.prompt_tokens,
+                "completion_tokens": completion.completion_tokens,
+                "latency_seconds": completion.latency_seconds,
+            },
+        )
+        return LLMResult(generations=[[generation]])
+
     @property
     def _identifying_params(self) -> dict[str, object]:
         """Get identifying parameters."""
@@ -96,4 +264,5 @@ class DeepSeekLLM(BaseLLM):
             "model_name": self.model_name,
             "temperature": self.temperature,
             "max_tokens": self.max_tokens,
+            "profile": self.profile,
         }
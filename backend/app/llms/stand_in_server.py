@@ -0,0 +1,315 @@
+"""Local OpenAI-compatible stand-in for the DeepSeek chat API.
+
+Speaks ``POST /chat/completions`` (including ``stream: true`` and
+``stream_options.include_usage``) with canned answers shaped per research
+step, so the full orchestrator can be load-tested offline::
+
+    python -m backend.app.llms.stand_in_server        # 默认监听 8100
+    DEEPSEEK_BASE_URL=http://127.0.0.1:8100/v1 uv run python -m backend.app.main
+
+Latency, throughput, error rate and 429 behaviour are configured through
+``LLM_STAND_IN_*`` environment variables (see ``StandInConfig.from_env``).
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import re
+import time
+import uuid
+from collections.abc import AsyncIterator
+from dataclasses import dataclass
+
+from fastapi import FastAPI
+from fastapi import Request
+from fastapi.responses import JSONResponse
+from fastapi.responses import StreamingResponse
+
+from ..utils.env import env_float
+from ..utils.env import env_int
+from ..utils.tokens import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class StandInConfig:
+    # 首字节延迟服从对数正态分布：中位数 latency_median_seconds，离散度 latency_sigma
+    latency_median_seconds: float = 0.3
+    latency_sigma: float = 0.5
+    latency_max_seconds: float = 10.0
+    # 输出速度；<=0 表示一次性返回、不按 token 限速
+    tokens_per_second: float = 60.0
+    # 随机返回 500 / 429 的比例
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    retry_after_seconds: float = 1.0
+    # 超过该并发数时一律返回 429；0 表示不限制
+    max_concurrency: int = 0
+    stream_chunk_chars: int = 8
+    seed: int | None = None
+
+    @classmethod
+    def from_env(cls) -> "StandInConfig":
+        seed = os.getenv("LLM_STAND_IN_SEED")
+        return cls(
+            latency_median_seconds=env_float("LLM_STAND_IN_LATENCY_MEDIAN_SECONDS", 0.3),
+            latency_sigma=env_float("LLM_STAND_IN_LATENCY_SIGMA", 0.5),
+            latency_max_seconds=env_float("LLM_STAND_IN_LATENCY_MAX_SECONDS", 10.0),
+            tokens_per_second=env_float("LLM_STAND_IN_TOKENS_PER_SECOND", 60.0),
+            error_rate=env_float("LLM_STAND_IN_ERROR_RATE", 0.0),
+            rate_limit_rate=env_float("LLM_STAND_IN_RATE_LIMIT_RATE", 0.0),
+            retry_after_seconds=env_float("LLM_STAND_IN_RETRY_AFTER_SECONDS", 1.0),
+            max_concurrency=env_int("LLM_STAND_IN_MAX_CONCURRENCY", 0),
+            stream_chunk_chars=max(1, env_int("LLM_STAND_IN_STREAM_CHUNK_CHARS", 8)),
+            seed=int(seed) if seed and seed.lstrip("-").isdigit() else None,
+        )
+
+
+def detect_step(system_prompt: str, user_prompt: str) -> str:
+    """根据提示词判断请求来自哪个研究步骤（请求体里没有 step 字段）。
+
+    优先只看 system 消息，避免网页正文里的字样误判；没有 system 消息时才看 user。
+    """
+    text = system_prompt or user_prompt
+    if "sub_queries" in text:
+        return "query_planning"
+    if '"context"' in text and '"verification"' in text:
+        return "context_verification"
+    if '"passed"' in text:
+        return "verification"
+    # 合并与章节草稿的提示词也提到执行摘要，需先判断
+    if "各章节草稿" in text:
+        return "report_merge"
+    if "章节草稿" in text:
+        return "section_drafting"
+    if "执行摘要" in text:
+        return "report_writing"
+    if "初步回答" in text:
+        return "quick_answer"
+    return "context_compression"
+
+
+def canned_response(step: str, user_prompt: str) -> str:
+    """按步骤返回形状正确的固定内容，保证下游解析路径与真实调用一致。"""
+    topic = _first_line_after(user_prompt, "## 用户问题") or _first_line_after(
+        user_prompt, "研究查询："
+    ) or "研究主题"
+    if step == "query_planning":
+        limit = _first_line_after(user_prompt, "## 子查询数量上限")
+        count = int(limit) if limit and limit.isdigit() else 3
+        aspects = ["历史发展", "最新进展", "优势与风险", "典型案例", "数据趋势", "不同观点"]
+        return json.dumps(
+            {"sub_queries": [f"{topic} {aspect}" for aspect in aspects[:count]]},
+            ensure_ascii=False,
+        )
+    if step == "verification":
+        return json.dumps(
+            {"passed": True, "score": 0.82, "issues": [], "summary": "证据基本支持结论"},
+            ensure_ascii=False,
+        )
+    urls = re.findall(r"https?://[^\s)\]]+", user_prompt)[:3]
+    if step == "section_drafting":
+        return f"#### 要点\n\n- 关于「{topic}」的主要发现 [S1]。\n- 不同来源的观点对比 [S2]。"
+    if step == "report_merge":
+        return (
+            "## 执行摘要\n\n本报告由本地替身服务合并生成 [1]。\n\n"
+            "## 关键发现与对比\n\n各维度结论基本一致。\n\n"
+            "## 争议与不确定性\n\n[信息不足]\n\n"
+            "## 结论与建议\n\n结论内容。"
+        )
+    if step == "quick_answer":
+        return f"初步来看，「{topic}」的要点见搜索摘要 [1]，更完整的结论尚待深入研究。"
+    if step == "context_verification":
+        return json.dumps(
+            {
+                "context": canned_response("context_compression", user_prompt),
+                "verification": json.loads(canned_response("verification", user_prompt)),
+            },
+            ensure_ascii=False,
+        )
+    if step == "report_writing":
+        refs = "\n".join(f"- [{index}] {url}" for index, url in enumerate(urls, 1))
+        return (
+            f"# {topic}\n\n"
+            "## 执行摘要\n\n本报告由本地替身服务生成，用于压测与延迟测试。\n\n"
+            "## 背景与现状\n\n相关背景信息 [1]。\n\n"
+            "## 多维度分析\n\n### 维度一\n\n分析内容 [1]。\n\n"
+            "## 结论与建议\n\n结论内容。\n\n"
+            f"## 参考来源\n\n{refs or '- [信息不足]'}\n"
+        )
+    bullets = "\n".join(f"- 与「{topic}」相关的要点（来源：{url}）" for url in urls)
+    return bullets or f"- 与「{topic}」相关的要点"
+
+
+def _first_line_after(text: str, marker: str) -> str:
+    _, found, rest = text.partition(marker)
+    if not found:
+        return ""
+    for line in rest.splitlines():
+        if line.strip():
+            return line.strip()[:80]
+    return ""
+
+
+class StandInLLM:
+    """Holds config, RNG and concurrency counters for one stand-in server."""
+
+    def __init__(self, config: StandInConfig | None = None) -> None:
+        self.config = config or StandInConfig.from_env()
+        self._random = random.Random(self.config.seed)
+        self.active = 0
+        self.requests = 0
+
+    def sample_latency(self) -> float:
+        if self.config.latency_median_seconds <= 0:
+            return 0.0
+        latency = self._random.lognormvariate(
+            math.log(self.config.latency_median_seconds), self.config.latency_sigma
+        )
+        return min(latency, self.config.latency_max_seconds)
+
+    def sample_failure(self) -> int | None:
+        """返回要模拟的错误状态码，不出错时返回 None。"""
+        if self.config.max_concurrency and self.active > self.config.max_concurrency:
+            return 429
+        roll = self._random.random()
+        if roll < self.config.rate_limit_rate:
+            return 429
+        if roll < self.config.rate_limit_rate + self.config.error_rate:
+            return 500
+        return None
+
+    def token_delay(self, text: str) -> float:
+        if self.config.tokens_per_second <= 0:
+            return 0.0
+        return estimate_tokens(text) / self.config.tokens_per_second
+
+
+def _apply_stop(text: str, stop: object) -> str:
+    """与真实 API 一致：在第一个 stop 序列处截断，且不包含 stop 本身。"""
+    sequences = [stop] if isinstance(stop, str) else stop
+    if not isinstance(sequences, list):
+        return text
+    cut = len(text)
+    for sequence in sequences:
+        if isinstance(sequence, str) and sequence:
+            index = text.find(sequence)
+            if index >= 0:
+                cut = min(cut, index)
+    return text[:cut]
+
+
+def _message_text(messages: object, role: str) -> str:
+    if not isinstance(messages, list):
+        return ""
+    return "\n".join(
+        str(message.get("content") or "")
+        for message in messages
+        if isinstance(message, dict) and message.get("role") == role
+    )
+
+
+def create_stand_in_app(config: StandInConfig | None = None) -> FastAPI:
+    llm = StandInLLM(config)
+    app = FastAPI(title="DeepSeek stand-in", version="1.0.0")
+    app.state.stand_in = llm
+
+    @app.get("/health")
+    async def health() -> dict[str, object]:
+        return {"status": "healthy", "active": llm.active, "requests": llm.requests}
+
+    @app.post("/chat/completions")
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        payload = await request.json()
+        llm.requests += 1
+        llm.active += 1
+        streaming = False
+        try:
+            status = llm.sample_failure()
+            if status == 429:
+                return JSONResponse(
+                    {"error": {"message": "rate limited (stand-in)", "type": "rate_limit"}},
+                    status_code=429,
+                    headers={"Retry-After": f"{llm.config.retry_after_seconds:g}"},
+                )
+            await asyncio.sleep(llm.sample_latency())
+            if status == 500:
+                return JSONResponse(
+                    {"error": {"message": "internal error (stand-in)"}}, status_code=500
+                )
+
+            system_prompt = _message_text(payload.get("messages"), "system")
+            user_prompt = _message_text(payload.get("messages"), "user")
+            text = canned_response(detect_step(system_prompt, user_prompt), user_prompt)
+            text = _apply_stop(text, payload.get("stop"))
+            prompt_tokens = estimate_tokens(system_prompt + user_prompt)
+            completion_tokens = estimate_tokens(text)
+            usage = {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "prompt_cache_hit_tokens": 0,
+                "prompt_cache_miss_tokens": prompt_tokens,
+            }
+            completion_id = f"chatcmpl-{uuid.uuid4().hex[:16]}"
+            model = payload.get("model", "deepseek-chat")
+
+            if not payload.get("stream"):
+                await asyncio.sleep(llm.token_delay(text))
+                return {
+                    "id": completion_id,
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": text},
+                        "finish_reason": "stop",
+                    }],
+                    "usage": usage,
+                }
+            streaming = True
+        finally:
+            # 流式响应的并发计数在生成器结束时释放
+            if not streaming:
+                llm.active -= 1
+
+        include_usage = bool((payload.get("stream_options") or {}).get("include_usage"))
+
+        async def events() -> AsyncIterator[str]:
+            try:
+                size = llm.config.stream_chunk_chars
+                for start in range(0, len(text), size):
+                    piece = text[start:start + size]
+                    await asyncio.sleep(llm.token_delay(piece))
+                    chunk = {
+                        "id": completion_id,
+                        "object": "chat.completion.chunk",
+                        "model": model,
+                        "choices": [{"index": 0, "delta": {"content": piece}}],
+                    }
+                    yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+                if include_usage:
+                    final = {"id": completion_id, "choices": [], "usage": usage}
+                    yield f"data: {json.dumps(final)}\n\n"
+                yield "data: [DONE]\n\n"
+            finally:
+                llm.active -= 1
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    logging.basicConfig(level=logging.INFO)
+    port = int(os.getenv("LLM_STAND_IN_PORT", 8100))
+    uvicorn.run(create_stand_in_app(), host="127.0.0.1", port=port)
@@ -7,12 +7,17 @@ from fastapi.middleware.cors import CORSMiddleware
 
 from .api.auth import router as auth_router
 from .api.research import router as research_router
+from .core.health import runtime_health
 from .db.base import init_db
+from .services.deepseek_service import deepseek_service
+from .services.search_tools import search_tools
 
 @asynccontextmanager
 async def lifespan(_app: FastAPI) -> AsyncIterator[None]:
     await init_db()
     yield
+    await deepseek_service.aclose()
+    await search_tools.aclose()
 
 
 app = FastAPI(title="Deep Research Agent", version="1.0.0", lifespan=lifespan)
@@ -58,7 +63,11 @@ async def root():
 
 @app.get("/api/health")
 async def health_check():
-    return {"status": "healthy", "message": "Deep Research Agent API is running"}
+    return {
+        "status": "healthy",
+        "message": "Deep Research Agent API is running",
+        **runtime_health(),
+    }
 
 
 if __name__ == "__main__":
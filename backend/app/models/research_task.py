@@ -69,6 +69,9 @@ class ResearchTask(BaseModel):
     sections: list[ResearchSection] = Field(default_factory=list)
     final_report: str = ""
     cost_summary: dict[str, object] = Field(default_factory=dict)
+    deadline_seconds: float | None = None
+    # 截止时间前未能完成全部子查询时为 True，报告基于已完成部分生成
+    partial: bool = False
     created_at: str = Field(default_factory=utc_now)
     updated_at: str = Field(default_factory=utc_now)
     completed_at: str | None = None
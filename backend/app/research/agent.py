@@ -12,9 +12,12 @@ from ..services.evidence_store import EvidenceStore
 from ..services.research_repository import ResearchRepository
 from .conductor import ResearchConductor
 from .cost_tracker import CostTracker
+from .deadline import Deadline
+from .deadline import report_reserve_seconds
 from .models import ResearchSource
 from .models import SubQueryContext
 from .writer import ResearchWriter
+from .writer import map_reduce_report_enabled
 
 
 class ResearchAgent:
@@ -27,6 +30,11 @@ class ResearchAgent:
         repository: ResearchRepository | None = None,
         max_sub_queries: int = 5,
         max_concurrency: int = 3,
+        deadline_seconds: float | None = None,
+        fused_verification: bool | None = None,
+        speculative_planning: bool | None = None,
+        quick_answer: bool | None = None,
+        map_reduce_report: bool | None = None,
     ) -> None:
         self.query = query
         self.role = "专业、客观、重视来源证据的研究分析师"
@@ -38,10 +46,24 @@ class ResearchAgent:
         self.visited_urls: set[str] = set()
         self.repository = repository
         self.task_id: str | None = None
+        self.deadline_seconds = deadline_seconds
+        # run() 开始时才起算；research_deadline 为子查询研究的截止时间，之后留给报告生成
+        self.deadline = Deadline.after(None)
+        self.research_deadline = self.deadline
         self.evidence_store = EvidenceStore()
         self.cost_tracker = CostTracker()
         self.conductor = ResearchConductor(self)
+        if fused_verification is not None:
+            self.conductor.fused_verification = fused_verification
+        if speculative_planning is not None:
+            self.conductor.speculative_planning = speculative_planning
+        if quick_answer is not None:
+            self.conductor.quick_answer = quick_answer
         self.writer = ResearchWriter(self.cost_tracker)
+        # True 时每个子查询完成即起草章节，与其余研究重叠；最后只做一次轻量合并
+        self.map_reduce_report = (
+            map_reduce_report_enabled() if map_reduce_report is None else map_reduce_report
+        )
 
     async def run(self, task: ResearchTask) -> AsyncGenerator[dict[str, object], None]:
         event_queue: asyncio.Queue[dict[str, object]] = asyncio.Queue()
@@ -50,18 +72,30 @@ class ResearchAgent:
             await event_queue.put(event)
 
         self.task_id = task.id
+        self._start_deadline()
         task.status = ResearchTaskStatus.PLANNING
         conduct_task = asyncio.create_task(
             self.conductor.conduct_research(on_event=collect_event)
         )
+        report_task: asyncio.Task[str] | None = None
+        draft_tasks: dict[int, asyncio.Task[str]] = {}
+
+        async def draft_section(section: ResearchSection) -> str:
+            draft = await self.writer.draft_section(
+                query=task.query, section=section, deadline=self.deadline
+            )
+            if draft:
+                await event_queue.put(
+                    {
+                        "type": "section_draft",
+                        "message": f"已完成章节草稿：{section.title}",
+                        "data": {"step": section.step, "title": section.title, "draft": draft},
+                    }
+                )
+            return draft
+
         try:
-            while True:
-                try:
-                    event = await asyncio.wait_for(event_queue.get(), timeout=0.1)
-                except TimeoutError:
-                    if conduct_task.done():
-                        break
-                    continue
+            async for event in self._drain_events(conduct_task, event_queue):
                 if event["type"] == "plan":
                     event_data = event.get("data", {})
                     sub_queries = (
@@ -90,13 +124,25 @@ class ResearchAgent:
                 elif event["type"] == "step_complete":
                     event_data = event.get("data")
                     if isinstance(event_data, dict):
-                        self._apply_step_complete(task, event_data)
+                        section = self._apply_step_complete(task, event_data)
+                        if (
+                            self.map_reduce_report
+                            and section is not None
+                            and section.status != "skipped"
+                        ):
+                            draft_tasks[section.step] = asyncio.create_task(
+                                draft_section(section.model_copy(deep=True))
+                            )
                     yield event
                 else:
                     yield event
 
             contexts = await conduct_task
             task.sections = self._contexts_to_sections(contexts)
+            incomplete_queries = [
+                context.query for context in contexts if context.status != "completed"
+            ]
+            task.partial = bool(incomplete_queries)
             task.touch()
 
             task.status = ResearchTaskStatus.REPORTING
@@ -107,12 +153,52 @@ class ResearchAgent:
                 "data": None,
             }
 
-            report = await self.writer.write_report(
-                query=task.query,
-                sections=task.sections,
-                context=contexts,
-                sources=self.research_sources,
+            section_drafts: dict[int, str] = {}
+            if draft_tasks:
+                # 大部分草稿在研究期间已经完成，这里只等最后几个
+                waiter = asyncio.create_task(
+                    asyncio.wait(draft_tasks.values(), timeout=self.deadline.timeout())
+                )
+                async for event in self._drain_events(waiter, event_queue):
+                    yield event
+                section_drafts = {
+                    step: draft_task.result()
+                    for step, draft_task in draft_tasks.items()
+                    if draft_task.done()
+                    and not draft_task.cancelled()
+                    and draft_task.exception() is None
+                    and draft_task.result()
+                }
+
+            async def collect_delta(delta: str) -> None:
+                await event_queue.put(
+                    {
+                        "type": "report_delta",
+                        "message": "",
+                        "data": {"delta": delta},
+                    }
+                )
+
+            report_task = asyncio.create_task(
+                self.writer.write_report(
+                    query=task.query,
+                    sections=[
+                        section for section in task.sections
+                        if section.status != "skipped"
+                    ],
+                    context=[
+                        context for context in contexts if context.status != "skipped"
+                    ],
+                    sources=self.research_sources,
+                    on_delta=collect_delta,
+                    deadline=self.deadline,
+                    incomplete_queries=incomplete_queries,
+                    section_drafts=section_drafts,
+                )
             )
+            async for event in self._drain_events(report_task, event_queue):
+                yield event
+            report = await report_task
             task.final_report = report
             task.cost_summary = self.cost_tracker.summary()
             task.status = ResearchTaskStatus.COMPLETED
@@ -134,6 +220,8 @@ class ResearchAgent:
                     "query": task.query,
                     "status": task.status.value,
                     "architecture": "gpt_researcher",
+                    "partial": task.partial,
+                    "deadline_seconds": task.deadline_seconds,
                     "cost_summary": task.cost_summary,
                     "plan": [
                         {
@@ -153,13 +241,39 @@ class ResearchAgent:
                 },
             }
         finally:
-            if not conduct_task.done():
-                conduct_task.cancel()
+            for pending in (conduct_task, report_task, *draft_tasks.values()):
+                if pending is None or pending.done():
+                    continue
+                pending.cancel()
                 try:
-                    await conduct_task
+                    await pending
                 except asyncio.CancelledError:
                     pass
 
+    def _start_deadline(self) -> None:
+        self.deadline = Deadline.after(self.deadline_seconds)
+        if self.deadline_seconds is None or self.deadline_seconds <= 0:
+            self.research_deadline = self.deadline
+            return
+        # 预留时间最多占总时长一半，避免短截止时间下所有子查询都被跳过
+        reserve = min(report_reserve_seconds(), self.deadline_seconds / 2)
+        self.research_deadline = self.deadline.shifted(-reserve)
+
+    async def _drain_events(
+        self,
+        producer: asyncio.Task,
+        event_queue: asyncio.Queue[dict[str, object]],
+    ) -> AsyncGenerator[dict[str, object], None]:
+        """Yield queued events until the producer finishes and the queue is empty."""
+        while True:
+            try:
+                event = await asyncio.wait_for(event_queue.get(), timeout=0.1)
+            except TimeoutError:
+                if producer.done():
+                    break
+                continue
+            yield event
+
     def _contexts_to_sections(
         self, contexts: list[SubQueryContext]
     ) -> list[ResearchSection]:
@@ -174,7 +288,7 @@ class ResearchAgent:
                     tool="research_conductor",
                     search_queries=[context.query],
                     expected_outcome="收集并压缩与该子查询相关的上下文",
-                    status="completed",
+                    status=context.status,
                     analysis=context.context,
                     citations=context.citations,
                     search_sources=[
@@ -208,14 +322,16 @@ class ResearchAgent:
             for index, sub_query in enumerate(sub_queries, start=1)
         ]
 
-    def _apply_step_complete(self, task: ResearchTask, event_data: dict[str, object]) -> None:
+    def _apply_step_complete(
+        self, task: ResearchTask, event_data: dict[str, object]
+    ) -> ResearchSection | None:
         step = event_data.get("step")
         if not isinstance(step, int):
-            return
+            return None
 
         section = next((item for item in task.sections if item.step == step), None)
         if section is None:
-            return
+            return None
 
         section.status = str(event_data.get("status", "completed"))
         section.analysis = str(event_data.get("analysis", section.analysis))
@@ -242,3 +358,4 @@ class ResearchAgent:
             ]
         section.completed_at = utc_now()
         task.touch()
+        return section
@@ -1,32 +1,79 @@
 from __future__ import annotations
 
 import asyncio
+import itertools
+import logging
+import os
 from urllib.parse import urlparse
 from collections.abc import Awaitable
 from collections.abc import Callable
+from dataclasses import dataclass
 
 from ..services.compression_service import compression_service
 from ..services.verifier_service import verifier_service
+from ..utils.env import env_float
+from ..utils.env import env_int
 from .context_manager import ResearchContextManager
+from .context_manager import fused_verification_enabled
 from .models import SubQueryContext
 from .query_planner import QueryPlanner
+from .query_planner import ungrounded_sub_queries
 from .retriever import ResearchRetriever
 from .scraper import ResearchScraper
 from .source_curator import SourceCurator
 
+logger = logging.getLogger(__name__)
+
 ResearchEventCallback = Callable[[dict[str, object]], Awaitable[None]]
 
 
+@dataclass(frozen=True)
+class StageLimits:
+    """Independent concurrency limits for the search, page-fetch and LLM stages."""
+
+    search: int = 4
+    fetch: int = 4
+    llm: int = 3
+
+    @classmethod
+    def from_env(cls, llm_default: int = 3) -> "StageLimits":
+        return cls(
+            search=max(1, env_int("RESEARCH_SEARCH_CONCURRENCY", 4)),
+            fetch=max(1, env_int("RESEARCH_FETCH_CONCURRENCY", 4)),
+            llm=max(1, env_int("RESEARCH_LLM_CONCURRENCY", llm_default)),
+        )
+
+
 class ResearchConductor:
     """Coordinates initial search, sub-query planning, scraping, and context gathering."""
 
     def __init__(self, researcher) -> None:  # noqa: ANN001
         self.researcher = researcher
         self.query_planner = QueryPlanner(researcher.cost_tracker)
-        self.retriever = ResearchRetriever()
+        self.retriever = ResearchRetriever(researcher.cost_tracker)
         self.scraper = ResearchScraper()
         self.context_manager = ResearchContextManager(researcher.cost_tracker)
         self.source_curator = SourceCurator()
+        # True 时每个子查询的压缩与核查合并为一次 LLM 调用；False 保留原来的两次调用
+        self.fused_verification = fused_verification_enabled()
+        # True 时规划与初始搜索并行，省下一次规划调用的等待。代价是规划时看不到搜索结果：
+        # 初始搜索返回后检查子查询能否在结果标题/摘要中找到依据，有依据的比例低于
+        # speculative_min_grounded 时取消无依据的子查询并基于搜索结果重新规划（已花费的
+        # 搜索与 LLM 调用不退回）；投机规划没有产出时同样回退
+        self.speculative_planning = os.getenv(
+            "RESEARCH_SPECULATIVE_PLANNING", ""
+        ).lower() in {"1", "true", "yes"}
+        self.speculative_min_grounded = env_float("RESEARCH_SPECULATIVE_MIN_GROUNDED", 0.5)
+        # True 时用初始搜索摘要先流式生成一个初步回答，深度研究并行继续
+        self.quick_answer = os.getenv(
+            "RESEARCH_QUICK_ANSWER", ""
+        ).lower() in {"1", "true", "yes"}
+        # 分阶段限流：每个阶段只在自己的工作期间占用名额，等 LLM 的子查询不会挡住
+        # 其他子查询的搜索和抓取；max_concurrency 作为 LLM 阶段的默认上限
+        self.stage_limits = StageLimits.from_env(researcher.max_concurrency)
+        self.search_slots = asyncio.Semaphore(self.stage_limits.search)
+        self.fetch_slots = asyncio.Semaphore(self.stage_limits.fetch)
+        self.llm_slots = asyncio.Semaphore(self.stage_limits.llm)
 
     async def conduct_research(
         self, on_event: ResearchEventCallback | None = None
@@ -37,39 +84,29 @@ class ResearchConductor:
             "正在进行初始搜索并规划子查询...",
             {"query": self.researcher.query},
         )
-        initial_results = await self.retriever.search(self.researcher.query)
-        await self._emit_search_result(
-            on_event,
-            step=0,
-            query=self.researcher.query,
-            sources=initial_results,
-            message="已完成初始搜索，正在归纳研究线索...",
-        )
-        sub_queries = await self.query_planner.plan(
-            query=self.researcher.query,
-            initial_results=initial_results,
-            max_sub_queries=self.researcher.max_sub_queries,
-        )
-        if self.researcher.query not in sub_queries:
-            sub_queries.append(self.researcher.query)
+        deadline = self.researcher.research_deadline
+        # 子查询边规划边启动：规划流每产出一个子查询就开始检索，规划延迟与检索重叠。
+        # plan 事件要等规划结束才能发出，在此之前子查询产生的事件先缓存，之后按顺序补发。
+        sub_queries: list[str] = []
         self.researcher.sub_queries = sub_queries
+        pending_events: list[dict[str, object]] | None = []
 
-        await self._emit(
-            on_event,
-            "plan",
-            "子查询规划完成",
-            {
-                "sub_queries": sub_queries,
-                "cost_summary": self.researcher.cost_tracker.summary(),
-            },
-        )
+        async def emit_sub_query_event(event: dict[str, object]) -> None:
+            if pending_events is not None:
+                pending_events.append(event)
+            elif on_event is not None:
+                await on_event(event)
 
-        semaphore = asyncio.Semaphore(self.researcher.max_concurrency)
+        sub_query_emit = emit_sub_query_event if on_event is not None else None
 
         async def run_sub_query(index: int, sub_query: str) -> SubQueryContext:
-            async with semaphore:
+            if deadline.expired:
+                # 接近截止时间：尚未开始的子查询直接跳过，把时间留给报告生成
+                return SubQueryContext(step=index, query=sub_query, status="skipped")
+            async def announce_start() -> None:
+                # 拿到搜索阶段名额、真正开始工作时才发 step_start，排队中的子查询不算开始
                 await self._emit(
-                    on_event,
+                    sub_query_emit,
                     "step_start",
                     f"开始处理子查询 {index}",
                     {
@@ -83,7 +120,7 @@ class ResearchConductor:
                     },
                 )
                 await self._emit(
-                    on_event,
+                    sub_query_emit,
                     "search_progress",
                     f"正在研究：{sub_query}",
                     {
@@ -94,24 +131,167 @@ class ResearchConductor:
                         "cost_summary": self.researcher.cost_tracker.summary(),
                     },
                 )
-                return await self._process_sub_query(index, sub_query, on_event)
 
-        tasks = [
-            asyncio.create_task(run_sub_query(index, sub_query))
-            for index, sub_query in enumerate(sub_queries, start=1)
-        ]
+            context = await self._process_sub_query(
+                index, sub_query, sub_query_emit, on_started=announce_start
+            )
+            if deadline.expired and context.status == "completed":
+                context.status = "partial"
+            return context
+
+        tasks: list[asyncio.Task[SubQueryContext]] = []
+        # 步骤号只增不减：被取消的投机子查询留下的编号不再复用
+        step_numbers = itertools.count(1)
+        launched_steps: dict[str, int] = {}
+
+        def launch(sub_query: str) -> None:
+            step = next(step_numbers)
+            launched_steps[sub_query] = step
+            sub_queries.append(sub_query)
+            tasks.append(asyncio.create_task(run_sub_query(step, sub_query)))
+
+        async def launch_planned(initial_results: list, *, fallback: bool = True) -> None:
+            async for sub_query in self.query_planner.plan_stream(
+                query=self.researcher.query,
+                initial_results=initial_results,
+                max_sub_queries=self.researcher.max_sub_queries,
+                deadline=deadline,
+                fallback=fallback,
+            ):
+                # 重新规划时保留的投机子查询也占名额
+                if (
+                    sub_query not in sub_queries
+                    and len(sub_queries) < self.researcher.max_sub_queries
+                ):
+                    launch(sub_query)
+
+        async def drop(stale: list[str]) -> None:
+            """取消偏离主题的投机子查询；plan 事件发出前它们的事件都还在缓存里，一并丢弃。"""
+            dropped_steps = {launched_steps[sub_query] for sub_query in stale}
+            cancelled = []
+            for sub_query in stale:
+                position = sub_queries.index(sub_query)
+                del sub_queries[position]
+                task = tasks.pop(position)
+                task.cancel()
+                cancelled.append(task)
+            await asyncio.gather(*cancelled, return_exceptions=True)
+            if pending_events is not None:
+                pending_events[:] = [
+                    event
+                    for event in pending_events
+                    if not (
+                        isinstance(event.get("data"), dict)
+                        and event["data"].get("step") in dropped_steps
+                    )
+                ]
+
+        speculative_task: asyncio.Task[None] | None = None
+        quick_answer_task: asyncio.Task[None] | None = None
+        try:
+            if self.speculative_planning:
+                # 投机规划：仅凭原始问题规划，与初始搜索同时进行，子查询产出即启动
+                speculative_task = asyncio.create_task(launch_planned([], fallback=False))
+            initial_results = await self.retriever.search(
+                self.researcher.query,
+                deadline=deadline,
+            )
+            await self._emit_search_result(
+                on_event,
+                step=0,
+                query=self.researcher.query,
+                sources=initial_results,
+                message="已完成初始搜索，正在归纳研究线索...",
+            )
+            if self.quick_answer and initial_results:
+                quick_answer_task = asyncio.create_task(
+                    self._quick_answer(initial_results, on_event)
+                )
+            off_target: list[str] = []
+            if speculative_task is not None:
+                await speculative_task
+                off_target = ungrounded_sub_queries(
+                    self.researcher.query, sub_queries, initial_results
+                )
+                grounded = len(sub_queries) - len(off_target)
+                if sub_queries and grounded / len(sub_queries) < self.speculative_min_grounded:
+                    logger.info(
+                        "投机规划的 %d 个子查询中只有 %d 个能在初始搜索结果中找到依据，"
+                        "取消其余子查询并基于搜索结果重新规划",
+                        len(sub_queries),
+                        grounded,
+                    )
+                    await drop(off_target)
+                else:
+                    off_target = []
+            speculative = bool(sub_queries) and not off_target
+            if not speculative:
+                if speculative_task is not None and not off_target:
+                    logger.info("投机规划未产出可用子查询，改为基于初始搜索结果重新规划")
+                await launch_planned(initial_results)
+            if self.researcher.query not in sub_queries:
+                launch(self.researcher.query)
+
+            await self._emit(
+                on_event,
+                "plan",
+                "子查询规划完成",
+                {
+                    "sub_queries": list(sub_queries),
+                    "speculative": speculative,
+                    "speculative_dropped": off_target,
+                    "cost_summary": self.researcher.cost_tracker.summary(),
+                },
+            )
+            while pending_events:
+                event = pending_events.pop(0)
+                data = event.get("data")
+                if isinstance(data, dict) and "total" in data:
+                    # 缓存期间子查询总数还在增长，补发时改为最终总数
+                    data["total"] = len(sub_queries)
+                await on_event(event)  # type: ignore[misc]
+            pending_events = None
+        except BaseException:
+            for pending in (speculative_task, quick_answer_task, *tasks):
+                if pending is not None:
+                    pending.cancel()
+            raise
+
         contexts: list[SubQueryContext] = []
+        try:
+            await self._collect_contexts(tasks, contexts, on_event)
+        finally:
+            if quick_answer_task is not None and not quick_answer_task.done():
+                # 深度研究已经结束，完整报告即将取代初步回答
+                quick_answer_task.cancel()
+
+        contexts = sorted(contexts, key=lambda item: item.step)
+        self.researcher.context = contexts
+        all_sources = [source for item in contexts for source in item.sources]
+        self.researcher.research_sources = self.source_curator.curate(all_sources)
+        return contexts
+
+    async def _collect_contexts(
+        self,
+        tasks: list[asyncio.Task[SubQueryContext]],
+        contexts: list[SubQueryContext],
+        on_event: ResearchEventCallback | None,
+    ) -> None:
         for task in asyncio.as_completed(tasks):
             context = await task
             contexts.append(context)
             await self._emit(
                 on_event,
                 "step_complete",
-                f"完成子查询：{context.query}",
+                (
+                    f"已跳过子查询（接近截止时间）：{context.query}"
+                    if context.status == "skipped"
+                    else f"完成子查询：{context.query}"
+                ),
                 {
                     "step": context.step,
                     "title": context.query,
-                    "status": "completed",
+                    "status": context.status,
                     "analysis": context.context,
                     "cost_summary": self.researcher.cost_tracker.summary(),
                     "citations": [citation.model_dump() for citation in context.citations],
@@ -130,29 +310,64 @@ class ResearchConductor:
                 },
             )
 
-        contexts = sorted(contexts, key=lambda item: item.step)
-        self.researcher.context = contexts
-        all_sources = [source for item in contexts for source in item.sources]
-        self.researcher.research_sources = self.source_curator.curate(all_sources)
-        return contexts
+    async def _quick_answer(
+        self,
+        initial_results: list,
+        on_event: ResearchEventCallback | None,
+    ) -> None:
+        """基于初始搜索摘要的初步回答，先以 quick_answer_delta 流式推送，再发完整的 quick_answer。"""
+
+        async def emit_delta(delta: str) -> None:
+            await self._emit(on_event, "quick_answer_delta", "", {"delta": delta})
+
+        answer = await self.researcher.writer.write_quick_answer(
+            query=self.researcher.query,
+            sources=initial_results,
+            on_delta=emit_delta if on_event is not None else None,
+            deadline=self.researcher.research_deadline,
+        )
+        if not answer:
+            return
+        await self._emit(
+            on_event,
+            "quick_answer",
+            "已根据初始搜索生成初步回答，深度研究仍在进行...",
+            {
+                "answer": answer,
+                "preliminary": True,
+                "sources": self._serialize_sources(initial_results),
+                "cost_summary": self.researcher.cost_tracker.summary(),
+            },
+        )
 
     async def _process_sub_query(
         self,
         step: int,
         sub_query: str,
         on_event: ResearchEventCallback | None = None,
+        *,
+        on_started: Callable[[], Awaitable[None]] | None = None,
     ) -> SubQueryContext:
-        search_results = await self.retriever.search(sub_query)
+        deadline = self.researcher.research_deadline
+        async with self.search_slots:
+            if deadline.expired:
+                # 排队等搜索名额期间到期：不再开始
+                return SubQueryContext(step=step, query=sub_query, status="skipped")
+            if on_started is not None:
+                await on_started()
+            search_results = await self.retriever.search(sub_query, deadline=deadline)
         await self._emit_search_result(
             on_event,
             step=step,
             query=sub_query,
             sources=search_results,
         )
-        scraped_sources = await self.scraper.scrape(
-            search_results,
-            self.researcher.visited_urls,
-        )
+        async with self.fetch_slots:
+            scraped_sources = await self.scraper.scrape(
+                search_results,
+                self.researcher.visited_urls,
+                deadline=deadline,
+            )
         await self._emit(
             on_event,
             "analysis_progress",
@@ -171,12 +386,31 @@ class ResearchConductor:
         evidence = self.researcher.evidence_store.get_many(evidence_ids)
         citations = self.researcher.evidence_store.get_citations(evidence_ids)
         compressed_evidence = compression_service.compress_evidence(sub_query, evidence)
-        context = await self.context_manager.get_context(sub_query, scraped_sources)
-        verification = await verifier_service.verify_section(
-            analysis=context,
-            citations=citations,
-            compressed_evidence=compressed_evidence,
-        )
+        async with self.llm_slots:
+            fused = None
+            if self.fused_verification:
+                fused = await self.context_manager.get_verified_context(
+                    sub_query,
+                    scraped_sources,
+                    citations=citations,
+                    compressed_evidence=compressed_evidence,
+                    deadline=deadline,
+                )
+            if fused is not None:
+                context, verification = fused
+            else:
+                context = await self.context_manager.get_context(
+                    sub_query,
+                    scraped_sources,
+                    deadline=deadline,
+                )
+                verification = await verifier_service.verify_section(
+                    analysis=context,
+                    citations=citations,
+                    compressed_evidence=compressed_evidence,
+                    cost_tracker=self.researcher.cost_tracker,
+                    deadline=deadline,
+                )
         return SubQueryContext(
             step=step,
             query=sub_query,
@@ -1,55 +1,113 @@
 from __future__ import annotations
 
+import asyncio
 import logging
+import os
 
 from ..llms.deepseek_llm import DeepSeekLLM
+from ..models.research_task import Citation
+from ..services.verifier_service import verifier_service
+from ..utils.json_parser import JSON_STOP_SEQUENCES
 from .cost_tracker import CostTracker
+from .deadline import Deadline
 from .models import ResearchSource
 
 logger = logging.getLogger(__name__)
 
+CONTEXT_SYSTEM_PROMPT = """\
+请从用户提供的网页内容中提取与研究查询最相关的上下文。
 
-class ResearchContextManager:
-    """Compresses scraped source content into query-relevant context."""
-
-    def __init__(self, cost_tracker: CostTracker | None = None) -> None:
-        self.llm = DeepSeekLLM()
-        self.cost_tracker = cost_tracker
-
-    async def get_context(self, query: str, sources: list[ResearchSource]) -> str:
-        if not sources:
-            return ""
-
-        source_text = "\n\n".join(
-            f"Title: {source.title}\n"
-            f"URL: {source.link}\n"
-            f"Snippet: {source.snippet}\n"
-            f"Content: {(source.extracted_content or source.snippet)[:1800]}"
-            for source in sources
-        )
-        prompt = f"""
-请从下面网页内容中提取与研究查询最相关的上下文。
+要求：
+- 只保留能支持研究报告的事实、数据、观点和限制
+- 每条重要信息尽量保留来源 URL
+- 删除重复和无关内容
+- 中文输出，结构化列点\
+"""
 
+CONTEXT_PROMPT_TEMPLATE = """\
 研究查询：
 {query}
 
 网页内容：
-{source_text[:9000]}
+{source_text}\
+"""
 
-要求：
+# 融合模式：一次调用同时完成上下文压缩和证据核查，省掉每个子查询的第二次串行往返
+CONTEXT_VERIFICATION_SYSTEM_PROMPT = """请从用户提供的网页内容中提取与研究查询最相关的上下文，并审校你提取的上下文是否被证据充分支持。
+
+上下文要求：
 - 只保留能支持研究报告的事实、数据、观点和限制
 - 每条重要信息尽量保留来源 URL
 - 删除重复和无关内容
 - 中文输出，结构化列点
+
+审校要求：
+- 对照用户给出的证据压缩和引用，判断上下文中的结论是否有来源支撑
+- issues 列出缺少支撑、相互矛盾或过度推断的内容
+
+请只返回 JSON：
+{
+  "context": "结构化列点的上下文",
+  "verification": {
+    "passed": true,
+    "score": 0.0,
+    "issues": ["问题1"],
+    "summary": "一句话结论"
+  }
+}\
+"""
+
+CONTEXT_VERIFICATION_PROMPT_TEMPLATE = """\
+研究查询：
+{query}
+
+网页内容：
+{source_text}
+
+证据压缩：
+{compressed_evidence}
+
+引用：
+{citation_text}\
 """
+
+
+def fused_verification_enabled() -> bool:
+    """RESEARCH_FUSED_VERIFICATION=true 时压缩与核查合并为一次 LLM 调用。"""
+    return os.getenv("RESEARCH_FUSED_VERIFICATION", "").lower() in {"1", "true", "yes"}
+
+
+class ResearchContextManager:
+    """Compresses scraped source content into query-relevant context."""
+
+    def __init__(self, cost_tracker: CostTracker | None = None) -> None:
+        self.llm = DeepSeekLLM(profile="context_compression")
+        self.fused_llm = DeepSeekLLM(profile="context_verification")
+        self.cost_tracker = cost_tracker
+
+    async def get_context(
+        self,
+        query: str,
+        sources: list[ResearchSource],
+        deadline: Deadline | None = None,
+    ) -> str:
+        if not sources:
+            return ""
+
+        prompt = CONTEXT_PROMPT_TEMPLATE.format(
+            query=query,
+            source_text=self._format_sources(sources),
+        )
         try:
-            response = await self.llm._acall(prompt)
-            if self.cost_tracker is not None:
-                self.cost_tracker.track_llm_call(
+            response = await asyncio.wait_for(
+                self.llm._acall(
+                    prompt,
+                    system_prompt=CONTEXT_SYSTEM_PROMPT,
                     step="context_compression",
-                    prompt=prompt,
-                    response=response,
-                )
+                    cost_tracker=self.cost_tracker,
+                ),
+                deadline.timeout() if deadline is not None else None,
+            )
             return response
         except Exception as exc:  # noqa: BLE001
             logger.warning("context compression failed: %s", exc)
@@ -57,3 +115,67 @@ class ResearchContextManager:
                 f"{source.title}: {source.snippet} ({source.link})"
                 for source in sources
             )
+
+    async def get_verified_context(
+        self,
+        query: str,
+        sources: list[ResearchSource],
+        *,
+        citations: list[Citation],
+        compressed_evidence: str,
+        deadline: Deadline | None = None,
+    ) -> tuple[str, dict[str, object]] | None:
+        """一次调用返回 (上下文, 核查结论)；失败或输出无法解析时返回 None，由调用方回退到两次调用。"""
+        if not sources:
+            return None
+
+        citation_text = "\n".join(
+            f"- {citation.title}: {citation.link}" for citation in citations[:5]
+        )
+        prompt = CONTEXT_VERIFICATION_PROMPT_TEMPLATE.format(
+            query=query,
+            source_text=self._format_sources(sources),
+            compressed_evidence=compressed_evidence or "无",
+            citation_text=citation_text or "无",
+        )
+        try:
+            response = await asyncio.wait_for(
+                self.fused_llm._acall(
+                    prompt,
+                    system_prompt=CONTEXT_VERIFICATION_SYSTEM_PROMPT,
+                    json_mode=True,
+                    stop=JSON_STOP_SEQUENCES,
+                    step="context_verification",
+                    cost_tracker=self.cost_tracker,
+                ),
+                deadline.timeout() if deadline is not None else None,
+            )
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("fused context verification failed: %s", exc)
+            return None
+
+        parsed = verifier_service._parse_json(response)
+        context = parsed.get("context") if parsed is not None else None
+        verification = parsed.get("verification") if parsed is not None else None
+        if not isinstance(context, str) or not context.strip():
+            logger.warning("fused context verification returned no usable context")
+            return None
+        if not isinstance(verification, dict):
+            verification = verifier_service._deterministic_verify(
+                analysis=context,
+                citations=citations,
+                compressed_evidence=compressed_evidence,
+            )
+        else:
+            verification = verifier_service.normalize_verdict(verification, "llm_fused")
+        return context, verification
+
+    def _format_sources(self, sources: list[ResearchSource]) -> str:
+        source_text = "\n\n".join(
+            f"Title: {source.title}\n"
+            f"URL: {source.link}\n"
+            f"Snippet: {source.snippet}\n"
+            f"Content: {(source.extracted_content or source.snippet)[:1800]}"
+            for source in sources
+        )
+        return source_text[:9000]
@@ -1,75 +1,276 @@
 from __future__ import annotations
 
-import os
+import re
 from dataclasses import dataclass
 from dataclasses import field
 
+from ..services.deepseek_service import DeepSeekAPIError
+from ..services.deepseek_service import DeepSeekCircuitOpenError
+from ..services.deepseek_service import DeepSeekCompletion
 from ..services.deepseek_service import DeepSeekConfig
-
-
-def estimate_tokens(text: str) -> int:
-    """Cheap token estimate for providers that do not return usage metadata."""
-    if not text:
-        return 0
-    return max(1, round(len(text) / 4))
+from ..utils.env import env_float
+from ..utils.tokens import estimate_tokens
 
 
 @dataclass
 class CostTracker:
-    """Tracks estimated LLM token usage and cost for one research task."""
+    """Tracks LLM token usage and cost for one research task.
+
+    Uses the provider-reported ``usage`` block when present and falls back to
+    a character-based estimate otherwise. Each call is recorded and priced
+    under the model that served it; ``model`` and the ``*_cost_per_1m_tokens``
+    rates are the defaults for calls that do not name one.
+    """
 
     model: str = field(default_factory=lambda: DeepSeekConfig.from_env().model)
-    input_cost_per_1m_tokens: float = field(default_factory=lambda: _env_float(
+    input_cost_per_1m_tokens: float = field(default_factory=lambda: env_float(
         "DEEPSEEK_INPUT_COST_PER_1M_TOKENS",
         0.28,
     ))
-    output_cost_per_1m_tokens: float = field(default_factory=lambda: _env_float(
+    output_cost_per_1m_tokens: float = field(default_factory=lambda: env_float(
         "DEEPSEEK_OUTPUT_COST_PER_1M_TOKENS",
         0.42,
     ))
+    # 命中服务端前缀缓存的输入 token 单价
+    input_cache_hit_cost_per_1m_tokens: float = field(default_factory=lambda: env_float(
+        "DEEPSEEK_INPUT_CACHE_HIT_COST_PER_1M_TOKENS",
+        0.028,
+    ))
+    # 模型 -> (输入, 输出, 缓存命中输入) 单价；未列出的模型读取
+    # DEEPSEEK_<MODEL>_*_COST_PER_1M_TOKENS（如 DEEPSEEK_REASONER_...），缺失时用上面的默认单价
+    model_rates: dict[str, tuple[float, float, float]] = field(default_factory=dict)
     calls: list[dict[str, object]] = field(default_factory=list)
+    # 搜索 API 调用（含缓存命中），不计入 LLM token 与费用
+    searches: list[dict[str, object]] = field(default_factory=list)
 
-    def track_llm_call(self, *, step: str, prompt: str, response: str) -> None:
-        input_tokens = estimate_tokens(prompt)
-        output_tokens = estimate_tokens(response)
-        input_cost = input_tokens * self.input_cost_per_1m_tokens / 1_000_000
-        output_cost = output_tokens * self.output_cost_per_1m_tokens / 1_000_000
+    def track_llm_call(
+        self,
+        *,
+        step: str,
+        prompt: str,
+        response: str,
+        completion: DeepSeekCompletion | None = None,
+        model: str | None = None,
+    ) -> None:
+        model = model or self.model
+        input_rate, output_rate, cache_hit_rate = self.rates_for(model)
+        cache_hit_tokens = 0
+        estimated = True
+        if completion is not None and (completion.cached or completion.shared):
+            # 缓存命中或合并到其他进行中请求时没有产生 API 调用，不计 token 和费用
+            input_tokens = output_tokens = 0
+            estimated = False
+        elif completion is not None and completion.has_usage:
+            input_tokens = int(completion.prompt_tokens or 0)
+            output_tokens = int(completion.completion_tokens or 0)
+            cache_hit_tokens = min(
+                int(completion.prompt_cache_hit_tokens or 0), input_tokens
+            )
+            estimated = False
+        else:
+            input_tokens = estimate_tokens(prompt)
+            output_tokens = estimate_tokens(response)
+        input_cost = (
+            (input_tokens - cache_hit_tokens) * input_rate
+            + cache_hit_tokens * cache_hit_rate
+        ) / 1_000_000
+        output_cost = output_tokens * output_rate / 1_000_000
         self.calls.append(
             {
                 "step": step,
-                "model": self.model,
+                "model": model,
                 "input_tokens": input_tokens,
                 "output_tokens": output_tokens,
                 "estimated_cost_usd": round(input_cost + output_cost, 8),
+                "estimated": estimated,
+                **self._completion_fields(completion),
+            }
+        )
+
+    def track_llm_failure(
+        self,
+        *,
+        step: str,
+        error: DeepSeekAPIError,
+        model: str | None = None,
+    ) -> None:
+        """记录重试耗尽后失败的调用，便于解释慢任务。"""
+        self.calls.append(
+            {
+                "step": step,
+                "model": model or self.model,
+                "input_tokens": 0,
+                "output_tokens": 0,
+                "estimated_cost_usd": 0.0,
                 "estimated": True,
+                "failed": True,
+                "error_class": error.retry_class.value,
+                "circuit_open": isinstance(error, DeepSeekCircuitOpenError),
+                "retries": error.retries,
+                "retry_backoff_seconds": round(error.backoff_seconds, 3),
+            }
+        )
+
+    def rates_for(self, model: str) -> tuple[float, float, float]:
+        """返回该模型的 (输入, 输出, 缓存命中输入) 每百万 token 单价。"""
+        if model not in self.model_rates:
+            # deepseek-reasoner -> DEEPSEEK_REASONER_INPUT_COST_PER_1M_TOKENS
+            name = re.sub(r"[^A-Z0-9]+", "_", model.upper()).strip("_")
+            prefix = name if name.startswith("DEEPSEEK_") else f"DEEPSEEK_{name}"
+            self.model_rates[model] = (
+                env_float(f"{prefix}_INPUT_COST_PER_1M_TOKENS", self.input_cost_per_1m_tokens),
+                env_float(f"{prefix}_OUTPUT_COST_PER_1M_TOKENS", self.output_cost_per_1m_tokens),
+                env_float(
+                    f"{prefix}_INPUT_CACHE_HIT_COST_PER_1M_TOKENS",
+                    self.input_cache_hit_cost_per_1m_tokens,
+                ),
+            )
+        return self.model_rates[model]
+
+    def track_search_call(
+        self,
+        *,
+        provider: str,
+        query: str,
+        cache_hit: bool,
+        result_count: int,
+    ) -> None:
+        self.searches.append(
+            {
+                "provider": provider,
+                "query": query,
+                "cache_hit": cache_hit,
+                "result_count": result_count,
             }
         )
 
+    def _completion_fields(
+        self, completion: DeepSeekCompletion | None
+    ) -> dict[str, object]:
+        if completion is None:
+            return {
+                "retries": 0,
+                "retry_backoff_seconds": 0.0,
+                "rate_limit_wait_seconds": 0.0,
+                "cache_status": "off",
+            }
+        fields: dict[str, object] = {
+            "retries": completion.retries,
+            "retry_backoff_seconds": completion.retry_backoff_seconds,
+            "rate_limit_wait_seconds": completion.rate_limit_wait_seconds,
+            "cache_status": completion.cache_status,
+            "latency_seconds": completion.latency_seconds,
+        }
+        if completion.prompt_cache_hit_tokens is not None:
+            fields["prompt_cache_hit_tokens"] = completion.prompt_cache_hit_tokens
+        if completion.prompt_cache_miss_tokens is not None:
+            fields["prompt_cache_miss_tokens"] = completion.prompt_cache_miss_tokens
+        if completion.shared:
+            fields["shared"] = True
+        if completion.retry_reasons:
+            fields["retry_reasons"] = dict(completion.retry_reasons)
+        return fields
+
     def summary(self) -> dict[str, object]:
         input_tokens = sum(int(call["input_tokens"]) for call in self.calls)
         output_tokens = sum(int(call["output_tokens"]) for call in self.calls)
         estimated_cost_usd = sum(
             float(call["estimated_cost_usd"]) for call in self.calls
         )
+        total_retries = sum(int(call.get("retries", 0)) for call in self.calls)
+        retry_backoff_seconds = sum(
+            float(call.get("retry_backoff_seconds", 0.0)) for call in self.calls
+        )
+        rate_limit_wait_seconds = sum(
+            float(call.get("rate_limit_wait_seconds", 0.0)) for call in self.calls
+        )
+        cache_hits = sum(1 for call in self.calls if call.get("cache_status") == "hit")
+        cache_misses = sum(
+            1 for call in self.calls if call.get("cache_status") == "miss"
+        )
+        prompt_cache_hit_tokens = sum(
+            int(call.get("prompt_cache_hit_tokens", 0)) for call in self.calls
+        )
+        prompt_cache_miss_tokens = sum(
+            int(call.get("prompt_cache_miss_tokens", 0)) for call in self.calls
+        )
+        latency_seconds = sum(
+            float(call.get("latency_seconds", 0.0)) for call in self.calls
+        )
         return {
             "model": self.model,
-            "estimated": True,
+            "estimated": any(
+                call.get("estimated", True) and not call.get("failed")
+                for call in self.calls
+            ) if self.calls else True,
             "pricing_source": "defaults_or_env",
             "input_cost_per_1m_tokens": self.input_cost_per_1m_tokens,
             "output_cost_per_1m_tokens": self.output_cost_per_1m_tokens,
+            "input_cache_hit_cost_per_1m_tokens": self.input_cache_hit_cost_per_1m_tokens,
             "total_input_tokens": input_tokens,
             "total_output_tokens": output_tokens,
             "total_tokens": input_tokens + output_tokens,
+            "total_prompt_cache_hit_tokens": prompt_cache_hit_tokens,
+            "total_prompt_cache_miss_tokens": prompt_cache_miss_tokens,
+            "total_llm_latency_seconds": round(latency_seconds, 3),
             "estimated_cost_usd": round(estimated_cost_usd, 8),
+            "total_retries": total_retries,
+            "total_retry_backoff_seconds": round(retry_backoff_seconds, 3),
+            "total_rate_limit_wait_seconds": round(rate_limit_wait_seconds, 3),
+            "failed_calls": sum(1 for call in self.calls if call.get("failed")),
+            "llm_cache_hits": cache_hits,
+            "llm_cache_misses": cache_misses,
+            "llm_coalesced_calls": sum(1 for call in self.calls if call.get("shared")),
+            "prompt_cache_by_step": self._prompt_cache_by_step(),
+            "by_model": self._by_model(),
+            "search_calls": sum(1 for search in self.searches if not search["cache_hit"]),
+            "search_cache_hits": sum(1 for search in self.searches if search["cache_hit"]),
             "calls": self.calls,
         }
 
+    def _by_model(self) -> dict[str, dict[str, object]]:
+        """按实际使用的模型汇总调用次数、token 与费用。"""
+        by_model: dict[str, dict[str, object]] = {}
+        for call in self.calls:
+            model = str(call["model"])
+            rates = self.rates_for(model)
+            stats = by_model.setdefault(
+                model,
+                {
+                    "calls": 0,
+                    "input_tokens": 0,
+                    "output_tokens": 0,
+                    "estimated_cost_usd": 0.0,
+                    "input_cost_per_1m_tokens": rates[0],
+                    "output_cost_per_1m_tokens": rates[1],
+                    "input_cache_hit_cost_per_1m_tokens": rates[2],
+                },
+            )
+            stats["calls"] = int(stats["calls"]) + 1
+            stats["input_tokens"] = int(stats["input_tokens"]) + int(call["input_tokens"])
+            stats["output_tokens"] = int(stats["output_tokens"]) + int(call["output_tokens"])
+            stats["estimated_cost_usd"] = round(
+                float(stats["estimated_cost_usd"]) + float(call["estimated_cost_usd"]), 8
+            )
+        return by_model
 
-def _env_float(name: str, default: float) -> float:
-    raw = os.getenv(name)
-    if raw is None:
-        return default
-    try:
-        return float(raw)
-    except ValueError:
-        return default
+    def _prompt_cache_by_step(self) -> dict[str, dict[str, object]]:
+        """按步骤统计服务端前缀缓存命中的输入 token 比例。"""
+        by_step: dict[str, dict[str, object]] = {}
+        for call in self.calls:
+            if "prompt_cache_hit_tokens" not in call and "prompt_cache_miss_tokens" not in call:
+                continue
+            stats = by_step.setdefault(
+                str(call["step"]),
+                {"hit_tokens": 0, "miss_tokens": 0, "hit_ratio": 0.0},
+            )
+            stats["hit_tokens"] = int(stats["hit_tokens"]) + int(
+                call.get("prompt_cache_hit_tokens", 0)
+            )
+            stats["miss_tokens"] = int(stats["miss_tokens"]) + int(
+                call.get("prompt_cache_miss_tokens", 0)
+            )
+        for stats in by_step.values():
+            total = int(stats["hit_tokens"]) + int(stats["miss_tokens"])
+            stats["hit_ratio"] = round(int(stats["hit_tokens"]) / total, 4) if total else 0.0
+        return by_step
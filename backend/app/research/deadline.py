@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import time
+from collections.abc import Callable
+
+from ..utils.env import env_float
+
+
+class Deadline:
+    """Absolute deadline for one research task on the monotonic clock.
+
+    ``expires_at=None`` means unbounded: ``remaining()`` and ``timeout()``
+    return ``None`` and the deadline never expires.
+    """
+
+    def __init__(
+        self,
+        expires_at: float | None,
+        *,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.expires_at = expires_at
+        self._clock = clock
+
+    @classmethod
+    def after(
+        cls,
+        seconds: float | None,
+        *,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> "Deadline":
+        if seconds is None or seconds <= 0:
+            return cls(None, clock=clock)
+        return cls(clock() + seconds, clock=clock)
+
+    def remaining(self) -> float | None:
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - self._clock())
+
+    @property
+    def expired(self) -> bool:
+        remaining = self.remaining()
+        return remaining is not None and remaining <= 0
+
+    def shifted(self, seconds: float) -> "Deadline":
+        """返回提前（负数）或推后（正数）若干秒的新截止时间。"""
+        if self.expires_at is None:
+            return self
+        return Deadline(self.expires_at + seconds, clock=self._clock)
+
+    def timeout(self, default: float | None = None) -> float | None:
+        """供 asyncio.wait_for 使用的超时：取 default 与剩余时间中较小者。"""
+        remaining = self.remaining()
+        if remaining is None:
+            return default
+        if default is None:
+            return remaining
+        return min(default, remaining)
+
+
+def default_deadline_seconds() -> float | None:
+    """RESEARCH_DEADLINE_SECONDS，<=0 表示不限时。"""
+    seconds = env_float("RESEARCH_DEADLINE_SECONDS", 300.0)
+    return seconds if seconds > 0 else None
+
+
+def report_reserve_seconds() -> float:
+    """为最终报告预留的时间，子查询研究必须在此之前结束。"""
+    return max(0.0, env_float("RESEARCH_REPORT_RESERVE_SECONDS", 60.0))
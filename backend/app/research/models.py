@@ -40,6 +40,8 @@ class ResearchContext(BaseModel):
 class SubQueryContext(BaseModel):
     step: int
     query: str
+    # completed / partial（截止时间前被截断）/ skipped（未开始即到期）
+    status: str = "completed"
     sources: list[ResearchSource] = Field(default_factory=list)
     citations: list[Citation] = Field(default_factory=list)
     evidence_ids: list[str] = Field(default_factory=list)
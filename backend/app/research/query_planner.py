@@ -1,25 +1,28 @@
 from __future__ import annotations
 
-import json
+import asyncio
 import logging
+import re
+from collections.abc import AsyncIterator
+from contextlib import suppress
 
 from ..llms.deepseek_llm import DeepSeekLLM
+from ..utils.json_parser import JSON_STOP_SEQUENCES
+from ..utils.json_parser import IncrementalJSONParser
+from ..utils.json_parser import parse_json_object
 from .cost_tracker import CostTracker
+from .deadline import Deadline
 from .models import ResearchSource
 
 logger = logging.getLogger(__name__)
 
-QUERY_PLANNER_PROMPT = """\
+# 静态指令放在 system 消息，保持逐字节稳定以命中服务端前缀缓存；
+# 用户问题、初始结果和数量限制等每次变化的内容只出现在 user 消息里
+QUERY_PLANNER_SYSTEM_PROMPT = """\
 你是一位研究策略专家。请根据用户的研究问题和初始搜索结果，从不同维度拆解出高价值的子查询。
 
-## 用户问题
-{query}
-
-## 初始搜索结果
-{initial_results_block}
-
 ## 要求
-- 生成最多 {max_sub_queries} 个子查询
+- 子查询数量不超过用户消息中给出的上限
 - 每个子查询必须覆盖**不同的研究维度**，例如：
   - 时间线（历史演进 / 最新进展）
   - 地域差异（不同国家/地区的情况）
@@ -32,15 +35,61 @@ QUERY_PLANNER_PROMPT = """\
 - 只返回 JSON，不要解释
 
 ## 返回格式
-{{"sub_queries": ["具体子查询1", "具体子查询2", ...]}}\
+{"sub_queries": ["具体子查询1", "具体子查询2", ...]}\
 """
 
+QUERY_PLANNER_PROMPT = """\
+## 用户问题
+{query}
+
+## 初始搜索结果
+{initial_results_block}
+
+## 子查询数量上限
+{max_sub_queries}\
+"""
+
+
+_LATIN_TERM = re.compile(r"[a-z0-9][a-z0-9+#.-]{2,}")
+_CJK_RUN = re.compile(r"[\u4e00-\u9fff]+")
+
+
+def _terms(text: str) -> set[str]:
+    """检索词集合：拉丁词（≥3 字符）与中文二元组，用于粗略判断文本是否涉及同一话题。"""
+    text = text.casefold()
+    terms = set(_LATIN_TERM.findall(text))
+    for run in _CJK_RUN.findall(text):
+        terms.update(run[i:i + 2] for i in range(len(run) - 1))
+    return terms
+
+
+def ungrounded_sub_queries(
+    query: str, sub_queries: list[str], initial_results: list[ResearchSource]
+) -> list[str]:
+    """返回在初始搜索结果的标题/摘要里找不到依据的子查询。
+
+    只看子查询相对原始问题新增的词（原问题的词几乎必然出现在结果里，说明不了问题）；
+    没有新增词的子查询视为有依据。没有初始结果时无从比较，返回空列表。
+    """
+    if not initial_results:
+        return []
+    result_terms = _terms(
+        " ".join(f"{source.title} {source.snippet}" for source in initial_results)
+    )
+    query_terms = _terms(query)
+    ungrounded: list[str] = []
+    for sub_query in sub_queries:
+        novel = _terms(sub_query) - query_terms
+        if novel and not novel & result_terms:
+            ungrounded.append(sub_query)
+    return ungrounded
+
 
 class QueryPlanner:
     """Plans sub-queries after an initial search, matching GPT Researcher flow."""
 
     def __init__(self, cost_tracker: CostTracker | None = None) -> None:
-        self.llm = DeepSeekLLM()
+        self.llm = DeepSeekLLM(profile="query_planning")
         self.cost_tracker = cost_tracker
 
     async def plan(
@@ -49,26 +98,101 @@ class QueryPlanner:
         query: str,
         initial_results: list[ResearchSource],
         max_sub_queries: int = 5,
+        deadline: Deadline | None = None,
     ) -> list[str]:
+        return [
+            sub_query
+            async for sub_query in self.plan_stream(
+                query=query,
+                initial_results=initial_results,
+                max_sub_queries=max_sub_queries,
+                deadline=deadline,
+            )
+        ]
+
+    async def plan_stream(
+        self,
+        *,
+        query: str,
+        initial_results: list[ResearchSource],
+        max_sub_queries: int = 5,
+        deadline: Deadline | None = None,
+        fallback: bool = True,
+    ) -> AsyncIterator[str]:
+        """流式规划：sub_queries 中每个字符串一闭合就产出，调用方可以立即开始研究它。
+
+        流中断或超时时保留已产出的子查询；一个都没有时产出规则生成的兜底子查询
+        （fallback=False 时什么都不产出，由调用方决定如何处理）。
+        """
         prompt = QUERY_PLANNER_PROMPT.format(
             query=query,
             initial_results_block=self._format_initial_results(initial_results),
             max_sub_queries=max_sub_queries,
         )
-        try:
-            response = await self.llm._acall(prompt)
-            if self.cost_tracker is not None:
-                self.cost_tracker.track_llm_call(
+        parser = IncrementalJSONParser()
+        emitted: list[str] = []
+        chunks: asyncio.Queue[str | None] = asyncio.Queue()
+
+        async def pump() -> None:
+            # 整个流在同一个任务里读完：达到数量上限后也不提前关闭，保证这次调用被完整计费统计
+            try:
+                async for chunk in self.llm._astream(
+                    prompt,
+                    system_prompt=QUERY_PLANNER_SYSTEM_PROMPT,
+                    json_mode=True,
+                    stop=JSON_STOP_SEQUENCES,
                     step="query_planning",
-                    prompt=prompt,
-                    response=response,
-                )
-            sub_queries = self._parse_sub_queries(response, max_sub_queries)
-            if sub_queries:
-                return sub_queries
+                    cost_tracker=self.cost_tracker,
+                ):
+                    chunks.put_nowait(chunk.text)
+            finally:
+                chunks.put_nowait(None)
+
+        producer = asyncio.create_task(
+            asyncio.wait_for(pump(), deadline.timeout() if deadline is not None else None)
+        )
+        try:
+            while (text := await chunks.get()) is not None:
+                parser.feed(text)
+                for sub_query in self._new_sub_queries(
+                    parser.closed_items("sub_queries"), emitted, max_sub_queries
+                ):
+                    yield sub_query
+            await producer
+            # 输出不是 JSON（或最后一项没有闭合引号）时按完整文本再解析一次
+            for sub_query in self._new_sub_queries(
+                self._parse_sub_queries(parser.text, max_sub_queries),
+                emitted,
+                max_sub_queries,
+            ):
+                yield sub_query
         except Exception as exc:  # noqa: BLE001
             logger.warning("sub-query planning failed: %s", exc)
-        return self._fallback_sub_queries(query, max_sub_queries)
+        finally:
+            if not producer.done():
+                producer.cancel()
+            with suppress(asyncio.CancelledError, Exception):
+                await producer
+        if fallback and not emitted:
+            for sub_query in self._fallback_sub_queries(query, max_sub_queries):
+                yield sub_query
+
+    def _new_sub_queries(
+        self, raw_queries: list[object], emitted: list[str], max_sub_queries: int
+    ) -> list[str]:
+        """清洗、去重并登记尚未产出的子查询。"""
+        fresh: list[str] = []
+        for raw_query in raw_queries:
+            if len(emitted) >= max_sub_queries:
+                break
+            if not isinstance(raw_query, str):
+                continue
+            cleaned = " ".join(raw_query.split())[:180]
+            if not cleaned or cleaned in emitted:
+                continue
+            emitted.append(cleaned)
+            fresh.append(cleaned)
+        return fresh
 
     def _format_initial_results(self, results: list[ResearchSource]) -> str:
         if not results:
@@ -79,16 +203,18 @@ class QueryPlanner:
         )
 
     def _parse_sub_queries(self, response: str, max_sub_queries: int) -> list[str]:
-        text = response.strip()
-        if "```json" in text:
-            text = text.split("```json", 1)[1].split("```", 1)[0].strip()
-        elif text.startswith("```"):
-            text = text.split("```", 1)[1].rsplit("```", 1)[0].strip()
-        try:
-            parsed = json.loads(text)
-        except json.JSONDecodeError:
+        parsed = parse_json_object(response)
+        if parsed is not None:
+            raw_queries = parsed.get("sub_queries", [])
+        else:
+            # 不是 JSON 时按行提取，避免浪费这次调用
+            raw_queries = [
+                re.sub(r"^\s*(?:[-*•]|\d+[.)、])\s*", "", line).strip("\"', ")
+                for line in response.splitlines()
+                if not line.rstrip().endswith((":", "："))
+            ]
+        if not isinstance(raw_queries, list):
             return []
-        raw_queries = parsed.get("sub_queries", []) if isinstance(parsed, dict) else []
         sub_queries: list[str] = []
         seen: set[str] = set()
         for raw_query in raw_queries:
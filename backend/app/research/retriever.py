@@ -1,21 +1,52 @@
 from __future__ import annotations
 
+import asyncio
+import logging
+
 from ..services.search_tools import search_tools
+from .cost_tracker import CostTracker
+from .deadline import Deadline
 from .models import ResearchSource
 
+logger = logging.getLogger(__name__)
+
 
 class ResearchRetriever:
     """Search retriever layer, equivalent to GPT Researcher's retriever facade."""
 
-    async def search(self, query: str, max_results: int = 8) -> list[ResearchSource]:
-        raw_results = await search_tools.comprehensive_search(query)
+    def __init__(self, cost_tracker: CostTracker | None = None) -> None:
+        self.cost_tracker = cost_tracker
+
+    async def search(
+        self,
+        query: str,
+        max_results: int = 8,
+        deadline: Deadline | None = None,
+    ) -> list[ResearchSource]:
+        try:
+            raw_results = await asyncio.wait_for(
+                search_tools.comprehensive_search(query, cost_tracker=self.cost_tracker),
+                deadline.timeout() if deadline is not None else None,
+            )
+        except TimeoutError:
+            logger.warning("搜索超出任务截止时间，跳过: %s", query)
+            return []
         sources: list[ResearchSource] = []
         seen_links: set[str] = set()
+        # 维基百科/学术结果少而精，为它们预留名额（最多一半），避免被网页结果挤掉
+        reserved = min(
+            sum(len(items) for source_type, items in raw_results.items() if source_type != "web"),
+            max_results // 2,
+        )
         for source_type, items in raw_results.items():
+            bucket_count = 0
             for item in items:
                 link = str(item.get("link", "")).strip()
                 if not link or link in seen_links:
                     continue
+                if source_type == "web" and bucket_count >= max_results - reserved:
+                    break
+                bucket_count += 1
                 seen_links.add(link)
                 sources.append(
                     ResearchSource(
@@ -3,6 +3,7 @@ from __future__ import annotations
 import asyncio
 
 from ..services.content_extraction_service import content_extraction_service
+from .deadline import Deadline
 from .models import ResearchSource
 
 
@@ -14,7 +15,9 @@ class ResearchScraper:
         sources: list[ResearchSource],
         visited_urls: set[str],
         max_sources: int = 8,
+        deadline: Deadline | None = None,
     ) -> list[ResearchSource]:
+        """抓取正文；到截止时间仍未返回的页面只保留搜索摘要。"""
         new_sources: list[ResearchSource] = []
         for source in sources:
             if source.link in visited_urls:
@@ -24,16 +27,22 @@ class ResearchScraper:
             if len(new_sources) >= max_sources:
                 break
 
-        extracted = await asyncio.gather(
-            *[
-                content_extraction_service.extract_content(source.link)
-                for source in new_sources
-            ],
-            return_exceptions=True,
+        if not new_sources:
+            return new_sources
+        # 实际并发由 content_extraction_service 的自适应抓取上限控制
+        fetches = [
+            asyncio.ensure_future(content_extraction_service.extract_content(source.link))
+            for source in new_sources
+        ]
+        done, pending = await asyncio.wait(
+            fetches,
+            timeout=deadline.timeout() if deadline is not None else None,
         )
-        for source, content in zip(new_sources, extracted):
-            if isinstance(content, Exception):
+        for fetch in pending:
+            fetch.cancel()
+        for source, fetch in zip(new_sources, fetches):
+            if fetch not in done or fetch.exception() is not None:
                 source.extracted_content = ""
             else:
-                source.extracted_content = content
+                source.extracted_content = fetch.result()
         return new_sources
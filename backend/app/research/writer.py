@@ -1,6 +1,11 @@
 from __future__ import annotations
 
+import asyncio
 import logging
+import os
+import re
+from collections.abc import Awaitable
+from collections.abc import Callable
 from datetime import datetime
 from datetime import timezone
 
@@ -8,11 +13,14 @@ from ..llms.deepseek_llm import DeepSeekLLM
 from ..models.research_task import ResearchSection
 from ..services.deepseek_service import DeepSeekConfig
 from .cost_tracker import CostTracker
+from .deadline import Deadline
 from .models import ResearchSource
 from .models import SubQueryContext
 
 logger = logging.getLogger(__name__)
 
+ReportDeltaCallback = Callable[[str], Awaitable[None]]
+
 # ── Prompt 模板 ──────────────────────────────────────────────────
 
 REPORT_SYSTEM_ROLE = """\
@@ -23,19 +31,8 @@ REPORT_SYSTEM_ROLE = """\
 4. 诚实标注不确定性——信息不足时使用 [信息不足] 标记，绝不编造数据或来源\
 """
 
-REPORT_PROMPT_TEMPLATE = """\
-## 原始研究问题
-{query}
-
-## 各维度研究上下文
-{context_block}
-
-## 参考来源列表
-{sources_block}
-
----
-
-请基于以上研究上下文撰写深度研究报告。严格遵循以下结构和要求：
+REPORT_INSTRUCTIONS = """\
+请基于用户提供的研究上下文撰写深度研究报告。严格遵循以下结构和要求：
 
 ### 报告结构
 1. **执行摘要**（200 字以内）：核心发现和结论概述
@@ -56,7 +53,91 @@ REPORT_PROMPT_TEMPLATE = """\
 - 数值、日期、名称等必须与来源一致，不确定的加注 [待核实]
 - 如某维度信息不足，不要猜测，直接写"当前研究未找到充分证据"并标注 [信息不足]
 - 使用 Markdown 格式，善用标题、列表、表格增强可读性
-- 总长度控制在 2000-4000 字
+- 总长度控制在 2000-4000 字\
+"""
+
+# 角色与写作要求都是静态内容，合并为 system 消息作为可缓存的前缀
+REPORT_SYSTEM_PROMPT = f"{REPORT_SYSTEM_ROLE}\n\n{REPORT_INSTRUCTIONS}"
+
+REPORT_PROMPT_TEMPLATE = """\
+## 原始研究问题
+{query}
+
+## 各维度研究上下文
+{context_block}
+
+## 参考来源列表
+{sources_block}\
+"""
+
+SECTION_DRAFT_SYSTEM_PROMPT = f"""\
+{REPORT_SYSTEM_ROLE}
+
+请为深度研究报告撰写其中一个维度的章节草稿，其余章节和执行摘要由后续步骤完成：
+1. 400-800 字，使用 Markdown，可用四级标题（####）和列表，不要写一、二级标题
+2. 关键事实必须标注来源，只能使用本章节来源列表中的编号，格式为 [S1]、[S2]
+3. 如有对立观点，同时呈现并标注来源；证据不足处标注 [信息不足]
+4. 区分「事实」和「分析/推断」，不要编造数据或来源\
+"""
+
+SECTION_DRAFT_PROMPT_TEMPLATE = """\
+## 原始研究问题
+{query}
+
+## 本章节研究上下文
+{section_block}
+
+## 本章节来源列表
+{sources_block}\
+"""
+
+MERGE_SYSTEM_PROMPT = f"""\
+{REPORT_SYSTEM_ROLE}
+
+各章节草稿已经写好，会原样附在你的输出之后。请通读各章节草稿，只撰写以下部分：
+1. **执行摘要**（200 字以内）：核心发现和结论概述
+2. **关键发现与对比**：汇总各维度发现，对比不同来源的信息一致性
+3. **争议与不确定性**：信息不足、存在争议或互相矛盾的领域，用 [信息不足] 标注
+4. **结论与建议**：核心观点和行动建议（推断需标注为"分析/推断"）
+
+使用 Markdown 二级标题（##），引用只能使用草稿中已有的来源编号；不要复述章节正文，
+不要输出参考来源列表，总长度控制在 800-1500 字。\
+"""
+
+MERGE_PROMPT_TEMPLATE = """\
+## 原始研究问题
+{query}
+
+## 各章节草稿
+{drafts_block}
+
+## 参考来源列表
+{sources_block}\
+"""
+
+# 章节草稿内的来源编号，合并时按全局来源列表重新编号
+_LOCAL_CITATION = re.compile(r"\[S(\d+)\]")
+SECTION_DRAFT_MAX_CITATIONS = 8
+
+
+def map_reduce_report_enabled() -> bool:
+    """RESEARCH_MAP_REDUCE_REPORT=true 时按子查询逐章起草，最后一次轻量调用合并。"""
+    return os.getenv("RESEARCH_MAP_REDUCE_REPORT", "").lower() in {"1", "true", "yes"}
+
+
+QUICK_ANSWER_SYSTEM_PROMPT = """\
+你是一位研究助理。深度研究仍在进行，请仅根据用户提供的搜索摘要先给出简短的初步回答：
+1. 直接回答问题核心，150-300 字，不写标题和报告结构
+2. 引用摘要时标注编号，如 [1]、[2]
+3. 摘要不足以支持的部分写明"尚待深入研究"，不要编造数据或来源\
+"""
+
+QUICK_ANSWER_PROMPT_TEMPLATE = """\
+## 用户问题
+{query}
+
+## 搜索摘要
+{snippets_block}\
 """
 
 
@@ -64,7 +145,10 @@ class ResearchWriter:
     """Writes the final report from compressed research context."""
 
     def __init__(self, cost_tracker: CostTracker | None = None) -> None:
-        self.llm = DeepSeekLLM()
+        self.llm = DeepSeekLLM(profile="report_writing")
+        self.quick_llm = DeepSeekLLM(profile="quick_answer")
+        self.draft_llm = DeepSeekLLM(profile="section_drafting")
+        self.merge_llm = DeepSeekLLM(profile="report_merge")
         self.config = DeepSeekConfig.from_env()
         self.cost_tracker = cost_tracker
 
@@ -75,6 +159,51 @@ class ResearchWriter:
         sections: list[ResearchSection],
         context: list[SubQueryContext],
         sources: list[ResearchSource],
+        on_delta: ReportDeltaCallback | None = None,
+        deadline: Deadline | None = None,
+        incomplete_queries: list[str] | None = None,
+        section_drafts: dict[int, str] | None = None,
+    ) -> str:
+        """生成最终报告；传入 on_delta 时边生成边回调增量文本。
+
+        incomplete_queries 非空时报告开头会标注为部分报告；到达 deadline 时
+        回退为基于已完成上下文的模板报告。传入 section_drafts（step -> 草稿）时
+        只用一次轻量调用撰写执行摘要与对比，再与各章节草稿拼接成报告。
+        """
+        notice = self._partial_notice(incomplete_queries or [])
+        if section_drafts:
+            report = await self._write_merged_report(
+                query=query,
+                sections=sections,
+                context=context,
+                sources=sources,
+                section_drafts=section_drafts,
+                on_delta=on_delta,
+                deadline=deadline,
+                notice=notice,
+            )
+            return f"{notice}{report}" if notice else report
+        report = await self._write_report_body(
+            query=query,
+            sections=sections,
+            context=context,
+            sources=sources,
+            on_delta=on_delta,
+            deadline=deadline,
+            notice=notice,
+        )
+        return f"{notice}{report}" if notice else report
+
+    async def _write_report_body(
+        self,
+        *,
+        query: str,
+        sections: list[ResearchSection],
+        context: list[SubQueryContext],
+        sources: list[ResearchSource],
+        on_delta: ReportDeltaCallback | None,
+        deadline: Deadline | None,
+        notice: str,
     ) -> str:
         reference_entries = self._collect_reference_entries(sources, sections, context)
         source_index = self._build_source_index(reference_entries)
@@ -87,20 +216,246 @@ class ResearchWriter:
             sources_block=sources_block,
         )
 
+        timeout = deadline.timeout() if deadline is not None else None
         try:
-            # 报告生成使用低 temperature 以减少幻觉
-            response = await self.llm._acall(prompt, temperature=0.3)
-            if self.cost_tracker is not None:
-                self.cost_tracker.track_llm_call(
-                    step="report_writing",
-                    prompt=prompt,
-                    response=response,
+            # temperature 等参数来自 report_writing 生成配置（默认低 temperature 以减少幻觉）
+            if on_delta is None:
+                return await asyncio.wait_for(
+                    self.llm._acall(
+                        prompt,
+                        system_prompt=REPORT_SYSTEM_PROMPT,
+                        step="report_writing",
+                        cost_tracker=self.cost_tracker,
+                    ),
+                    timeout,
                 )
-            return response
+            if notice:
+                await on_delta(notice)
+            return await asyncio.wait_for(self._stream_report(prompt, on_delta), timeout)
         except Exception as exc:  # noqa: BLE001
             logger.warning("research writer failed: %s", exc)
             return self._fallback_report(query, sections, context, sources)
 
+    async def _stream_report(self, prompt: str, on_delta: ReportDeltaCallback) -> str:
+        parts: list[str] = []
+        async for chunk in self.llm._astream(
+            prompt,
+            system_prompt=REPORT_SYSTEM_PROMPT,
+            step="report_writing",
+            cost_tracker=self.cost_tracker,
+        ):
+            parts.append(chunk.text)
+            await on_delta(chunk.text)
+        return "".join(parts)
+
+    # ── Map-reduce：逐章起草 + 合并 ──
+
+    async def draft_section(
+        self,
+        *,
+        query: str,
+        section: ResearchSection,
+        deadline: Deadline | None = None,
+    ) -> str:
+        """为一个已完成的子查询撰写章节草稿，引用编号为章节内的 [S1]、[S2]。
+
+        失败或超时返回空字符串，合并时该章节改用研究上下文原文。
+        """
+        titles = {citation.link: citation.title for citation in section.citations}
+        sources_block = "\n".join(
+            f"[S{index}] {titles.get(link) or link} - {link}"
+            for index, link in enumerate(self._local_citation_links(section), start=1)
+        )
+        item = self._section_prompt_inputs([section], [])[0]
+        item["citations"] = []
+        prompt = SECTION_DRAFT_PROMPT_TEMPLATE.format(
+            query=query,
+            section_block=self._render_section_prompt_block(item, {}),
+            sources_block=sources_block or "[无来源]",
+        )
+        try:
+            draft = await asyncio.wait_for(
+                self.draft_llm._acall(
+                    prompt,
+                    system_prompt=SECTION_DRAFT_SYSTEM_PROMPT,
+                    step="section_drafting",
+                    cost_tracker=self.cost_tracker,
+                ),
+                deadline.timeout() if deadline is not None else None,
+            )
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("section draft failed for %s: %s", section.title, exc)
+            return ""
+        return draft.strip()
+
+    async def _write_merged_report(
+        self,
+        *,
+        query: str,
+        sections: list[ResearchSection],
+        context: list[SubQueryContext],
+        sources: list[ResearchSource],
+        section_drafts: dict[int, str],
+        on_delta: ReportDeltaCallback | None,
+        deadline: Deadline | None,
+        notice: str,
+    ) -> str:
+        reference_entries = self._collect_reference_entries(sources, sections, context)
+        source_index = self._build_source_index(reference_entries)
+        body = self._assemble_drafts(sections, section_drafts, source_index)
+        references = "\n".join(
+            f"[{index}] {entry['title']} - {entry['link']}"
+            for index, entry in enumerate(reference_entries[:20], start=1)
+        )
+        prompt = MERGE_PROMPT_TEMPLATE.format(
+            query=query,
+            drafts_block=body,
+            sources_block=self._format_sources(reference_entries),
+        )
+        tail = f"\n\n## 分维度分析\n\n{body}\n\n## 参考来源\n\n{references or '[信息不足]'}\n"
+        if on_delta is not None and notice:
+            await on_delta(notice)
+        head = f"# {query}\n\n"
+        if on_delta is not None:
+            await on_delta(head)
+        parts: list[str] = []
+        try:
+            await asyncio.wait_for(
+                self._stream_merge(prompt, parts, on_delta),
+                deadline.timeout() if deadline is not None else None,
+            )
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("report merge failed, keeping section drafts only: %s", exc)
+            missing = "\n\n> ⚠️ 执行摘要生成失败，以下为各维度章节草稿。"
+            parts.append(missing)
+            if on_delta is not None:
+                await on_delta(missing)
+        if on_delta is not None:
+            await on_delta(tail)
+        return head + "".join(parts).strip() + tail
+
+    async def _stream_merge(
+        self,
+        prompt: str,
+        parts: list[str],
+        on_delta: ReportDeltaCallback | None,
+    ) -> None:
+        async for chunk in self.merge_llm._astream(
+            prompt,
+            system_prompt=MERGE_SYSTEM_PROMPT,
+            step="report_merge",
+            cost_tracker=self.cost_tracker,
+        ):
+            parts.append(chunk.text)
+            if on_delta is not None:
+                await on_delta(chunk.text)
+
+    def _assemble_drafts(
+        self,
+        sections: list[ResearchSection],
+        section_drafts: dict[int, str],
+        source_index: dict[str, int],
+    ) -> str:
+        """按章节顺序拼接草稿；没有草稿的章节使用研究上下文原文。"""
+        blocks: list[str] = []
+        for section in sorted(sections, key=lambda item: item.step):
+            draft = section_drafts.get(section.step, "").strip()
+            if draft:
+                text = self._renumber_citations(
+                    draft, self._local_citation_links(section), source_index
+                )
+            else:
+                text = section.analysis.strip() or "[信息不足]"
+            blocks.append(f"### {section.title}\n\n{text}")
+        return "\n\n".join(blocks)
+
+    def _local_citation_links(self, section: ResearchSection) -> list[str]:
+        return [
+            citation.link
+            for citation in section.citations[:SECTION_DRAFT_MAX_CITATIONS]
+            if citation.link
+        ]
+
+    def _renumber_citations(
+        self,
+        draft: str,
+        local_links: list[str],
+        source_index: dict[str, int],
+    ) -> str:
+        """把章节内的 [S#] 换成全局来源编号；无法对应的编号直接去掉。"""
+
+        def replace(match: re.Match[str]) -> str:
+            position = int(match.group(1)) - 1
+            if 0 <= position < len(local_links):
+                number = source_index.get(local_links[position])
+                if number is not None:
+                    return f"[{number}]"
+            return ""
+
+        return _LOCAL_CITATION.sub(replace, draft)
+
+    async def write_quick_answer(
+        self,
+        *,
+        query: str,
+        sources: list[ResearchSource],
+        on_delta: ReportDeltaCallback | None = None,
+        deadline: Deadline | None = None,
+        max_sources: int = 6,
+    ) -> str:
+        """仅凭初始搜索摘要流式生成初步回答。
+
+        失败或超时只记录日志，返回已生成的部分（可能为空），不影响完整研究。
+        """
+        snippets_block = self._format_snippets(sources[:max_sources])
+        if not snippets_block:
+            return ""
+        prompt = QUICK_ANSWER_PROMPT_TEMPLATE.format(
+            query=query,
+            snippets_block=snippets_block,
+        )
+        parts: list[str] = []
+
+        async def stream() -> None:
+            async for chunk in self.quick_llm._astream(
+                prompt,
+                system_prompt=QUICK_ANSWER_SYSTEM_PROMPT,
+                step="quick_answer",
+                cost_tracker=self.cost_tracker,
+            ):
+                parts.append(chunk.text)
+                if on_delta is not None:
+                    await on_delta(chunk.text)
+
+        try:
+            await asyncio.wait_for(
+                stream(), deadline.timeout() if deadline is not None else None
+            )
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("quick answer failed: %s", exc)
+        return "".join(parts).strip()
+
+    def _format_snippets(self, sources: list[ResearchSource]) -> str:
+        entries: list[str] = []
+        for source in sources:
+            snippet = source.snippet.strip()
+            if not snippet:
+                continue
+            entries.append(
+                f"[{len(entries) + 1}] {source.title} - {source.link}\n{snippet[:400]}"
+            )
+        return "\n\n".join(entries)
+
+    def _partial_notice(self, incomplete_queries: list[str]) -> str:
+        if not incomplete_queries:
+            return ""
+        items = "\n".join(f"> - {query}" for query in incomplete_queries)
+        return (
+            "> ⚠️ 部分报告：研究在截止时间前未能完成全部子查询，"
+            "以下方向未研究或仅部分完成，相关结论可能不完整。\n"
+            f"{items}\n\n"
+        )
+
     # ── 上下文格式化（动态 token 分配）──
 
     def _format_context(
@@ -359,7 +714,7 @@ class ResearchWriter:
             {
                 "step": item.step,
                 "title": item.query,
-                "status": "completed",
+                "status": item.status,
                 "analysis": item.context,
                 "citations": [citation.model_dump() for citation in item.citations],
                 "evidence_ids": item.evidence_ids,
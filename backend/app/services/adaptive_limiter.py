@@ -0,0 +1,256 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import deque
+from collections.abc import AsyncIterator
+from collections.abc import Callable
+from contextlib import asynccontextmanager
+
+import httpx
+import requests
+
+from ..utils.env import env_float
+from .retry_policy import RetryClass
+
+logger = logging.getLogger(__name__)
+
+# 名称 -> (初始并发, 下限, 上限, 延迟目标秒)
+ADAPTIVE_LIMIT_DEFAULTS: dict[str, tuple[int, int, int, float]] = {
+    "llm": (8, 2, 16, 45.0),
+    "search": (4, 1, 16, 8.0),
+    "fetch": (8, 2, 32, 5.0),
+}
+
+_OVERLOAD_STATUS_CODES = (429, 503)
+
+
+def is_overload_error(exc: BaseException) -> bool:
+    """超时、429/503 视为上游过载信号，其余异常只计入错误率。"""
+    if isinstance(exc, (TimeoutError, httpx.TimeoutException, requests.Timeout)):
+        return True
+    if getattr(exc, "retry_class", None) in (RetryClass.RATE_LIMITED, RetryClass.TIMEOUT):
+        return True
+    status_code = getattr(exc, "status_code", None)
+    if status_code is None:
+        status_code = getattr(getattr(exc, "response", None), "status_code", None)
+    return status_code in _OVERLOAD_STATUS_CODES
+
+
+class AdaptiveSlot:
+    """One granted slot; callers may report the outcome explicitly."""
+
+    def __init__(self) -> None:
+        self.outcome: str | None = None
+        self.latency: float | None = None
+        # 获得名额时的并发数，用于判断成功是否发生在接近上限的负载下
+        self.in_flight = 0
+
+    def mark_success(self, latency: float | None = None) -> None:
+        self.outcome = "success"
+        self.latency = latency
+
+    def mark_overloaded(self) -> None:
+        self.outcome = "overloaded"
+
+    def mark_failed(self) -> None:
+        self.outcome = "failed"
+
+
+class AdaptiveConcurrencyLimiter:
+    """AIMD concurrency limit for one upstream (LLM, search or page fetch).
+
+    A success under ``latency_target`` while the error rate stays below
+    ``error_rate_threshold`` grows the limit by ``1 / limit`` (about +1 per
+    window of calls); a timeout or 429/503 multiplies it by
+    ``decrease_factor``, at most once per ``cooldown`` so one burst of
+    failures only counts once. The limit stays within ``[floor, ceiling]``
+    and waiters are served FIFO.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        initial: int = 4,
+        floor: int = 1,
+        ceiling: int = 16,
+        latency_target: float = 10.0,
+        decrease_factor: float = 0.5,
+        error_rate_threshold: float = 0.2,
+        cooldown: float = 2.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.name = name
+        self.floor = max(1, floor)
+        self.ceiling = max(self.floor, ceiling)
+        self.initial = min(max(initial, self.floor), self.ceiling)
+        self.latency_target = latency_target
+        self.decrease_factor = min(max(decrease_factor, 0.1), 0.95)
+        self.error_rate_threshold = error_rate_threshold
+        self.cooldown = cooldown
+        self._clock = clock
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._reset()
+
+    @classmethod
+    def from_env(cls, name: str) -> "AdaptiveConcurrencyLimiter":
+        """读取 ADAPTIVE_<NAME>_{INITIAL,MIN,MAX,LATENCY_TARGET_SECONDS}。"""
+        initial, floor, ceiling, latency_target = ADAPTIVE_LIMIT_DEFAULTS.get(
+            name, (4, 1, 16, 10.0)
+        )
+        prefix = f"ADAPTIVE_{name.upper()}"
+        return cls(
+            name,
+            initial=int(env_float(f"{prefix}_INITIAL", initial)),
+            floor=int(env_float(f"{prefix}_MIN", floor)),
+            ceiling=int(env_float(f"{prefix}_MAX", ceiling)),
+            latency_target=env_float(f"{prefix}_LATENCY_TARGET_SECONDS", latency_target),
+            decrease_factor=env_float("ADAPTIVE_DECREASE_FACTOR", 0.5),
+        )
+
+    def _reset(self) -> None:
+        self._limit = float(self.initial)
+        self._waiters: deque[asyncio.Future[None]] = deque()
+        self._in_flight = 0
+        self._last_decrease = float("-inf")
+        self._error_rate = 0.0
+        self._latency_ewma: float | None = None
+        self._increases = 0
+        self._decreases = 0
+        self._overloads = 0
+        self._failures = 0
+
+    @property
+    def limit(self) -> int:
+        return max(self.floor, int(self._limit))
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(1 for waiter in self._waiters if not waiter.done())
+
+    def snapshot(self) -> dict[str, object]:
+        return {
+            "limit": self.limit,
+            "floor": self.floor,
+            "ceiling": self.ceiling,
+            "in_flight": self._in_flight,
+            "queue_depth": self.queue_depth,
+            "latency_target_seconds": self.latency_target,
+            "latency_ewma_seconds": (
+                round(self._latency_ewma, 3) if self._latency_ewma is not None else None
+            ),
+            "error_rate": round(self._error_rate, 3),
+            "increases": self._increases,
+            "decreases": self._decreases,
+            "overloads": self._overloads,
+            "failures": self._failures,
+        }
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[AdaptiveSlot]:
+        """占用一个并发名额；未显式标记结果时按耗时和异常类型自动判定。"""
+        await self._acquire()
+        slot = AdaptiveSlot()
+        slot.in_flight = self._in_flight
+        started_at = self._clock()
+        try:
+            yield slot
+        except Exception as exc:
+            if is_overload_error(exc):
+                slot.mark_overloaded()
+            elif slot.outcome is None:
+                slot.mark_failed()
+            raise
+        except BaseException:
+            # 取消不代表上游健康状况，不计入统计
+            if slot.outcome is None:
+                slot.outcome = "cancelled"
+            raise
+        finally:
+            if slot.outcome is None:
+                slot.mark_success()
+            if slot.outcome == "success" and slot.latency is None:
+                slot.latency = self._clock() - started_at
+            self._release(slot)
+
+    async def _acquire(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # 事件循环变化（如测试中多次 asyncio.run）时旧的等待者已失效
+            self._loop = loop
+            self._reset()
+        if not self._waiters and self._in_flight < self.limit:
+            self._in_flight += 1
+            return
+        waiter = loop.create_future()
+        self._waiters.append(waiter)
+        logger.debug("%s 并发已满（%d），排队等待", self.name, self.limit)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # 已获得名额但调用方被取消，归还名额
+                self._in_flight -= 1
+            else:
+                try:
+                    self._waiters.remove(waiter)
+                except ValueError:
+                    pass
+            self._dispatch()
+            raise
+
+    def _release(self, slot: AdaptiveSlot) -> None:
+        self._in_flight = max(0, self._in_flight - 1)
+        self._record(slot, utilized=slot.in_flight * 2 >= self.limit)
+        self._dispatch()
+
+    def _record(self, slot: AdaptiveSlot, utilized: bool) -> None:
+        if slot.outcome == "cancelled":
+            return
+        failed = slot.outcome != "success"
+        self._error_rate = 0.9 * self._error_rate + (0.1 if failed else 0.0)
+        if slot.outcome == "overloaded":
+            self._overloads += 1
+            self._decrease()
+            return
+        if failed:
+            self._failures += 1
+            return
+        latency = slot.latency or 0.0
+        self._latency_ewma = (
+            latency if self._latency_ewma is None else 0.8 * self._latency_ewma + 0.2 * latency
+        )
+        healthy = (
+            latency <= self.latency_target
+            and self._error_rate <= self.error_rate_threshold
+        )
+        # 实际并发远低于上限时成功不能说明更高并发也健康，不加窗口
+        if healthy and utilized and self._limit < self.ceiling:
+            self._limit = min(float(self.ceiling), self._limit + 1 / self._limit)
+            self._increases += 1
+
+    def _decrease(self) -> None:
+        now = self._clock()
+        if now - self._last_decrease < self.cooldown:
+            return
+        previous = self.limit
+        self._limit = max(float(self.floor), self._limit * self.decrease_factor)
+        self._last_decrease = now
+        self._decreases += 1
+        logger.warning(
+            "%s 上游过载（超时或限流），并发上限 %d -> %d", self.name, previous, self.limit
+        )
+
+    def _dispatch(self) -> None:
+        while self._waiters and self._in_flight < self.limit:
+            waiter = self._waiters.popleft()
+            if waiter.done():
+                continue
+            self._in_flight += 1
+            waiter.set_result(None)
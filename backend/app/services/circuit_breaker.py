@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from collections.abc import Callable
+from collections.abc import Iterator
+from contextlib import contextmanager
+from enum import Enum
+
+from ..utils.env import env_float
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitState(str, Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with half-open probing.
+
+    After ``failure_threshold`` consecutive failures the circuit opens and
+    ``allow_request()`` returns False for ``reset_timeout`` seconds, so callers
+    can go straight to their fallbacks. Then up to ``half_open_max_calls``
+    probe requests are let through: a success closes the circuit, a failure
+    re-opens it for another cool-down window.
+
+    Use ``probe()`` around a request so a probe that ends without an outcome
+    (cancelled or abandoned) gives its slot back; probes older than
+    ``reset_timeout`` are expired as a safety net for ``allow_request()``
+    callers that never report back.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        half_open_max_calls: int = 1,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = max(1, half_open_max_calls)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = CircuitState.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        # 半开状态下已放行、尚未记录结果的探测：编号 -> 放行时间
+        self._probes: dict[int, float] = {}
+        self._probe_seq = 0
+        self._rejected = 0
+        self._times_opened = 0
+
+    @classmethod
+    def from_env(cls, name: str) -> "CircuitBreaker":
+        """读取 CIRCUIT_BREAKER_<NAME>_*，未设置时回退到全局 CIRCUIT_BREAKER_*。"""
+        prefix = f"CIRCUIT_BREAKER_{name.upper()}"
+        return cls(
+            name,
+            failure_threshold=int(env_float(
+                f"{prefix}_FAILURE_THRESHOLD",
+                env_float("CIRCUIT_BREAKER_FAILURE_THRESHOLD", 5),
+            )),
+            reset_timeout=env_float(
+                f"{prefix}_RESET_SECONDS",
+                env_float("CIRCUIT_BREAKER_RESET_SECONDS", 30.0),
+            ),
+        )
+
+    @property
+    def state(self) -> CircuitState:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> CircuitState:
+        if (
+            self._state is CircuitState.OPEN
+            and self._clock() - self._opened_at >= self.reset_timeout
+        ):
+            self._state = CircuitState.HALF_OPEN
+            self._probes.clear()
+            logger.info("熔断器 %s 进入半开状态，允许探测请求", self.name)
+        return self._state
+
+    def allow_request(self) -> bool:
+        return self._admit() is not None
+
+    @contextmanager
+    def probe(self) -> Iterator[bool]:
+        """allow_request 的上下文管理器版本，yield 是否放行。
+
+        半开探测在退出时仍未记录成功或失败（被取消、放弃或抛出未计入熔断的异常）时归还名额，
+        既不关闭也不重新打开熔断器。
+        """
+        ticket = self._admit()
+        try:
+            yield ticket is not None
+        finally:
+            if ticket:
+                with self._lock:
+                    self._probes.pop(ticket, None)
+
+    def _admit(self) -> int | None:
+        """放行时返回编号（关闭状态为 0，半开探测为正数），拒绝时返回 None。"""
+        with self._lock:
+            state = self._current_state()
+            if state is CircuitState.CLOSED:
+                return 0
+            if state is CircuitState.HALF_OPEN:
+                now = self._clock()
+                for ticket, granted_at in list(self._probes.items()):
+                    if now - granted_at >= self.reset_timeout:
+                        # 超过冷却时长仍无结果的探测视为已放弃
+                        del self._probes[ticket]
+                if len(self._probes) < self.half_open_max_calls:
+                    self._probe_seq += 1
+                    self._probes[self._probe_seq] = now
+                    return self._probe_seq
+            self._rejected += 1
+            return None
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._state is not CircuitState.CLOSED:
+                logger.info("熔断器 %s 探测成功，恢复服务", self.name)
+            self._state = CircuitState.CLOSED
+            self._consecutive_failures = 0
+            self._probes.clear()
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._consecutive_failures += 1
+            state = self._current_state()
+            if state is CircuitState.HALF_OPEN or (
+                state is CircuitState.CLOSED
+                and self._consecutive_failures >= self.failure_threshold
+            ):
+                self._trip()
+
+    def _trip(self) -> None:
+        self._state = CircuitState.OPEN
+        self._opened_at = self._clock()
+        self._probes.clear()
+        self._times_opened += 1
+        logger.warning(
+            "熔断器 %s 打开：连续失败 %d 次，%.0f 秒内直接走降级路径",
+            self.name,
+            self._consecutive_failures,
+            self.reset_timeout,
+        )
+
+    def snapshot(self) -> dict[str, object]:
+        with self._lock:
+            state = self._current_state()
+            retry_in = (
+                max(0.0, self.reset_timeout - (self._clock() - self._opened_at))
+                if state is CircuitState.OPEN
+                else 0.0
+            )
+            return {
+                "state": state.value,
+                "consecutive_failures": self._consecutive_failures,
+                "failure_threshold": self.failure_threshold,
+                "reset_timeout_seconds": self.reset_timeout,
+                "retry_in_seconds": round(retry_in, 3),
+                "times_opened": self._times_opened,
+                "rejected": self._rejected,
+            }
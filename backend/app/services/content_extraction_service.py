@@ -7,6 +7,9 @@ import re
 
 import requests
 
+from .adaptive_limiter import AdaptiveConcurrencyLimiter
+from .adaptive_limiter import is_overload_error
+
 logger = logging.getLogger(__name__)
 
 
@@ -20,24 +23,42 @@ class ContentExtractionService:
                 "AppleWebKit/537.36 (KHTML, like Gecko) Chrome/123.0 Safari/537.36"
             )
         }
+        # 抓取并发按上游超时和 429 自适应调整，所有研究任务共享
+        self.concurrency = AdaptiveConcurrencyLimiter.from_env("fetch")
 
     async def extract_content(self, url: str) -> str:
         if not url:
             return ""
-        return await asyncio.to_thread(self._extract_content_sync, url)
+        async with self.concurrency.slot() as slot:
+            try:
+                response = await asyncio.to_thread(self._fetch, url)
+            except requests.RequestException as exc:
+                logger.warning("内容抓取失败 %s: %s", url, exc)
+                if is_overload_error(exc):
+                    slot.mark_overloaded()
+                else:
+                    slot.mark_failed()
+                return ""
+        return self._normalize(response)
 
     def _extract_content_sync(self, url: str) -> str:
         try:
-            response = requests.get(
-                url,
-                headers=self.headers,
-                timeout=8,
-            )
-            response.raise_for_status()
+            response = self._fetch(url)
         except requests.RequestException as exc:
             logger.warning("内容抓取失败 %s: %s", url, exc)
             return ""
+        return self._normalize(response)
+
+    def _fetch(self, url: str) -> requests.Response:
+        response = requests.get(
+            url,
+            headers=self.headers,
+            timeout=8,
+        )
+        response.raise_for_status()
+        return response
 
+    def _normalize(self, response: requests.Response) -> str:
         content_type = response.headers.get("Content-Type", "")
         if "text/html" not in content_type:
             text = response.text.strip()
@@ -1,40 +1,38 @@
 import asyncio
+import json
 import logging
 import os
 import time
 from collections.abc import AsyncGenerator
 from dataclasses import dataclass
+from dataclasses import field
+from dataclasses import replace
 
+import httpx
 import requests
+from requests.adapters import HTTPAdapter
 from requests.exceptions import Timeout
 
+from ..utils.env import env_float
+from ..utils.env import env_int
 from ..utils.env import load_project_env
+from ..utils.tokens import estimate_tokens
+from .adaptive_limiter import AdaptiveConcurrencyLimiter
+from .adaptive_limiter import AdaptiveSlot
+from .circuit_breaker import CircuitBreaker
+from .circuit_breaker import CircuitState
+from .llm_cache import LLMResponseCache
+from .rate_limiter import LLMRateLimiter
+from .retry_policy import RetryClass
+from .retry_policy import RetryPolicy
+from .retry_policy import RetryStats
 
 load_project_env()
 
 logger = logging.getLogger(__name__)
 
 
-def _env_int(name: str, default: int) -> int:
-    raw = os.getenv(name)
-    if raw is None:
-        return default
-    try:
-        return int(raw)
-    except ValueError:
-        logger.warning("Invalid integer env %s=%r, using default %d", name, raw, default)
-        return default
-
-
-def _env_float(name: str, default: float) -> float:
-    raw = os.getenv(name)
-    if raw is None:
-        return default
-    try:
-        return float(raw)
-    except ValueError:
-        logger.warning("Invalid float env %s=%r, using default %.2f", name, raw, default)
-        return default
+DEFAULT_BASE_URL = "https://api.deepseek.com/v1"
 
 
 @dataclass(frozen=True)
@@ -43,26 +41,246 @@ class DeepSeekConfig:
     temperature: float
     max_output_tokens: int
     max_prompt_chars: int
+    max_connections: int = 20
+    max_keepalive_connections: int = 10
+    keepalive_expiry: float = 30.0
+    connect_timeout: float = 10.0
+    read_timeout: float = 90.0
+    base_url: str = DEFAULT_BASE_URL
 
     @classmethod
     def from_env(cls) -> "DeepSeekConfig":
         return cls(
             model=os.getenv("DEEPSEEK_MODEL", "deepseek-chat"),
-            temperature=_env_float("DEEPSEEK_TEMPERATURE", 0.7),
-            max_output_tokens=_env_int("DEEPSEEK_MAX_OUTPUT_TOKENS", 4_000),
-            max_prompt_chars=_env_int("DEEPSEEK_MAX_PROMPT_CHARS", 24_000),
+            temperature=env_float("DEEPSEEK_TEMPERATURE", 0.7),
+            max_output_tokens=env_int("DEEPSEEK_MAX_OUTPUT_TOKENS", 4_000),
+            max_prompt_chars=env_int("DEEPSEEK_MAX_PROMPT_CHARS", 24_000),
+            max_connections=env_int("DEEPSEEK_HTTP_MAX_CONNECTIONS", 20),
+            max_keepalive_connections=env_int("DEEPSEEK_HTTP_MAX_KEEPALIVE", 10),
+            keepalive_expiry=env_float("DEEPSEEK_HTTP_KEEPALIVE_EXPIRY", 30.0),
+            connect_timeout=env_float("DEEPSEEK_CONNECT_TIMEOUT", 10.0),
+            read_timeout=env_float("DEEPSEEK_READ_TIMEOUT", 90.0),
+            # 指向本地 OpenAI 兼容替身服务即可离线压测，见 llms/stand_in_server.py
+            base_url=(os.getenv("DEEPSEEK_BASE_URL") or DEFAULT_BASE_URL).rstrip("/"),
+        )
+
+
+# 各研究步骤的默认生成参数：JSON 小输出的步骤用较小的 max_tokens 和较短超时，
+# 避免单一的大 max_tokens 拉长尾延迟和成本。None 表示沿用 DeepSeekConfig。
+GENERATION_PROFILE_DEFAULTS: dict[str, dict[str, float | int | None]] = {
+    "query_planning": {"max_tokens": 800, "temperature": 0.3, "timeout": 30.0},
+    "context_compression": {"max_tokens": 1_500, "temperature": 0.3, "timeout": 60.0},
+    "verification": {"max_tokens": 400, "temperature": 0.0, "timeout": 30.0},
+    "context_verification": {"max_tokens": 1_800, "temperature": 0.2, "timeout": 60.0},
+    "report_writing": {"max_tokens": None, "temperature": 0.3, "timeout": None},
+    "section_drafting": {"max_tokens": 1_200, "temperature": 0.3, "timeout": 60.0},
+    "report_merge": {"max_tokens": 1_500, "temperature": 0.3, "timeout": 60.0},
+    "quick_answer": {"max_tokens": 500, "temperature": 0.3, "timeout": 20.0},
+}
+
+
+@dataclass(frozen=True)
+class GenerationProfile:
+    """Model and generation parameters used by one research step."""
+
+    name: str
+    model: str
+    max_tokens: int
+    temperature: float
+    timeout: float
+
+    @classmethod
+    def from_env(cls, name: str, config: DeepSeekConfig) -> "GenerationProfile":
+        """读取 DEEPSEEK_PROFILE_<STEP>_{MODEL,MAX_TOKENS,TEMPERATURE,TIMEOUT}。"""
+        defaults = GENERATION_PROFILE_DEFAULTS.get(name, {})
+        prefix = f"DEEPSEEK_PROFILE_{name.upper()}"
+        default_max_tokens = defaults.get("max_tokens") or config.max_output_tokens
+        default_temperature = defaults.get("temperature")
+        default_timeout = defaults.get("timeout") or config.read_timeout
+        return cls(
+            name=name,
+            model=os.getenv(f"{prefix}_MODEL") or config.model,
+            max_tokens=env_int(f"{prefix}_MAX_TOKENS", int(default_max_tokens)),
+            temperature=env_float(
+                f"{prefix}_TEMPERATURE",
+                config.temperature if default_temperature is None else float(default_temperature),
+            ),
+            timeout=env_float(f"{prefix}_TIMEOUT", float(default_timeout)),
         )
 
 
+@dataclass(frozen=True)
+class DeepSeekCompletion:
+    """A completed LLM call plus the metadata needed to explain its cost/latency."""
+
+    text: str
+    retries: int = 0
+    retry_backoff_seconds: float = 0.0
+    retry_reasons: dict[str, int] = field(default_factory=dict)
+    rate_limit_wait_seconds: float = 0.0
+    # "hit" 来自响应缓存，"miss" 未命中但已写入缓存，"off" 该步骤未启用缓存
+    cache_status: str = "off"
+    # True 表示复用了同一时刻另一个相同请求的结果（single-flight），没有单独计费
+    shared: bool = False
+    # 以下来自响应中的 usage 字段；为 None 表示服务端没有返回，需要估算
+    prompt_tokens: int | None = None
+    completion_tokens: int | None = None
+    prompt_cache_hit_tokens: int | None = None
+    prompt_cache_miss_tokens: int | None = None
+    latency_seconds: float = 0.0
+    # 响应中返回的实际模型；None 表示未知（缓存命中、流式），由调用方用请求的模型代替
+    model: str | None = None
+
+    @property
+    def has_usage(self) -> bool:
+        return self.prompt_tokens is not None and self.completion_tokens is not None
+
+    @property
+    def cached(self) -> bool:
+        return self.cache_status == "hit"
+
+
+@dataclass
+class _InFlight:
+    """一个正在进行的请求及等待它的调用方数量。"""
+
+    task: asyncio.Task[DeepSeekCompletion]
+    waiters: int = 0
+
+
+class DeepSeekAPIError(Exception):
+    """DeepSeek call failed after the retry policy gave up."""
+
+    def __init__(
+        self,
+        message: str,
+        *,
+        retry_class: RetryClass,
+        status_code: int | None = None,
+        retries: int = 0,
+        backoff_seconds: float = 0.0,
+    ) -> None:
+        super().__init__(message)
+        self.retry_class = retry_class
+        self.status_code = status_code
+        self.retries = retries
+        self.backoff_seconds = backoff_seconds
+
+
+class DeepSeekCircuitOpenError(DeepSeekAPIError):
+    """熔断器打开，调用未发出，调用方应直接走降级路径。"""
+
+
 class DeepSeekService:
-    def __init__(self, config: DeepSeekConfig | None = None) -> None:
+    def __init__(
+        self,
+        config: DeepSeekConfig | None = None,
+        *,
+        transport: httpx.AsyncBaseTransport | None = None,
+        retry_policy: RetryPolicy | None = None,
+        rate_limiter: LLMRateLimiter | None = None,
+        response_cache: LLMResponseCache | None = None,
+        circuit_breaker: CircuitBreaker | None = None,
+        concurrency: AdaptiveConcurrencyLimiter | None = None,
+    ) -> None:
         self.config = config or DeepSeekConfig.from_env()
+        self.retry_policy = retry_policy or RetryPolicy.from_env()
+        self.rate_limiter = rate_limiter or LLMRateLimiter.from_env()
+        self.response_cache = response_cache or LLMResponseCache.from_env()
+        self.circuit_breaker = circuit_breaker or CircuitBreaker.from_env("deepseek")
+        self.concurrency = concurrency or AdaptiveConcurrencyLimiter.from_env("llm")
         self.api_key = os.getenv("DEEPSEEK_API_KEY")
-        self.base_url = "https://api.deepseek.com/v1"
+        self.base_url = self.config.base_url
         self.headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json",
         }
+        self._transport = transport
+        self._async_client: httpx.AsyncClient | None = None
+        self._async_client_loop: asyncio.AbstractEventLoop | None = None
+        self._session: requests.Session | None = None
+        self._inflight: dict[str, _InFlight] = {}
+        self.profiles = {
+            name: GenerationProfile.from_env(name, self.config)
+            for name in GENERATION_PROFILE_DEFAULTS
+        }
+
+    # ── HTTP 连接池 ──
+
+    def _get_async_client(self) -> httpx.AsyncClient:
+        """返回绑定当前事件循环的共享 AsyncClient（keep-alive 连接池）。"""
+        loop = asyncio.get_running_loop()
+        client = self._async_client
+        if client is None or client.is_closed or self._async_client_loop is not loop:
+            client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers=self.headers,
+                limits=httpx.Limits(
+                    max_connections=self.config.max_connections,
+                    max_keepalive_connections=self.config.max_keepalive_connections,
+                    keepalive_expiry=self.config.keepalive_expiry,
+                ),
+                timeout=httpx.Timeout(
+                    self.config.read_timeout,
+                    connect=self.config.connect_timeout,
+                ),
+                transport=self._transport,
+            )
+            self._async_client = client
+            self._async_client_loop = loop
+        return client
+
+    def _get_session(self) -> requests.Session:
+        """同步路径共享的 requests.Session，复用 TCP/TLS 连接。"""
+        if self._session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=1,
+                pool_maxsize=self.config.max_connections,
+            )
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers.update(self.headers)
+            self._session = session
+        return self._session
+
+    def _sync_timeout(self, timeout: float | None = None) -> tuple[float, float]:
+        return (self.config.connect_timeout, timeout or self.config.read_timeout)
+
+    def _async_timeout(self, timeout: float | None) -> httpx.Timeout:
+        return httpx.Timeout(
+            timeout or self.config.read_timeout,
+            connect=self.config.connect_timeout,
+        )
+
+    def profile_for(self, step: str | None) -> GenerationProfile:
+        """返回步骤对应的生成参数；未配置的步骤使用全局默认值。"""
+        profile = self.profiles.get(step or "")
+        if profile is not None:
+            return profile
+        return GenerationProfile(
+            name=step or "default",
+            model=self.config.model,
+            max_tokens=self.config.max_output_tokens,
+            temperature=self.config.temperature,
+            timeout=self.config.read_timeout,
+        )
+
+    async def aclose(self) -> None:
+        """关闭连接池，供 FastAPI lifespan 退出时调用。"""
+        client = self._async_client
+        self._async_client = None
+        if client is not None and not client.is_closed:
+            try:
+                running_loop = asyncio.get_running_loop()
+            except RuntimeError:
+                running_loop = None
+            if self._async_client_loop is running_loop:
+                await client.aclose()
+        self._async_client_loop = None
+        if self._session is not None:
+            self._session.close()
+            self._session = None
 
     def _build_payload(
         self,
@@ -72,17 +290,73 @@ class DeepSeekService:
         *,
         model: str | None = None,
         temperature: float | None = None,
+        system_prompt: str | None = None,
+        json_mode: bool = False,
+        stop: list[str] | None = None,
     ) -> dict[str, object]:
         requested_max_tokens = max_tokens or self.config.max_output_tokens
-        return {
+        payload: dict[str, object] = {
             "model": model or self.config.model,
-            "messages": [{"role": "user", "content": prompt}],
+            "messages": self._build_messages(prompt, system_prompt),
             "max_tokens": min(requested_max_tokens, self.config.max_output_tokens),
             "temperature": (
                 self.config.temperature if temperature is None else temperature
             ),
             "stream": stream,
         }
+        if json_mode:
+            # JSON 模式：服务端保证输出合法 JSON 对象（提示词中需出现 "JSON" 字样）
+            payload["response_format"] = {"type": "json_object"}
+        if stop:
+            payload["stop"] = list(stop)
+        if stream:
+            # 让最后一个流式分片带上 usage，和非流式响应一样能拿到真实 token 数
+            payload["stream_options"] = {"include_usage": True}
+        return payload
+
+    @staticmethod
+    def _build_messages(prompt: str, system_prompt: str | None) -> list[dict[str, str]]:
+        """system 消息放在最前面：静态指令作为字节稳定的前缀，便于命中服务端前缀缓存。"""
+        messages: list[dict[str, str]] = []
+        if system_prompt:
+            messages.append({"role": "system", "content": system_prompt})
+        messages.append({"role": "user", "content": prompt})
+        return messages
+
+    @staticmethod
+    def _payload_text(payload: dict[str, object], role: str) -> str:
+        return "\n".join(
+            message["content"]
+            for message in payload["messages"]  # type: ignore[union-attr]
+            if message["role"] == role
+        )
+
+    def _extract_content(self, result: dict[str, object]) -> str:
+        return result["choices"][0]["message"]["content"]  # type: ignore[index]
+
+    @staticmethod
+    def _extract_model(result: dict[str, object], payload: dict[str, object]) -> str:
+        """响应中的 model 字段（实际计费的模型），缺失时退回请求的模型。"""
+        model = result.get("model")
+        return model if isinstance(model, str) and model else str(payload["model"])
+
+    @staticmethod
+    def _extract_usage(result: dict[str, object]) -> dict[str, int]:
+        """读取响应中的 usage 字段，缺失或格式不对的项直接忽略。"""
+        usage = result.get("usage")
+        if not isinstance(usage, dict):
+            return {}
+        parsed: dict[str, int] = {}
+        for name in (
+            "prompt_tokens",
+            "completion_tokens",
+            "prompt_cache_hit_tokens",
+            "prompt_cache_miss_tokens",
+        ):
+            value = usage.get(name)
+            if isinstance(value, int) and not isinstance(value, bool):
+                parsed[name] = value
+        return parsed
 
     def _truncate_prompt(self, prompt: str) -> str:
         if self.config.max_prompt_chars <= 0:
@@ -92,6 +366,277 @@ class DeepSeekService:
             logger.warning("提示词过长，已截断至 %d 字符", self.config.max_prompt_chars)
         return prompt
 
+    # ── 响应缓存 ──
+
+    def cache_status_for(self, step: str | None) -> str:
+        return "miss" if self.response_cache.enabled_for(step) else "off"
+
+    def _cache_key(self, step: str | None, payload: dict[str, object]) -> str | None:
+        if not self.response_cache.enabled_for(step):
+            return None
+        return self._payload_key(payload)
+
+    def _payload_key(self, payload: dict[str, object]) -> str:
+        return LLMResponseCache.make_key(
+            model=str(payload["model"]),
+            temperature=float(payload["temperature"]),  # type: ignore[arg-type]
+            max_tokens=int(payload["max_tokens"]),  # type: ignore[arg-type]
+            prompt=self._payload_text(payload, "user"),
+            system_prompt=self._payload_text(payload, "system"),
+            options={
+                name: payload[name] for name in ("response_format", "stop") if name in payload
+            },
+        )
+
+    async def cached_completion(
+        self,
+        prompt: str,
+        max_tokens: int | None = None,
+        *,
+        model: str | None = None,
+        temperature: float | None = None,
+        system_prompt: str | None = None,
+        json_mode: bool = False,
+        stop: list[str] | None = None,
+        step: str | None = None,
+    ) -> DeepSeekCompletion | None:
+        """查询响应缓存，命中时返回 cache_status="hit" 的结果，否则返回 None。"""
+        payload = self._build_payload(
+            self._truncate_prompt(prompt),
+            max_tokens,
+            stream=False,
+            model=model,
+            temperature=temperature,
+            system_prompt=system_prompt,
+            json_mode=json_mode,
+            stop=stop,
+        )
+        return await self._alookup_cache(self._cache_key(step, payload))
+
+    def _lookup_cache(self, cache_key: str | None) -> DeepSeekCompletion | None:
+        if cache_key is None:
+            return None
+        return self._cache_hit(cache_key, self.response_cache.get(cache_key))
+
+    async def _alookup_cache(self, cache_key: str | None) -> DeepSeekCompletion | None:
+        """异步路径使用：缓存的 SQLite 层在线程中读取，不阻塞事件循环。"""
+        if cache_key is None:
+            return None
+        return self._cache_hit(cache_key, await self.response_cache.aget(cache_key))
+
+    @staticmethod
+    def _cache_hit(cache_key: str, text: str | None) -> DeepSeekCompletion | None:
+        if text is None:
+            return None
+        logger.debug("LLM 响应缓存命中: %s", cache_key[:12])
+        return DeepSeekCompletion(text=text, cache_status="hit")
+
+    def _store_cache(self, cache_key: str | None, text: str) -> None:
+        if cache_key is not None:
+            self.response_cache.put(cache_key, text)
+
+    async def _astore_cache(self, cache_key: str | None, text: str) -> None:
+        if cache_key is not None:
+            await self.response_cache.aput(cache_key, text)
+
+    # ── 熔断 ──
+
+    def _circuit_open_error(self, stats: RetryStats) -> DeepSeekCircuitOpenError:
+        return DeepSeekCircuitOpenError(
+            "DeepSeek circuit breaker is open",
+            retry_class=RetryClass.CONNECTION_ERROR,
+            retries=stats.retries,
+            backoff_seconds=stats.backoff_seconds,
+        )
+
+    def _record_attempt_failure(self, retry_class: RetryClass) -> None:
+        # 4xx（除 429/408）说明服务可达，是请求本身的问题，不计入熔断
+        if retry_class is RetryClass.CLIENT_ERROR:
+            self.circuit_breaker.record_success()
+        else:
+            self.circuit_breaker.record_failure()
+
+    # ── 重试 ──
+
+    def _next_retry_delay(
+        self,
+        retry_class: RetryClass,
+        error: Exception,
+        stats: RetryStats,
+        *,
+        status_code: int | None = None,
+        retry_after: float | None = None,
+    ) -> float:
+        """计算下一次重试前的等待时间；重试预算耗尽时抛出 DeepSeekAPIError。
+
+        每次失败都计入熔断器；熔断器因此打开时不再重试，直接抛出
+        DeepSeekCircuitOpenError。
+        """
+        self._record_attempt_failure(retry_class)
+        if self.circuit_breaker.state is CircuitState.OPEN:
+            logger.error("DeepSeek 熔断器已打开，放弃重试: %s", error)
+            raise DeepSeekCircuitOpenError(
+                str(error),
+                retry_class=retry_class,
+                status_code=status_code,
+                retries=stats.retries,
+                backoff_seconds=stats.backoff_seconds,
+            ) from error
+        delay = self.retry_policy.next_delay(
+            retry_class,
+            stats.count(retry_class),
+            retry_after,
+        )
+        if delay is None:
+            logger.error("DeepSeek 调用失败（%s），不再重试: %s", retry_class.value, error)
+            raise DeepSeekAPIError(
+                str(error),
+                retry_class=retry_class,
+                status_code=status_code,
+                retries=stats.retries,
+                backoff_seconds=stats.backoff_seconds,
+            ) from error
+        stats.record(retry_class, delay)
+        logger.warning(
+            "DeepSeek 调用失败（%s），%.2f 秒后第 %d 次重试: %s",
+            retry_class.value,
+            delay,
+            stats.retries,
+            error,
+        )
+        return delay
+
+    def _status_error(self, status_code: int, body: str) -> DeepSeekAPIError:
+        return DeepSeekAPIError(
+            f"DeepSeek API error: {status_code} - {body}",
+            retry_class=self.retry_policy.classify_status(status_code),
+            status_code=status_code,
+        )
+
+    def _record_slot(self, slot: AdaptiveSlot, status_code: int, latency: float) -> None:
+        """把单次 HTTP 结果反馈给自适应并发控制：429/503 降窗口，其余错误只计入错误率。"""
+        if status_code == 200:
+            slot.mark_success(latency)
+        elif status_code in (429, 503):
+            slot.mark_overloaded()
+        else:
+            slot.mark_failed()
+
+    def _completion(
+        self,
+        text: str,
+        stats: RetryStats,
+        rate_limit_wait_seconds: float = 0.0,
+        *,
+        cache_key: str | None = None,
+        usage: dict[str, int] | None = None,
+        latency_seconds: float = 0.0,
+        model: str | None = None,
+    ) -> DeepSeekCompletion:
+        usage = usage or {}
+        return DeepSeekCompletion(
+            text=text,
+            retries=stats.retries,
+            retry_backoff_seconds=round(stats.backoff_seconds, 3),
+            retry_reasons=dict(stats.by_class),
+            rate_limit_wait_seconds=round(rate_limit_wait_seconds, 3),
+            cache_status="off" if cache_key is None else "miss",
+            prompt_tokens=usage.get("prompt_tokens"),
+            completion_tokens=usage.get("completion_tokens"),
+            prompt_cache_hit_tokens=usage.get("prompt_cache_hit_tokens"),
+            prompt_cache_miss_tokens=usage.get("prompt_cache_miss_tokens"),
+            latency_seconds=round(latency_seconds, 3),
+            model=model,
+        )
+
+    def complete_sync(
+        self,
+        prompt: str,
+        max_tokens: int | None = None,
+        *,
+        model: str | None = None,
+        temperature: float | None = None,
+        system_prompt: str | None = None,
+        json_mode: bool = False,
+        stop: list[str] | None = None,
+        step: str | None = None,
+        timeout: float | None = None,
+    ) -> DeepSeekCompletion:
+        """同步调用 DeepSeek，供同步 LangChain 路径使用。
+
+        进程级限流器基于 asyncio，只作用于异步路径；研究流程全部走异步路径。
+        """
+        logger.debug("开始生成响应，提示词长度: %d", len(prompt))
+
+        if not self.api_key:
+            raise ValueError("DeepSeek API key not found")
+
+        prompt = self._truncate_prompt(prompt)
+        payload = self._build_payload(
+            prompt,
+            max_tokens,
+            stream=False,
+            model=model,
+            temperature=temperature,
+            system_prompt=system_prompt,
+            json_mode=json_mode,
+            stop=stop,
+        )
+        cache_key = self._cache_key(step, payload)
+        cached = self._lookup_cache(cache_key)
+        if cached is not None:
+            return cached
+
+        stats = RetryStats()
+        while True:
+            with self.circuit_breaker.probe() as allowed:
+                if not allowed:
+                    raise self._circuit_open_error(stats)
+                try:
+                    start_time = time.time()
+                    response = self._get_session().post(
+                        f"{self.base_url}/chat/completions",
+                        json=payload,
+                        timeout=self._sync_timeout(timeout),
+                    )
+                    latency = time.time() - start_time
+                    logger.debug(
+                        "API 响应时间: %.2f 秒，状态码: %d",
+                        latency,
+                        response.status_code,
+                    )
+                    if response.status_code == 200:
+                        self.circuit_breaker.record_success()
+                        result = response.json()
+                        response_content = self._extract_content(result)
+                        logger.debug("API 调用成功，响应长度: %d 字符", len(response_content))
+                        self._store_cache(cache_key, response_content)
+                        return self._completion(
+                            response_content,
+                            stats,
+                            cache_key=cache_key,
+                            usage=self._extract_usage(result),
+                            latency_seconds=latency,
+                            model=self._extract_model(result, payload),
+                        )
+                    error = self._status_error(response.status_code, response.text)
+                    delay = self._next_retry_delay(
+                        error.retry_class,
+                        error,
+                        stats,
+                        status_code=response.status_code,
+                        retry_after=self.retry_policy.parse_retry_after(
+                            response.headers.get("Retry-After")
+                        ),
+                    )
+                except Timeout as exc:
+                    delay = self._next_retry_delay(RetryClass.TIMEOUT, exc, stats)
+                except requests.ConnectionError as exc:
+                    delay = self._next_retry_delay(RetryClass.CONNECTION_ERROR, exc, stats)
+                except (ValueError, KeyError, IndexError, TypeError) as exc:
+                    delay = self._next_retry_delay(RetryClass.SERVER_ERROR, exc, stats)
+            time.sleep(delay)
+
     def generate_response_sync(
         self,
         prompt: str,
@@ -99,8 +644,41 @@ class DeepSeekService:
         *,
         model: str | None = None,
         temperature: float | None = None,
+        system_prompt: str | None = None,
+        json_mode: bool = False,
+        stop: list[str] | None = None,
     ) -> str:
-        """同步调用 DeepSeek，供同步 LangChain 路径和线程池包装使用。"""
+        """同步调用 DeepSeek，只返回文本。"""
+        return self.complete_sync(
+            prompt,
+            max_tokens,
+            model=model,
+            temperature=temperature,
+            system_prompt=system_prompt,
+            json_mode=json_mode,
+            stop=stop,
+        ).text
+
+    async def complete(
+        self,
+        prompt: str,
+        max_tokens: int | None = None,
+        *,
+        model: str | None = None,
+        temperature: float | None = None,
+        system_prompt: str | None = None,
+        json_mode: bool = False,
+        stop: list[str] | None = None,
+        step: str | None = None,
+        timeout: float | None = None,
+    ) -> DeepSeekCompletion:
+        """原生异步调用，复用共享连接池，重试等待不占用线程。
+
+        相同请求（模型、温度、max_tokens、提示词一致）正在进行时，后来的调用方
+        等待同一个结果而不是再发一次 HTTP 请求；某个等待方被取消不会影响其他
+        等待方，只有所有等待方都离开时才取消底层请求。
+        timeout 是单次 HTTP 请求的读取超时（来自步骤的生成配置），不含重试等待。
+        """
         logger.debug("开始生成响应，提示词长度: %d", len(prompt))
 
         if not self.api_key:
@@ -113,51 +691,119 @@ class DeepSeekService:
             stream=False,
             model=model,
             temperature=temperature,
+            system_prompt=system_prompt,
+            json_mode=json_mode,
+            stop=stop,
         )
+        cache_key = self._cache_key(step, payload)
+        cached = await self._alookup_cache(cache_key)
+        if cached is not None:
+            return cached
 
-        max_retries = 2
-        response: requests.Response | None = None
-        for attempt in range(max_retries + 1):
-            try:
-                logger.debug("API 调用尝试 %d/%d", attempt + 1, max_retries + 1)
-                start_time = time.time()
-                response = requests.post(
-                    f"{self.base_url}/chat/completions",
-                    headers=self.headers,
-                    json=payload,
-                    timeout=90,
+        flight_key = cache_key or self._payload_key(payload)
+        loop = asyncio.get_running_loop()
+        entry = self._inflight.get(flight_key)
+        shared = entry is not None and entry.task.get_loop() is loop
+        if not shared:
+            entry = _InFlight(
+                task=loop.create_task(
+                    self._request_completion(payload, cache_key, timeout)
                 )
-                elapsed = time.time() - start_time
-                logger.debug("API 响应时间: %.2f 秒，状态码: %d", elapsed, response.status_code)
-
-                if response.status_code != 200:
-                    logger.error("API 错误响应: %s", response.text)
-                    if attempt == max_retries:
-                        break
-                    time.sleep(2)
-                    continue
-
-                result = response.json()
-                response_content = result["choices"][0]["message"]["content"]
-                logger.debug("API 调用成功，响应长度: %d 字符", len(response_content))
-                return response_content
-            except Timeout:
-                if attempt == max_retries:
-                    logger.error("API 请求超时，已重试多次")
-                    raise Timeout("DeepSeek API request timed out")
-                logger.warning("请求超时，将重试... (%d/%d)", attempt + 1, max_retries)
-                time.sleep(2)
-            except Exception as e:
-                if attempt == max_retries:
-                    logger.error("API 连接失败: %s", e)
-                    raise
-                logger.warning("连接失败，将重试... (%d/%d)", attempt + 1, max_retries)
-                time.sleep(2)
-
-        if response is None:
-            raise RuntimeError("DeepSeek API request failed before receiving a response")
-
-        raise Exception(f"DeepSeek API error: {response.status_code} - {response.text}")
+            )
+            self._inflight[flight_key] = entry
+            entry.task.add_done_callback(
+                lambda _task, key=flight_key, owner=entry: self._finish_flight(key, owner)
+            )
+        else:
+            logger.debug("合并相同的进行中 LLM 请求: %s", flight_key[:12])
+
+        entry.waiters += 1
+        try:
+            completion = await asyncio.shield(entry.task)
+        finally:
+            entry.waiters -= 1
+            if entry.waiters == 0 and not entry.task.done():
+                # 最后一个等待方也离开了：取消底层请求，并让后来者重新发起
+                if self._inflight.get(flight_key) is entry:
+                    del self._inflight[flight_key]
+                entry.task.cancel()
+        return replace(completion, shared=True) if shared else completion
+
+    def _finish_flight(self, key: str, entry: _InFlight) -> None:
+        if self._inflight.get(key) is entry:
+            del self._inflight[key]
+        if not entry.task.cancelled():
+            # 所有等待方都已取消时异常无人读取，这里取走避免 "never retrieved" 警告
+            entry.task.exception()
+
+    async def _request_completion(
+        self,
+        payload: dict[str, object],
+        cache_key: str | None,
+        timeout: float | None = None,
+    ) -> DeepSeekCompletion:
+        client = self._get_async_client()
+        prompt_tokens = estimate_tokens(
+            self._payload_text(payload, "system") + self._payload_text(payload, "user")
+        )
+
+        stats = RetryStats()
+        waited = 0.0
+        while True:
+            with self.circuit_breaker.probe() as allowed:
+                if not allowed:
+                    raise self._circuit_open_error(stats)
+                try:
+                    async with (
+                        self.concurrency.slot() as slot,
+                        self.rate_limiter.acquire(prompt_tokens) as queue_wait,
+                    ):
+                        waited += queue_wait
+                        start_time = time.time()
+                        response = await client.post(
+                            "/chat/completions",
+                            json=payload,
+                            timeout=self._async_timeout(timeout),
+                        )
+                        latency = time.time() - start_time
+                        self._record_slot(slot, response.status_code, latency)
+                    logger.debug(
+                        "API 响应时间: %.2f 秒，状态码: %d",
+                        latency,
+                        response.status_code,
+                    )
+                    if response.status_code == 200:
+                        self.circuit_breaker.record_success()
+                        result = response.json()
+                        response_content = self._extract_content(result)
+                        logger.debug("API 调用成功，响应长度: %d 字符", len(response_content))
+                        await self._astore_cache(cache_key, response_content)
+                        return self._completion(
+                            response_content,
+                            stats,
+                            waited,
+                            cache_key=cache_key,
+                            usage=self._extract_usage(result),
+                            latency_seconds=latency,
+                            model=self._extract_model(result, payload),
+                        )
+                    error = self._status_error(response.status_code, response.text)
+                    delay = self._next_retry_delay(
+                        error.retry_class,
+                        error,
+                        stats,
+                        status_code=response.status_code,
+                        retry_after=self.retry_policy.parse_retry_after(
+                            response.headers.get("Retry-After")
+                        ),
+                    )
+                except httpx.TimeoutException as exc:
+                    delay = self._next_retry_delay(RetryClass.TIMEOUT, exc, stats)
+                except httpx.TransportError as exc:
+                    delay = self._next_retry_delay(RetryClass.CONNECTION_ERROR, exc, stats)
+                except (ValueError, KeyError, IndexError, TypeError) as exc:
+                    delay = self._next_retry_delay(RetryClass.SERVER_ERROR, exc, stats)
+            await asyncio.sleep(delay)
 
     async def generate_response(
         self,
@@ -166,15 +812,21 @@ class DeepSeekService:
         *,
         model: str | None = None,
         temperature: float | None = None,
+        system_prompt: str | None = None,
+        json_mode: bool = False,
+        stop: list[str] | None = None,
     ) -> str:
-        """异步包装，避免阻塞事件循环。"""
-        return await asyncio.to_thread(
-            self.generate_response_sync,
+        """异步调用 DeepSeek，只返回文本。"""
+        completion = await self.complete(
             prompt,
             max_tokens,
             model=model,
             temperature=temperature,
+            system_prompt=system_prompt,
+            json_mode=json_mode,
+            stop=stop,
         )
+        return completion.text
 
     async def stream_response(
         self,
@@ -183,8 +835,22 @@ class DeepSeekService:
         *,
         model: str | None = None,
         temperature: float | None = None,
+        system_prompt: str | None = None,
+        json_mode: bool = False,
+        stop: list[str] | None = None,
+        retry_stats: RetryStats | None = None,
+        step: str | None = None,
+        timeout: float | None = None,
+        usage: dict[str, int] | None = None,
     ) -> AsyncGenerator[str, None]:
-        """流式生成回复"""
+        """流式生成回复，收到每个 SSE 分片后立即产出增量文本。
+
+        只在收到首个分片之前重试；已经产出内容后失败直接抛出，避免重复输出。
+        传入 retry_stats 时会把重试次数和等待时间写回，供调用方统计；传入 usage
+        字典时写入末尾分片携带的 token 用量。
+        step 启用了响应缓存时，完整收到的回复会写入缓存；查询缓存由调用方
+        通过 cached_completion 完成。
+        """
         if not self.api_key:
             raise ValueError("DeepSeek API key not found")
 
@@ -195,24 +861,96 @@ class DeepSeekService:
             stream=True,
             model=model,
             temperature=temperature,
+            system_prompt=system_prompt,
+            json_mode=json_mode,
+            stop=stop,
         )
+        cache_key = self._cache_key(step, payload)
+        client = self._get_async_client()
+        stats = retry_stats if retry_stats is not None else RetryStats()
+        prompt_tokens = estimate_tokens((system_prompt or "") + prompt)
 
-        def _stream_lines() -> list[str]:
-            response = requests.post(
-                f"{self.base_url}/chat/completions",
-                headers=self.headers,
-                json=payload,
-                stream=True,
-                timeout=90,
-            )
-            if response.status_code != 200:
-                raise Exception(
-                    f"DeepSeek API error: {response.status_code} - {response.text}"
-                )
-            return [line.decode("utf-8") for line in response.iter_lines() if line]
+        while True:
+            with self.circuit_breaker.probe() as allowed:
+                if not allowed:
+                    raise self._circuit_open_error(stats)
+                started = False
+                parts: list[str] = []
+                try:
+                    async with (
+                        self.concurrency.slot() as slot,
+                        self.rate_limiter.acquire(prompt_tokens),
+                    ):
+                        start_time = time.time()
+                        async with client.stream(
+                            "POST",
+                            "/chat/completions",
+                            json=payload,
+                            timeout=self._async_timeout(timeout),
+                        ) as response:
+                            # 流式调用按首字节延迟判断上游是否健康
+                            self._record_slot(slot, response.status_code, time.time() - start_time)
+                            if response.status_code == 200:
+                                self.circuit_breaker.record_success()
+                                async for line in response.aiter_lines():
+                                    if not line.startswith("data:"):
+                                        continue
+                                    data = line[len("data:"):].strip()
+                                    if data == "[DONE]":
+                                        break
+                                    chunk = self._parse_stream_chunk(data)
+                                    if usage is not None:
+                                        usage.update(self._extract_usage(chunk))
+                                    delta = self._extract_stream_delta(chunk)
+                                    if delta:
+                                        started = True
+                                        parts.append(delta)
+                                        yield delta
+                                await self._astore_cache(cache_key, "".join(parts))
+                                return
+                            body = (await response.aread()).decode("utf-8", errors="replace")
+                            error = self._status_error(response.status_code, body)
+                            retry_after = self.retry_policy.parse_retry_after(
+                                response.headers.get("Retry-After")
+                            )
+                    delay = self._next_retry_delay(
+                        error.retry_class,
+                        error,
+                        stats,
+                        status_code=error.status_code,
+                        retry_after=retry_after,
+                    )
+                except (httpx.TimeoutException, httpx.TransportError) as exc:
+                    retry_class = (
+                        RetryClass.TIMEOUT
+                        if isinstance(exc, httpx.TimeoutException)
+                        else RetryClass.CONNECTION_ERROR
+                    )
+                    if started:
+                        self.circuit_breaker.record_failure()
+                        raise DeepSeekAPIError(
+                            f"DeepSeek stream interrupted: {exc}",
+                            retry_class=retry_class,
+                            retries=stats.retries,
+                            backoff_seconds=stats.backoff_seconds,
+                        ) from exc
+                    delay = self._next_retry_delay(retry_class, exc, stats)
+            await asyncio.sleep(delay)
+
+    def _parse_stream_chunk(self, data: str) -> dict[str, object]:
+        try:
+            chunk = json.loads(data)
+        except json.JSONDecodeError:
+            logger.debug("忽略无法解析的流式分片: %r", data[:200])
+            return {}
+        return chunk if isinstance(chunk, dict) else {}
 
-        for line in await asyncio.to_thread(_stream_lines):
-            yield line
+    def _extract_stream_delta(self, chunk: dict[str, object]) -> str:
+        try:
+            return chunk["choices"][0]["delta"].get("content") or ""  # type: ignore[index]
+        except (KeyError, IndexError, TypeError, AttributeError):
+            # 末尾的 usage 分片 choices 为空
+            return ""
 
 
 # 全局实例
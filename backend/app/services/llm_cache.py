@@ -0,0 +1,248 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from ..utils.env import env_int
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DB_PATH = Path(__file__).resolve().parents[2] / "data" / "llm_cache.db"
+
+CACHEABLE_STEPS = (
+    "query_planning",
+    "context_compression",
+    "verification",
+    "context_verification",
+    "report_writing",
+    "section_drafting",
+    "report_merge",
+)
+
+
+class LLMResponseCache:
+    """Two-tier cache for deterministic LLM prompts: memory LRU + SQLite with TTL.
+
+    Opt-in via ``DEEPSEEK_CACHE_ENABLED``; individual pipeline steps can be
+    enabled with ``DEEPSEEK_CACHE_STEPS``. Keys are content hashes, so any
+    change to model, temperature, max_tokens, output options (JSON mode,
+    stop sequences) or system/user prompt is a miss. Async callers use
+    ``aget``/``aput``, which keep the memory tier inline and run the SQLite
+    tier in a worker thread so the event loop never waits on disk.
+    """
+
+    def __init__(
+        self,
+        *,
+        enabled: bool = False,
+        steps: frozenset[str] = frozenset(CACHEABLE_STEPS),
+        memory_max_bytes: int = 32 * 1024 * 1024,
+        db_path: str | None = None,
+        ttl_seconds: float = 24 * 3600,
+    ) -> None:
+        self.enabled = enabled
+        self.steps = steps
+        self.memory_max_bytes = memory_max_bytes
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self._memory: OrderedDict[str, str] = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._db_ready = False
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls) -> "LLMResponseCache":
+        raw_steps = os.getenv("DEEPSEEK_CACHE_STEPS")
+        steps = (
+            frozenset(item.strip() for item in raw_steps.split(",") if item.strip())
+            if raw_steps is not None
+            else frozenset(CACHEABLE_STEPS)
+        )
+        db_path = os.getenv("DEEPSEEK_CACHE_DB_PATH", str(DEFAULT_CACHE_DB_PATH))
+        return cls(
+            enabled=os.getenv("DEEPSEEK_CACHE_ENABLED", "").lower() in {"1", "true", "yes"},
+            steps=steps,
+            memory_max_bytes=env_int("DEEPSEEK_CACHE_MEMORY_MAX_BYTES", 32 * 1024 * 1024),
+            db_path=db_path or None,
+            ttl_seconds=float(env_int("DEEPSEEK_CACHE_TTL_SECONDS", 24 * 3600)),
+        )
+
+    @staticmethod
+    def make_key(
+        *,
+        model: str,
+        temperature: float,
+        max_tokens: int,
+        prompt: str,
+        system_prompt: str = "",
+        options: dict[str, object] | None = None,
+    ) -> str:
+        parts: list[object] = [
+            model, round(float(temperature), 4), int(max_tokens), system_prompt, prompt
+        ]
+        if options:
+            # response_format / stop 等会改变输出的参数；为空时不参与，保持旧键不变
+            parts.append(options)
+        material = json.dumps(parts, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def enabled_for(self, step: str | None) -> bool:
+        return self.enabled and step is not None and step in self.steps
+
+    def get(self, key: str) -> str | None:
+        value = self._memory_get(key)
+        if value is not None:
+            return value
+        return self._disk_result(key, self._disk_get(key))
+
+    async def aget(self, key: str) -> str | None:
+        """get 的异步版本：内存命中直接返回，SQLite 查询放到线程中，不阻塞事件循环。"""
+        value = self._memory_get(key)
+        if value is not None:
+            return value
+        if self.db_path is None:
+            return self._disk_result(key, None)
+        return self._disk_result(key, await asyncio.to_thread(self._disk_get, key))
+
+    def put(self, key: str, value: str) -> None:
+        if not value:
+            return
+        with self._lock:
+            self._memory_put(key, value)
+        self._disk_put(key, value)
+
+    async def aput(self, key: str, value: str) -> None:
+        """put 的异步版本：内存立即写入，SQLite 写入放到线程中。"""
+        if not value:
+            return
+        with self._lock:
+            self._memory_put(key, value)
+        if self.db_path is not None:
+            await asyncio.to_thread(self._disk_put, key, value)
+
+    def snapshot(self) -> dict[str, object]:
+        return {
+            "enabled": self.enabled,
+            "steps": sorted(self.steps),
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    # ── memory tier ──
+
+    def _memory_get(self, key: str) -> str | None:
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+            return value
+
+    def _disk_result(self, key: str, value: str | None) -> str | None:
+        """统计磁盘层的查询结果，命中时回填内存层。"""
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._memory_put(key, value)
+        return value
+
+    def _memory_put(self, key: str, value: str) -> None:
+        size = _entry_size(key, value)
+        if size > self.memory_max_bytes:
+            return
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_bytes -= _entry_size(key, previous)
+        self._memory[key] = value
+        self._memory_bytes += size
+        while self._memory_bytes > self.memory_max_bytes and self._memory:
+            evicted_key, evicted_value = self._memory.popitem(last=False)
+            self._memory_bytes -= _entry_size(evicted_key, evicted_value)
+
+    # ── SQLite tier ──
+
+    def _ensure_db(self) -> bool:
+        if self.db_path is None:
+            return False
+        if self._db_ready:
+            return True
+        try:
+            Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+            with sqlite3.connect(self.db_path) as conn:
+                conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS llm_cache (
+                        key TEXT PRIMARY KEY,
+                        value TEXT NOT NULL,
+                        created_at REAL NOT NULL,
+                        expires_at REAL NOT NULL
+                    )
+                    """
+                )
+                conn.commit()
+        except sqlite3.Error as exc:
+            logger.warning("LLM 缓存数据库不可用，仅使用内存缓存: %s", exc)
+            self.db_path = None
+            return False
+        self._db_ready = True
+        return True
+
+    def _disk_get(self, key: str) -> str | None:
+        if not self._ensure_db():
+            return None
+        now = time.time()
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                row = conn.execute(
+                    "SELECT value, expires_at FROM llm_cache WHERE key = ?",
+                    (key,),
+                ).fetchone()
+                if row is None:
+                    return None
+                if row[1] <= now:
+                    conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                    conn.commit()
+                    return None
+                return str(row[0])
+        except sqlite3.Error as exc:
+            logger.warning("读取 LLM 缓存失败: %s", exc)
+            return None
+
+    def _disk_put(self, key: str, value: str) -> None:
+        if not self._ensure_db():
+            return
+        now = time.time()
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                conn.execute(
+                    """
+                    INSERT INTO llm_cache (key, value, created_at, expires_at)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT(key) DO UPDATE SET
+                        value=excluded.value,
+                        created_at=excluded.created_at,
+                        expires_at=excluded.expires_at
+                    """,
+                    (key, value, now, now + self.ttl_seconds),
+                )
+                conn.commit()
+        except sqlite3.Error as exc:
+            logger.warning("写入 LLM 缓存失败: %s", exc)
+
+
+def _entry_size(key: str, value: str) -> int:
+    return len(key) + len(value.encode("utf-8"))
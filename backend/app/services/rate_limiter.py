@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import deque
+from collections.abc import AsyncIterator
+from collections.abc import Callable
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+
+from ..utils.env import env_float
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Waiter:
+    tokens: float
+    future: asyncio.Future[None]
+    enqueued_at: float
+
+
+class TokenBucket:
+    """Continuous-refill bucket; ``rate_per_minute <= 0`` disables the limit."""
+
+    def __init__(self, rate_per_minute: float, capacity: float, now: float) -> None:
+        self.rate_per_second = max(rate_per_minute, 0.0) / 60
+        self.capacity = max(capacity, 1.0)
+        self.level = self.capacity
+        self.updated_at = now
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate_per_second > 0
+
+    def refill(self, now: float) -> None:
+        if not self.enabled:
+            return
+        elapsed = max(0.0, now - self.updated_at)
+        self.level = min(self.capacity, self.level + elapsed * self.rate_per_second)
+        self.updated_at = now
+
+    def clamp(self, amount: float) -> float:
+        # 单次请求超过桶容量时按容量计，否则永远无法放行
+        return min(amount, self.capacity)
+
+    def seconds_until(self, amount: float) -> float:
+        if not self.enabled or self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate_per_second
+
+    def consume(self, amount: float) -> None:
+        if self.enabled:
+            self.level -= amount
+
+
+class LLMRateLimiter:
+    """Process-wide limiter for LLM calls: requests/min, tokens/min and in-flight cap.
+
+    Waiters are served strictly FIFO, so a large prompt at the head of the queue
+    is not starved by smaller ones arriving later. Callers wait for capacity;
+    nothing is rejected.
+    """
+
+    def __init__(
+        self,
+        *,
+        requests_per_minute: float = 0,
+        tokens_per_minute: float = 0,
+        max_in_flight: int = 0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_in_flight = max_in_flight
+        self._clock = clock
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._reset()
+
+    @classmethod
+    def from_env(cls) -> "LLMRateLimiter":
+        return cls(
+            requests_per_minute=env_float("DEEPSEEK_RATE_LIMIT_RPM", 240),
+            tokens_per_minute=env_float("DEEPSEEK_RATE_LIMIT_TPM", 0),
+            max_in_flight=int(env_float("DEEPSEEK_MAX_IN_FLIGHT", 16)),
+        )
+
+    def _reset(self) -> None:
+        now = self._clock()
+        self._requests = TokenBucket(self.requests_per_minute, self.requests_per_minute, now)
+        self._tokens = TokenBucket(self.tokens_per_minute, self.tokens_per_minute, now)
+        self._waiters: deque[_Waiter] = deque()
+        self._in_flight = 0
+        self._wakeup: asyncio.TimerHandle | None = None
+        self._granted = 0
+        self._total_wait_seconds = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(1 for waiter in self._waiters if not waiter.future.done())
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def snapshot(self) -> dict[str, object]:
+        return {
+            "requests_per_minute": self.requests_per_minute,
+            "tokens_per_minute": self.tokens_per_minute,
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self._in_flight,
+            "queue_depth": self.queue_depth,
+            "granted": self._granted,
+            "total_wait_seconds": round(self._total_wait_seconds, 3),
+        }
+
+    @asynccontextmanager
+    async def acquire(self, tokens: int = 0) -> AsyncIterator[float]:
+        """占用一个调用名额，返回排队等待的秒数。"""
+        waited = await self._acquire(tokens)
+        try:
+            yield waited
+        finally:
+            self._release()
+
+    async def _acquire(self, tokens: int) -> float:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # 事件循环变化（如测试中多次 asyncio.run）时旧的等待者已失效
+            self._loop = loop
+            self._reset()
+
+        started_at = self._clock()
+        waiter = _Waiter(
+            tokens=self._tokens.clamp(float(max(tokens, 0))),
+            future=loop.create_future(),
+            enqueued_at=started_at,
+        )
+        self._waiters.append(waiter)
+        self._dispatch()
+        if not waiter.future.done():
+            logger.debug("LLM 限流排队，当前队列深度 %d", self.queue_depth)
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # 已获得名额但调用方被取消，归还名额
+                self._release()
+            else:
+                self._discard(waiter)
+            raise
+        waited = self._clock() - started_at
+        self._total_wait_seconds += waited
+        return waited
+
+    def _release(self) -> None:
+        self._in_flight = max(0, self._in_flight - 1)
+        self._dispatch()
+
+    def _discard(self, waiter: _Waiter) -> None:
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        if self._wakeup is not None:
+            self._wakeup.cancel()
+            self._wakeup = None
+
+        now = self._clock()
+        self._requests.refill(now)
+        self._tokens.refill(now)
+        while self._waiters:
+            head = self._waiters[0]
+            if head.future.done():
+                self._waiters.popleft()
+                continue
+            if self.max_in_flight > 0 and self._in_flight >= self.max_in_flight:
+                return  # 等待 release 触发下一次调度
+            delay = max(
+                self._requests.seconds_until(1),
+                self._tokens.seconds_until(head.tokens),
+            )
+            if delay > 0:
+                if self._loop is not None:
+                    self._wakeup = self._loop.call_later(delay, self._dispatch)
+                return
+            self._requests.consume(1)
+            self._tokens.consume(head.tokens)
+            self._in_flight += 1
+            self._granted += 1
+            self._waiters.popleft()
+            head.future.set_result(None)
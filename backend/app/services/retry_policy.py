@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+import logging
+import random
+from dataclasses import dataclass
+from dataclasses import field
+from datetime import datetime
+from datetime import timezone
+from email.utils import parsedate_to_datetime
+from enum import Enum
+
+from ..utils.env import env_float
+from ..utils.env import env_int
+
+logger = logging.getLogger(__name__)
+
+
+class RetryClass(str, Enum):
+    CLIENT_ERROR = "client_error"
+    RATE_LIMITED = "rate_limited"
+    SERVER_ERROR = "server_error"
+    TIMEOUT = "timeout"
+    CONNECTION_ERROR = "connection_error"
+
+
+@dataclass(frozen=True)
+class RetryRule:
+    max_retries: int
+    base_delay: float
+    max_delay: float
+
+
+_DEFAULT_RULES: dict[RetryClass, RetryRule] = {
+    # 400/401/403/422 等请求本身有问题，重试没有意义
+    RetryClass.CLIENT_ERROR: RetryRule(max_retries=0, base_delay=1.0, max_delay=1.0),
+    RetryClass.RATE_LIMITED: RetryRule(max_retries=4, base_delay=2.0, max_delay=30.0),
+    RetryClass.SERVER_ERROR: RetryRule(max_retries=3, base_delay=1.0, max_delay=20.0),
+    RetryClass.TIMEOUT: RetryRule(max_retries=2, base_delay=1.0, max_delay=10.0),
+    RetryClass.CONNECTION_ERROR: RetryRule(max_retries=3, base_delay=0.5, max_delay=10.0),
+}
+
+
+@dataclass
+class RetryStats:
+    """Retry bookkeeping for one logical LLM call."""
+
+    retries: int = 0
+    backoff_seconds: float = 0.0
+    by_class: dict[str, int] = field(default_factory=dict)
+
+    def count(self, retry_class: RetryClass) -> int:
+        return self.by_class.get(retry_class.value, 0)
+
+    def record(self, retry_class: RetryClass, delay: float) -> None:
+        self.retries += 1
+        self.backoff_seconds += delay
+        self.by_class[retry_class.value] = self.count(retry_class) + 1
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """Exponential backoff with jitter, separate budgets per failure class."""
+
+    rules: dict[RetryClass, RetryRule] = field(
+        default_factory=lambda: dict(_DEFAULT_RULES)
+    )
+    jitter: float = 0.5
+    max_retry_after: float = 60.0
+
+    @classmethod
+    def from_env(cls) -> "RetryPolicy":
+        rules: dict[RetryClass, RetryRule] = {}
+        for retry_class, default in _DEFAULT_RULES.items():
+            prefix = f"DEEPSEEK_RETRY_{retry_class.name}"
+            rules[retry_class] = RetryRule(
+                max_retries=env_int(f"{prefix}_MAX_RETRIES", default.max_retries),
+                base_delay=env_float(f"{prefix}_BASE_DELAY", default.base_delay),
+                max_delay=env_float(f"{prefix}_MAX_DELAY", default.max_delay),
+            )
+        return cls(
+            rules=rules,
+            jitter=env_float("DEEPSEEK_RETRY_JITTER", 0.5),
+            max_retry_after=env_float("DEEPSEEK_RETRY_MAX_RETRY_AFTER", 60.0),
+        )
+
+    def classify_status(self, status_code: int) -> RetryClass:
+        if status_code == 429:
+            return RetryClass.RATE_LIMITED
+        if status_code == 408:
+            return RetryClass.TIMEOUT
+        if status_code >= 500:
+            return RetryClass.SERVER_ERROR
+        return RetryClass.CLIENT_ERROR
+
+    def next_delay(
+        self,
+        retry_class: RetryClass,
+        attempt: int,
+        retry_after: float | None = None,
+    ) -> float | None:
+        """返回第 attempt 次重试（从 0 开始）前的等待秒数，None 表示不再重试。"""
+        rule = self.rules.get(retry_class, _DEFAULT_RULES[retry_class])
+        if attempt >= rule.max_retries:
+            return None
+        if retry_after is not None:
+            if retry_after > self.max_retry_after:
+                return None
+            return max(0.0, retry_after)
+        ceiling = min(rule.max_delay, rule.base_delay * (2**attempt))
+        # equal jitter：保留 (1 - jitter) 的确定部分，其余随机，避免同步重试
+        return ceiling * (1 - self.jitter) + random.uniform(0, ceiling * self.jitter)
+
+    @staticmethod
+    def parse_retry_after(value: str | None) -> float | None:
+        """解析 Retry-After 头，支持秒数和 HTTP-date 两种格式。"""
+        if not value:
+            return None
+        value = value.strip()
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            retry_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            logger.debug("无法解析 Retry-After: %r", value)
+            return None
+        if retry_at.tzinfo is None:
+            retry_at = retry_at.replace(tzinfo=timezone.utc)
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
@@ -0,0 +1,259 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from pathlib import Path
+
+from ..utils.env import env_float
+
+logger = logging.getLogger(__name__)
+
+SEARCH_PROVIDERS = ("tavily", "google", "duckduckgo", "wikipedia", "academic")
+
+
+class SearchResultCache:
+    """Two-tier TTL cache for search results: memory LRU + optional SQLite.
+
+    Keys are the provider, the normalized query (case-folded, whitespace
+    collapsed) and the requested result count. Each provider has its own TTL
+    (``SEARCH_CACHE_<PROVIDER>_TTL_SECONDS``), so fast-moving web results can
+    expire sooner than encyclopedic ones. Empty result lists are never stored.
+    ``aget``/``aput`` are for async callers: the memory tier stays inline and
+    the SQLite tier runs in a worker thread, off the event loop.
+    """
+
+    def __init__(
+        self,
+        *,
+        enabled: bool = True,
+        max_entries: int = 512,
+        ttl_seconds: float = 3600.0,
+        provider_ttls: dict[str, float] | None = None,
+        db_path: str | None = None,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.enabled = enabled
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self.provider_ttls = provider_ttls or {}
+        self.db_path = db_path
+        self._clock = clock
+        self._memory: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._db_ready = False
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls) -> "SearchResultCache":
+        ttl_seconds = env_float("SEARCH_CACHE_TTL_SECONDS", 3600.0)
+        provider_ttls = {
+            provider: env_float(f"SEARCH_CACHE_{provider.upper()}_TTL_SECONDS", ttl_seconds)
+            for provider in SEARCH_PROVIDERS
+        }
+        return cls(
+            enabled=os.getenv("SEARCH_CACHE_ENABLED", "true").lower() in {"1", "true", "yes"},
+            max_entries=int(env_float("SEARCH_CACHE_MAX_ENTRIES", 512)),
+            ttl_seconds=ttl_seconds,
+            provider_ttls=provider_ttls,
+            # 默认只用内存；设置路径后跨进程重启保留
+            db_path=os.getenv("SEARCH_CACHE_DB_PATH") or None,
+        )
+
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        return " ".join(query.casefold().split())
+
+    @classmethod
+    def make_key(cls, provider: str, query: str, num_results: int) -> str:
+        material = json.dumps(
+            [provider, cls.normalize_query(query), int(num_results)], ensure_ascii=False
+        )
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def ttl_for(self, provider: str) -> float:
+        return self.provider_ttls.get(provider, self.ttl_seconds)
+
+    def get(
+        self, provider: str, query: str, num_results: int
+    ) -> list[dict[str, object]] | None:
+        if not self.enabled or self.ttl_for(provider) <= 0:
+            return None
+        key = self.make_key(provider, query, num_results)
+        now = self._clock()
+        results = self._memory_get(key, now)
+        if results is not None:
+            return results
+        return self._disk_result(key, self._disk_get(key, now))
+
+    async def aget(
+        self, provider: str, query: str, num_results: int
+    ) -> list[dict[str, object]] | None:
+        """get 的异步版本：内存命中直接返回，SQLite 查询放到线程中，不阻塞事件循环。"""
+        if not self.enabled or self.ttl_for(provider) <= 0:
+            return None
+        key = self.make_key(provider, query, num_results)
+        now = self._clock()
+        results = self._memory_get(key, now)
+        if results is not None:
+            return results
+        if self.db_path is None:
+            return self._disk_result(key, None)
+        return self._disk_result(key, await asyncio.to_thread(self._disk_get, key, now))
+
+    def put(
+        self,
+        provider: str,
+        query: str,
+        num_results: int,
+        results: list[dict[str, object]],
+    ) -> None:
+        entry = self._memory_store(provider, query, num_results, results)
+        if entry is not None:
+            self._disk_put(*entry)
+
+    async def aput(
+        self,
+        provider: str,
+        query: str,
+        num_results: int,
+        results: list[dict[str, object]],
+    ) -> None:
+        """put 的异步版本：内存立即写入，SQLite 写入放到线程中。"""
+        entry = self._memory_store(provider, query, num_results, results)
+        if entry is not None and self.db_path is not None:
+            await asyncio.to_thread(self._disk_put, *entry)
+
+    def snapshot(self) -> dict[str, object]:
+        return {
+            "enabled": self.enabled,
+            "memory_entries": len(self._memory),
+            "max_entries": self.max_entries,
+            "persistent": self.db_path is not None,
+            "ttl_seconds": dict(self.provider_ttls) or self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    # ── memory tier ──
+
+    def _memory_get(self, key: str, now: float) -> list[dict[str, object]] | None:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= now:
+                del self._memory[key]
+                return None
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return json.loads(entry[1])
+
+    def _memory_store(
+        self,
+        provider: str,
+        query: str,
+        num_results: int,
+        results: list[dict[str, object]],
+    ) -> tuple[str, tuple[float, str]] | None:
+        """写入内存层，返回需要持久化的 (key, entry)；不缓存时返回 None。"""
+        ttl = self.ttl_for(provider)
+        if not self.enabled or ttl <= 0 or not results:
+            return None
+        key = self.make_key(provider, query, num_results)
+        entry = (self._clock() + ttl, json.dumps(results, ensure_ascii=False))
+        with self._lock:
+            self._memory_put(key, entry)
+        return key, entry
+
+    def _disk_result(
+        self, key: str, entry: tuple[float, str] | None
+    ) -> list[dict[str, object]] | None:
+        """统计磁盘层的查询结果，命中时回填内存层。"""
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._memory_put(key, entry)
+        return json.loads(entry[1])
+
+    def _memory_put(self, key: str, entry: tuple[float, str]) -> None:
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    # ── SQLite tier ──
+
+    def _ensure_db(self) -> bool:
+        if self.db_path is None:
+            return False
+        if self._db_ready:
+            return True
+        try:
+            Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+            with sqlite3.connect(self.db_path) as conn:
+                conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS search_cache (
+                        key TEXT PRIMARY KEY,
+                        value TEXT NOT NULL,
+                        expires_at REAL NOT NULL
+                    )
+                    """
+                )
+                conn.commit()
+        except sqlite3.Error as exc:
+            logger.warning("搜索缓存数据库不可用，仅使用内存缓存: %s", exc)
+            self.db_path = None
+            return False
+        self._db_ready = True
+        return True
+
+    def _disk_get(self, key: str, now: float) -> tuple[float, str] | None:
+        if not self._ensure_db():
+            return None
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                row = conn.execute(
+                    "SELECT value, expires_at FROM search_cache WHERE key = ?",
+                    (key,),
+                ).fetchone()
+                if row is None:
+                    return None
+                if row[1] <= now:
+                    conn.execute("DELETE FROM search_cache WHERE key = ?", (key,))
+                    conn.commit()
+                    return None
+                return float(row[1]), str(row[0])
+        except sqlite3.Error as exc:
+            logger.warning("读取搜索缓存失败: %s", exc)
+            return None
+
+    def _disk_put(self, key: str, entry: tuple[float, str]) -> None:
+        if not self._ensure_db():
+            return
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                conn.execute(
+                    """
+                    INSERT INTO search_cache (key, value, expires_at)
+                    VALUES (?, ?, ?)
+                    ON CONFLICT(key) DO UPDATE SET
+                        value=excluded.value,
+                        expires_at=excluded.expires_at
+                    """,
+                    (key, entry[1], entry[0]),
+                )
+                conn.commit()
+        except sqlite3.Error as exc:
+            logger.warning("写入搜索缓存失败: %s", exc)
@@ -0,0 +1,255 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+from ..utils.env import env_float
+from .rate_limiter import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUOTA_DB_PATH = Path(__file__).resolve().parents[2] / "data" / "search_quota.db"
+
+# 有付费配额的搜索源；DuckDuckGo/Wikipedia 免费但同样可以限速
+SEARCH_RATE_LIMIT_PROVIDERS = ("tavily", "google", "duckduckgo", "wikipedia")
+
+# 名称 -> (每秒请求数, 突发容量)；0 表示不限制
+SEARCH_RATE_LIMIT_DEFAULTS: dict[str, tuple[float, float]] = {
+    "tavily": (5.0, 10.0),
+    "google": (2.0, 5.0),
+    "duckduckgo": (1.0, 3.0),
+    "wikipedia": (10.0, 20.0),
+}
+
+
+class ProviderRateLimiter:
+    """Token-bucket QPS limit for one search provider.
+
+    ``qps`` tokens refill per second up to ``burst``. Callers wait for a token
+    in FIFO order instead of firing a burst the provider would reject;
+    ``qps <= 0`` disables the limit.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        qps: float = 0,
+        burst: float = 1,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.name = name
+        self.qps = qps
+        self.burst = max(burst, 1.0)
+        self._clock = clock
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._reset()
+
+    @classmethod
+    def from_env(cls, name: str) -> "ProviderRateLimiter":
+        """读取 SEARCH_<NAME>_QPS 与 SEARCH_<NAME>_BURST。"""
+        qps, burst = SEARCH_RATE_LIMIT_DEFAULTS.get(name, (0.0, 1.0))
+        prefix = f"SEARCH_{name.upper()}"
+        return cls(
+            name,
+            qps=env_float(f"{prefix}_QPS", qps),
+            burst=env_float(f"{prefix}_BURST", burst),
+        )
+
+    def _reset(self) -> None:
+        self._bucket = TokenBucket(self.qps * 60, self.burst, self._clock())
+        self._lock = asyncio.Lock()
+        self._granted = 0
+        self._throttled = 0
+        self._total_wait_seconds = 0.0
+
+    def snapshot(self) -> dict[str, object]:
+        return {
+            "qps": self.qps,
+            "burst": self.burst,
+            "granted": self._granted,
+            "throttled": self._throttled,
+            "total_wait_seconds": round(self._total_wait_seconds, 3),
+        }
+
+    async def acquire(self) -> float:
+        """等待一个令牌，返回等待的秒数。"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # 事件循环变化（如测试中多次 asyncio.run）时旧的锁已失效
+            self._loop = loop
+            self._reset()
+        started_at = self._clock()
+        throttled = self._lock.locked()
+        # asyncio.Lock 按到达顺序唤醒，保证 FIFO
+        async with self._lock:
+            while True:
+                self._bucket.refill(self._clock())
+                delay = self._bucket.seconds_until(1.0)
+                if delay <= 0:
+                    break
+                throttled = True
+                await asyncio.sleep(delay)
+            self._bucket.consume(1.0)
+        waited = self._clock() - started_at if throttled else 0.0
+        self._granted += 1
+        if throttled:
+            self._throttled += 1
+            self._total_wait_seconds += waited
+            logger.debug("%s 搜索限速，等待 %.2fs", self.name, waited)
+        return waited
+
+
+class SearchQuotaTracker:
+    """Persistent per-provider, per-day (UTC) request counter with optional limits.
+
+    Counts live in SQLite so they survive restarts and are shared by every
+    worker process; the check-and-increment is a single conditional UPDATE
+    run off the event loop by ``consume()``. ``usage()`` and ``snapshot()``
+    only read the in-memory mirror (the count this process last saw), so the
+    health endpoint never touches the database. Without a database the
+    counts are kept in memory only. A limit of 0 means unlimited (the calls
+    are still counted).
+    """
+
+    def __init__(
+        self,
+        *,
+        daily_limits: dict[str, int] | None = None,
+        db_path: str | None = None,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.daily_limits = daily_limits or {}
+        self.db_path = db_path
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._memory: dict[tuple[str, str], int] = {}
+        self._exhausted: dict[str, str] = {}
+        self._rejected: dict[str, int] = {}
+        self._db_ready = False
+
+    @classmethod
+    def from_env(cls) -> "SearchQuotaTracker":
+        """读取 SEARCH_<PROVIDER>_DAILY_QUOTA 与 SEARCH_QUOTA_DB_PATH。"""
+        db_path = os.getenv("SEARCH_QUOTA_DB_PATH", str(DEFAULT_QUOTA_DB_PATH))
+        return cls(
+            daily_limits={
+                provider: int(env_float(f"SEARCH_{provider.upper()}_DAILY_QUOTA", 0))
+                for provider in SEARCH_RATE_LIMIT_PROVIDERS
+            },
+            db_path=db_path or None,
+        )
+
+    def _today(self) -> str:
+        return time.strftime("%Y-%m-%d", time.gmtime(self._clock()))
+
+    def exhausted(self, provider: str) -> bool:
+        """今天的配额是否已用完；只读内存标记，不访问数据库。"""
+        return self._exhausted.get(provider) == self._today()
+
+    async def consume(self, provider: str) -> bool:
+        """try_consume 的异步版本：SQLite 读写放到线程中，不阻塞事件循环。"""
+        if self.db_path is None:
+            return self.try_consume(provider)
+        return await asyncio.to_thread(self.try_consume, provider)
+
+    def try_consume(self, provider: str) -> bool:
+        """配额未用完时计数加一并返回 True，否则返回 False（调用方应换用下一个搜索源）。"""
+        day = self._today()
+        limit = self.daily_limits.get(provider, 0)
+        disk = self._disk_consume(provider, day, limit)
+        with self._lock:
+            if disk is None:
+                used = self._memory.get((provider, day), 0)
+                consumed = limit <= 0 or used < limit
+                if consumed:
+                    self._memory[(provider, day)] = used + 1
+            else:
+                consumed, self._memory[(provider, day)] = disk
+            if not consumed:
+                self._rejected[provider] = self._rejected.get(provider, 0) + 1
+                if self._exhausted.get(provider) != day:
+                    logger.warning("%s 今日搜索配额（%d）已用完，改用其他搜索源", provider, limit)
+                self._exhausted[provider] = day
+        return consumed
+
+    def usage(self, provider: str) -> int:
+        with self._lock:
+            return self._memory.get((provider, self._today()), 0)
+
+    def snapshot(self) -> dict[str, object]:
+        providers = sorted(set(SEARCH_RATE_LIMIT_PROVIDERS) | set(self.daily_limits))
+        return {
+            "day": self._today(),
+            "persistent": self.db_path is not None,
+            **{
+                provider: {
+                    "used": self.usage(provider),
+                    "daily_limit": self.daily_limits.get(provider, 0),
+                    "exhausted": self.exhausted(provider),
+                    "rejected": self._rejected.get(provider, 0),
+                }
+                for provider in providers
+            },
+        }
+
+    # ── SQLite tier ──
+
+    def _ensure_db(self) -> bool:
+        if self.db_path is None:
+            return False
+        if self._db_ready:
+            return True
+        try:
+            Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+            with sqlite3.connect(self.db_path) as conn:
+                conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS search_quota (
+                        provider TEXT NOT NULL,
+                        day TEXT NOT NULL,
+                        used INTEGER NOT NULL DEFAULT 0,
+                        PRIMARY KEY (provider, day)
+                    )
+                    """
+                )
+                conn.commit()
+        except sqlite3.Error as exc:
+            logger.warning("搜索配额数据库不可用，仅在内存中计数: %s", exc)
+            self.db_path = None
+            return False
+        self._db_ready = True
+        return True
+
+    def _disk_consume(self, provider: str, day: str, limit: int) -> tuple[bool, int] | None:
+        """返回 (是否计入, 当日已用次数)；数据库不可用时返回 None。"""
+        if not self._ensure_db():
+            return None
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                conn.execute(
+                    "INSERT OR IGNORE INTO search_quota (provider, day, used) VALUES (?, ?, 0)",
+                    (provider, day),
+                )
+                cursor = conn.execute(
+                    """
+                    UPDATE search_quota SET used = used + 1
+                    WHERE provider = ? AND day = ? AND (? <= 0 OR used < ?)
+                    """,
+                    (provider, day, limit, limit),
+                )
+                row = conn.execute(
+                    "SELECT used FROM search_quota WHERE provider = ? AND day = ?",
+                    (provider, day),
+                ).fetchone()
+                conn.commit()
+                return cursor.rowcount == 1, int(row[0])
+        except sqlite3.Error as exc:
+            logger.warning("更新搜索配额失败: %s", exc)
+            return None
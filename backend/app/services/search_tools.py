@@ -1,23 +1,340 @@
 import asyncio
 import logging
 import os
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+from urllib.parse import quote
+from urllib.parse import urlsplit
 
-import requests
+import httpx
 
+from ..utils.env import env_float
 from ..utils.env import load_project_env
+from .adaptive_limiter import AdaptiveConcurrencyLimiter
+from .circuit_breaker import CircuitBreaker
+from .circuit_breaker import CircuitState
+from .search_cache import SearchResultCache
+from .search_quota import SEARCH_RATE_LIMIT_PROVIDERS
+from .search_quota import ProviderRateLimiter
+from .search_quota import SearchQuotaTracker
+
+if TYPE_CHECKING:
+    from ..research.cost_tracker import CostTracker
 
 load_project_env()
 
 logger = logging.getLogger(__name__)
 
+TAVILY_SEARCH_URL = "https://api.tavily.com/search"
+SERPAPI_SEARCH_URL = "https://serpapi.com/search"
+WIKIPEDIA_API_URL = "https://{lang}.wikipedia.org/w/api.php"
+
+_HTML_TAG = re.compile(r"<[^>]+>")
+_CJK = re.compile(r"[\u4e00-\u9fff]")
+
+
+@dataclass(frozen=True)
+class FanoutConfig:
+    """Settings for querying all configured web providers concurrently."""
+
+    enabled: bool = False
+    provider_timeout: float = 8.0
+    budget: float = 10.0
+    quorum: int = 2
+    rrf_k: int = 60
+
+    @classmethod
+    def from_env(cls) -> "FanoutConfig":
+        return cls(
+            enabled=os.getenv("SEARCH_FANOUT", "false").lower() in {"1", "true", "yes"},
+            provider_timeout=env_float("SEARCH_FANOUT_PROVIDER_TIMEOUT_SECONDS", 8.0),
+            budget=env_float("SEARCH_FANOUT_BUDGET_SECONDS", 10.0),
+            quorum=max(1, int(env_float("SEARCH_FANOUT_QUORUM", 2))),
+            rrf_k=max(1, int(env_float("SEARCH_FANOUT_RRF_K", 60))),
+        )
+
+
+@dataclass(frozen=True)
+class OptionalSearchConfig:
+    """Wikipedia/academic searches that run beside the primary web search.
+
+    They start together with the primary search, which is then waited for
+    first; afterwards they get at most ``budget`` more seconds, so they never
+    add more than that to a search. Whatever has not finished by then is
+    dropped from the result (the request itself finishes in the background so
+    its latency is still recorded and its results land in the cache).
+    Academic search goes through Tavily/Google and spends their quota, so it
+    is opt-in; Wikipedia is free and on by default.
+    """
+
+    providers: tuple[str, ...] = ("wikipedia",)
+    budget: float = 2.0
+    num_results: int = 3
+
+    @classmethod
+    def from_env(cls) -> "OptionalSearchConfig":
+        raw = os.getenv("SEARCH_OPTIONAL_PROVIDERS", "wikipedia")
+        providers = tuple(
+            name
+            for name in (part.strip().lower() for part in raw.split(","))
+            if name in {"wikipedia", "academic"}
+        )
+        return cls(
+            providers=providers,
+            budget=env_float("SEARCH_OPTIONAL_BUDGET_SECONDS", 2.0),
+            num_results=max(1, int(env_float("SEARCH_OPTIONAL_NUM_RESULTS", 3))),
+        )
+
+
+class ContributorStats:
+    """Latency and on-time counters for one optional search bucket."""
 
-class SearchTools:
     def __init__(self) -> None:
+        self.calls = 0
+        self.in_time = 0
+        self.late = 0
+        self.latency_ewma: float | None = None
+        self.latency_max = 0.0
+
+    def record(self, latency: float, *, late: bool) -> None:
+        self.calls += 1
+        if late:
+            self.late += 1
+        else:
+            self.in_time += 1
+        self.latency_max = max(self.latency_max, latency)
+        self.latency_ewma = (
+            latency if self.latency_ewma is None else 0.8 * self.latency_ewma + 0.2 * latency
+        )
+
+    def snapshot(self) -> dict[str, object]:
+        return {
+            "calls": self.calls,
+            "in_time": self.in_time,
+            "late": self.late,
+            "latency_ewma_seconds": (
+                round(self.latency_ewma, 3) if self.latency_ewma is not None else None
+            ),
+            "latency_max_seconds": round(self.latency_max, 3),
+        }
+
+
+def _url_key(link: str) -> str:
+    """去重用的 URL 规范形式：忽略协议、www 前缀、大小写主机名、末尾斜杠和锚点。"""
+    parts = urlsplit(link.strip())
+    host = parts.netloc.lower().removeprefix("www.")
+    path = parts.path.rstrip("/")
+    return f"{host}{path}?{parts.query}" if parts.query else f"{host}{path}"
+
+
+def reciprocal_rank_fusion(
+    ranked_lists: list[list[dict[str, object]]],
+    *,
+    k: int = 60,
+    limit: int | None = None,
+) -> list[dict[str, object]]:
+    """Merge per-provider rankings with RRF: score = sum(1 / (k + rank)).
+
+    Results are deduplicated by normalized URL; the entry from the list that
+    ranks it highest is kept. Ties keep the order of ``ranked_lists``.
+    """
+    scores: dict[str, float] = {}
+    best: dict[str, tuple[int, dict[str, object]]] = {}
+    for results in ranked_lists:
+        seen: set[str] = set()
+        for rank, item in enumerate(results, start=1):
+            link = str(item.get("link", "")).strip()
+            if not link:
+                continue
+            key = _url_key(link)
+            if key in seen:
+                continue
+            seen.add(key)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            if key not in best or rank < best[key][0]:
+                best[key] = (rank, item)
+    ordered = sorted(scores, key=lambda key: scores[key], reverse=True)
+    merged = [best[key][1] for key in ordered]
+    return merged[:limit] if limit is not None else merged
+
+
+class SearchTools:
+    def __init__(self, *, transport: httpx.AsyncBaseTransport | None = None) -> None:
         self.serpapi_key = os.getenv("SERPAPI_API_KEY")
         self.tavily_api_key = os.getenv("TAVILY_API_KEY")
+        # Tavily/SerpAPI 共用一个长连接池，首次搜索时创建，lifespan 退出时关闭
+        self.max_connections = int(env_float("SEARCH_HTTP_MAX_CONNECTIONS", 20))
+        self.connect_timeout = env_float("SEARCH_HTTP_CONNECT_TIMEOUT", 5.0)
+        self.read_timeout = env_float("SEARCH_HTTP_READ_TIMEOUT", 15.0)
+        self._transport = transport
+        self._http_client: httpx.AsyncClient | None = None
+        self._http_client_loop: asyncio.AbstractEventLoop | None = None
+        # DDGS 只有同步接口：每个工作线程复用一个实例，避免每次搜索重建会话
+        self._ddgs_local = threading.local()
+        # 所有线程创建的 DDGS 实例，aclose 时统一释放
+        self._ddgs_clients: list[object] = []
+        self._ddgs_lock = threading.Lock()
+        # 每个搜索源独立熔断；打开时直接跳到下一个备选源
+        self.circuit_breakers = {
+            name: CircuitBreaker.from_env(name)
+            for name in ("tavily", "google", "duckduckgo", "wikipedia")
+        }
+        # 所有搜索源共享一个自适应并发上限，超时或限流时收缩
+        self.concurrency = AdaptiveConcurrencyLimiter.from_env("search")
+        self.cache = SearchResultCache.from_env()
+        # 每个搜索源独立限速（QPS/突发）并按天累计配额，配额用尽时自动改用下一个搜索源
+        self.rate_limits = {
+            name: ProviderRateLimiter.from_env(name) for name in SEARCH_RATE_LIMIT_PROVIDERS
+        }
+        self.quota = SearchQuotaTracker.from_env()
+        self.fanout = FanoutConfig.from_env()
+        self.optional = OptionalSearchConfig.from_env()
+        self.optional_stats = {name: ContributorStats() for name in ("wikipedia", "academic")}
+        # 超出预算后仍在后台完成的可选搜索，保留引用防止被回收
+        self._background: set[asyncio.Task[object]] = set()
+
+    async def _cached(
+        self,
+        provider: str,
+        query: str,
+        num_results: int,
+        cost_tracker: "CostTracker | None",
+    ) -> list[dict[str, object]] | None:
+        results = await self.cache.aget(provider, query, num_results)
+        if results is not None:
+            logger.debug("%s 搜索命中缓存: %s", provider, query)
+            if cost_tracker is not None:
+                cost_tracker.track_search_call(
+                    provider=provider, query=query, cache_hit=True, result_count=len(results)
+                )
+        return results
+
+    async def _store(
+        self,
+        provider: str,
+        query: str,
+        num_results: int,
+        results: list[dict[str, object]],
+        cost_tracker: "CostTracker | None",
+    ) -> None:
+        await self.cache.aput(provider, query, num_results, results)
+        if cost_tracker is not None:
+            cost_tracker.track_search_call(
+                provider=provider, query=query, cache_hit=False, result_count=len(results)
+            )
+
+    def _get_http_client(self) -> httpx.AsyncClient:
+        """返回当前事件循环上的共享 AsyncClient，复用 TCP/TLS 连接。"""
+        loop = asyncio.get_running_loop()
+        client = self._http_client
+        if client is None or client.is_closed or self._http_client_loop is not loop:
+            client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+                timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+                transport=self._transport,
+            )
+            self._http_client = client
+            self._http_client_loop = loop
+        return client
+
+    def _get_ddgs(self):
+        ddgs = getattr(self._ddgs_local, "client", None)
+        if ddgs is None:
+            from duckduckgo_search import DDGS
+
+            ddgs = DDGS()
+            self._ddgs_local.client = ddgs
+            with self._ddgs_lock:
+                self._ddgs_clients.append(ddgs)
+        return ddgs
+
+    async def aclose(self) -> None:
+        """关闭搜索连接池，供 FastAPI lifespan 退出时调用。"""
+        client = self._http_client
+        self._http_client = None
+        if client is not None and not client.is_closed:
+            try:
+                running_loop = asyncio.get_running_loop()
+            except RuntimeError:
+                running_loop = None
+            if self._http_client_loop is running_loop:
+                await client.aclose()
+        self._http_client_loop = None
+        with self._ddgs_lock:
+            ddgs_clients, self._ddgs_clients = self._ddgs_clients, []
+            self._ddgs_local = threading.local()
+        for ddgs in ddgs_clients:
+            try:
+                ddgs.__exit__(None, None, None)
+            except Exception as exc:  # noqa: BLE001
+                logger.debug("关闭 DuckDuckGo 会话失败: %s", exc)
+
+    async def _call_provider(self, func, *args, timeout: float | None = None):
+        """在自适应并发名额内执行一次搜索请求；异常照常抛出，由调用方计入熔断并降级。
+
+        timeout 在名额内计时，超时会作为过载信号收缩并发上限。
+        """
+        async with self.concurrency.slot():
+            return await asyncio.wait_for(func(*args), timeout)
+
+    async def _search_provider(
+        self,
+        provider: str,
+        query: str,
+        num_results: int,
+        cost_tracker: "CostTracker | None",
+        *,
+        timeout: float | None = None,
+    ) -> list[dict[str, object]]:
+        """缓存 → 熔断 → 限速 → 配额 → 请求单个搜索源；失败计入熔断并返回空列表，不做降级。"""
+        cached = await self._cached(provider, query, num_results, cost_tracker)
+        if cached is not None:
+            return cached
+        breaker = self.circuit_breakers[provider]
+        if self.quota.exhausted(provider) or breaker.state is CircuitState.OPEN:
+            return []
+        # 限速排队在申请熔断探测名额之前，排队期间不占住半开探测
+        await self.rate_limits[provider].acquire()
+
+        # 探测名额在退出时归还（包括配额用尽提前返回、被并行搜索取消），熔断器不会卡在半开状态；
+        # 配额在放行后才扣，被熔断拒绝的请求不计入配额
+        with breaker.probe() as allowed:
+            if not allowed:
+                logger.warning("%s 搜索熔断中，跳过", provider)
+                return []
+            if not await self.quota.consume(provider):
+                return []
+
+            request = getattr(self, f"_{provider}_request")
+            try:
+                result = await self._call_provider(
+                    request, query, num_results, timeout=timeout
+                )
+            except asyncio.TimeoutError:
+                logger.warning("%s 搜索超时: %s", provider, query)
+                breaker.record_failure()
+                return []
+            except Exception as e:
+                logger.error("%s 搜索失败: %s", provider, e)
+                breaker.record_failure()
+                return []
+            logger.debug("%s 搜索成功，返回 %d 个结果", provider, len(result))
+            breaker.record_success()
+        await self._store(provider, query, num_results, result, cost_tracker)
+        return result
 
     async def tavily_search(
-        self, query: str, num_results: int = 10
+        self,
+        query: str,
+        num_results: int = 10,
+        *,
+        cost_tracker: "CostTracker | None" = None,
     ) -> list[dict[str, object]]:
         """使用Tavily搜索"""
         logger.debug("开始 Tavily 搜索: %s", query)
@@ -25,75 +342,61 @@ class SearchTools:
         if not self.tavily_api_key:
             logger.warning("Tavily API Key 未配置，返回空结果")
             return []
+        return await self._search_provider("tavily", query, num_results, cost_tracker)
 
-        try:
-            result = await asyncio.to_thread(self._sync_tavily_search, query, num_results)
-            logger.debug("Tavily 搜索成功，返回 %d 个结果", len(result))
-            return result
-        except asyncio.TimeoutError:
-            logger.warning("Tavily search timeout for query: %s", query)
-            return []
-        except Exception as e:
-            logger.error("Tavily search error: %s", e)
-            return []
-
-    def _sync_tavily_search(
+    async def _tavily_request(
         self, query: str, num_results: int = 10
     ) -> list[dict[str, object]]:
-        """同步版本的Tavily搜索，优化内容长度"""
-        try:
-            from tavily import TavilyClient
+        """直接调用 Tavily REST 接口，优化内容长度；异常交给调用方计入熔断。"""
+        response = await self._get_http_client().post(
+            TAVILY_SEARCH_URL,
+            headers={"Authorization": f"Bearer {self.tavily_api_key}"},
+            json={
+                "query": query,
+                "search_depth": "basic",
+                "max_results": min(num_results, 8),
+            },
+        )
+        response.raise_for_status()
 
-            tavily = TavilyClient(api_key=self.tavily_api_key)
-            response = tavily.search(
-                query=query,
-                search_depth="basic",
-                max_results=min(num_results, 8),
-            )
+        results = []
+        for result in response.json().get("results", []):
+            title = result.get("title", "")
+            content = result.get("content", "")
 
-            results = []
-            for result in response.get("results", []):
-                title = result.get("title", "")
-                content = result.get("content", "")
-
-                max_content_length = 300
-                if len(content) > max_content_length:
-                    content = content[:max_content_length] + "..."
-
-                results.append(
-                    {
-                        "title": title,
-                        "link": result.get("url", ""),
-                        "snippet": content,
-                        "source": "tavily",
-                    }
-                )
+            max_content_length = 300
+            if len(content) > max_content_length:
+                content = content[:max_content_length] + "..."
 
-            return results
-        except Exception as e:
-            logger.error("Sync Tavily search error: %s", e, exc_info=True)
-            return []
+            results.append(
+                {
+                    "title": title,
+                    "link": result.get("url", ""),
+                    "snippet": content,
+                    "source": "tavily",
+                }
+            )
+
+        return results
 
     async def google_search(
-        self, query: str, num_results: int = 10
+        self,
+        query: str,
+        num_results: int = 10,
+        *,
+        cost_tracker: "CostTracker | None" = None,
     ) -> list[dict[str, object]]:
-        """使用SerpAPI进行Google搜索"""
-        if not self.serpapi_key:
-            return await self.tavily_search(query, num_results)
-
-        try:
-            result = await asyncio.to_thread(self._sync_google_search, query, num_results)
+        """使用SerpAPI进行Google搜索，失败、熔断或无结果时改用 Tavily"""
+        if self.serpapi_key:
+            result = await self._search_provider("google", query, num_results, cost_tracker)
             if result:
                 return result
-            return await self.tavily_search(query, num_results)
-        except Exception as e:
-            logger.error("Google search error: %s", e)
-            return await self.tavily_search(query, num_results)
+        return await self.tavily_search(query, num_results, cost_tracker=cost_tracker)
 
-    def _sync_google_search(
+    async def _google_request(
         self, query: str, num_results: int = 10
     ) -> list[dict[str, object]]:
-        url = "https://serpapi.com/search"
+        """通过 SerpAPI 调用 Google 搜索；非 2xx 状态抛出异常，交给调用方计入熔断并换用下一个搜索源。"""
         params = {
             "q": query,
             "api_key": self.serpapi_key,
@@ -101,12 +404,13 @@ class SearchTools:
             "engine": "google",
         }
 
-        response = requests.get(url, params=params, timeout=10)
-        if response.status_code != 200:
+        response = await self._get_http_client().get(SERPAPI_SEARCH_URL, params=params)
+        if not response.is_success:
             logger.warning(
-                "Google search failed with status %d, using Tavily", response.status_code
+                "Google search failed with status %d, falling back to the next provider",
+                response.status_code,
             )
-            return []
+        response.raise_for_status()
 
         data = response.json()
         results = []
@@ -122,100 +426,282 @@ class SearchTools:
         return results
 
     async def duckduckgo_search(
-        self, query: str, num_results: int = 10
+        self,
+        query: str,
+        num_results: int = 10,
+        *,
+        cost_tracker: "CostTracker | None" = None,
     ) -> list[dict[str, object]]:
         """DuckDuckGo搜索 - 免费备选方案"""
         logger.debug("开始 DuckDuckGo 搜索: %s", query)
+        return await self._search_provider("duckduckgo", query, num_results, cost_tracker)
 
-        try:
-            result = await asyncio.to_thread(
-                self._sync_duckduckgo_search, query, num_results
-            )
-            logger.debug("DuckDuckGo 搜索成功，返回 %d 个结果", len(result))
-            return result
-        except asyncio.TimeoutError:
-            logger.warning("DuckDuckGo search timeout for query: %s", query)
-            return []
-        except Exception as e:
-            logger.error("DuckDuckGo search error: %s", e)
-            return []
+    async def _duckduckgo_request(
+        self, query: str, num_results: int = 10
+    ) -> list[dict[str, object]]:
+        # duckduckgo_search 没有异步接口，只能放到线程里执行
+        return await asyncio.to_thread(self._sync_duckduckgo_search, query, num_results)
 
     def _sync_duckduckgo_search(
         self, query: str, num_results: int = 10
     ) -> list[dict[str, object]]:
-        """同步版本的DuckDuckGo搜索 - 免费备选方案"""
-        try:
-            from duckduckgo_search import DDGS
-
-            with DDGS() as ddgs:
-                results = []
-                ddg_results = ddgs.text(query, max_results=min(num_results, 10))
+        """同步版本的DuckDuckGo搜索 - 免费备选方案；异常交给调用方计入熔断。"""
+        results = []
+        ddg_results = self._get_ddgs().text(query, max_results=min(num_results, 10))
 
-                for result in ddg_results:
-                    results.append(
-                        {
-                            "title": result.get("title", ""),
-                            "link": result.get("href", ""),
-                            "snippet": result.get("body", ""),
-                            "source": "duckduckgo",
-                        }
-                    )
+        for result in ddg_results:
+            results.append(
+                {
+                    "title": result.get("title", ""),
+                    "link": result.get("href", ""),
+                    "snippet": result.get("body", ""),
+                    "source": "duckduckgo",
+                }
+            )
 
-                return results
-        except Exception as e:
-            logger.error("DuckDuckGo 同步搜索失败: %s", e)
-            return []
+        return results
 
     async def wikipedia_search(
-        self, query: str, num_results: int = 5
+        self,
+        query: str,
+        num_results: int = 5,
+        *,
+        cost_tracker: "CostTracker | None" = None,
     ) -> list[dict[str, object]]:
-        """Wikipedia搜索已禁用，避免超时问题"""
-        logger.debug("Wikipedia 搜索已禁用以提高性能，查询: %s", query)
-        return []
+        """Wikipedia搜索；含中文时查中文维基，否则查英文维基"""
+        logger.debug("开始 Wikipedia 搜索: %s", query)
+        return await self._search_provider("wikipedia", query, num_results, cost_tracker)
 
-    def _sync_wikipedia_search(
+    async def _wikipedia_request(
         self, query: str, num_results: int = 5
     ) -> list[dict[str, object]]:
-        """Wikipedia搜索已禁用"""
-        return []
+        lang = os.getenv("WIKIPEDIA_LANGUAGE") or ("zh" if _CJK.search(query) else "en")
+        response = await self._get_http_client().get(
+            WIKIPEDIA_API_URL.format(lang=lang),
+            params={
+                "action": "query",
+                "list": "search",
+                "srsearch": query,
+                "srlimit": num_results,
+                "format": "json",
+                "utf8": 1,
+            },
+        )
+        response.raise_for_status()
+
+        results = []
+        for result in response.json().get("query", {}).get("search", []):
+            title = result.get("title", "")
+            results.append(
+                {
+                    "title": title,
+                    "link": f"https://{lang}.wikipedia.org/wiki/{quote(title.replace(' ', '_'))}",
+                    "snippet": _HTML_TAG.sub("", result.get("snippet", "")),
+                    "source": "wikipedia",
+                }
+            )
+        return results
 
     async def academic_search(
-        self, query: str, num_results: int = 5
+        self,
+        query: str,
+        num_results: int = 5,
+        *,
+        cost_tracker: "CostTracker | None" = None,
     ) -> list[dict[str, object]]:
         """学术搜索，优先使用 Tavily"""
         if self.tavily_api_key:
             academic_query = f"{query} research academic study paper"
-            return await self.tavily_search(academic_query, num_results)
-        academic_query = f"site:scholar.google.com OR site:arxiv.org OR site:researchgate.net {query}"
-        return await self.google_search(academic_query, num_results)
+            results = await self.tavily_search(
+                academic_query, num_results, cost_tracker=cost_tracker
+            )
+        else:
+            academic_query = (
+                f"site:scholar.google.com OR site:arxiv.org OR site:researchgate.net {query}"
+            )
+            results = await self.google_search(
+                academic_query, num_results, cost_tracker=cost_tracker
+            )
+        return [{**result, "source": "academic"} for result in results]
+
+    def _start_optional_searches(
+        self, query: str, cost_tracker: "CostTracker | None"
+    ) -> dict[str, "asyncio.Task[list[dict[str, object]]]"]:
+        searches = {
+            "wikipedia": self.wikipedia_search,
+            "academic": self.academic_search,
+        }
+        return {
+            bucket: asyncio.create_task(
+                searches[bucket](query, self.optional.num_results, cost_tracker=cost_tracker)
+            )
+            for bucket in self.optional.providers
+        }
 
-    async def comprehensive_search(
-        self, query: str
+    async def _collect_optional_searches(
+        self,
+        tasks: dict[str, "asyncio.Task[list[dict[str, object]]]"],
+        started_at: float,
     ) -> dict[str, list[dict[str, object]]]:
-        """综合搜索，优先使用 Tavily，避免超时问题"""
-        results = {}
+        """主搜索完成后再最多等待预算秒数；按时完成的并入对应分组，超时的在后台完成后只记录耗时。
 
+        started_at 是可选搜索的发起时间，只用于统计耗时。
+        """
+        results: dict[str, list[dict[str, object]]] = {bucket: [] for bucket in tasks}
+        if not tasks:
+            return results
+        pending = [task for task in tasks.values() if not task.done()]
+        if pending and self.optional.budget > 0:
+            await asyncio.wait(pending, timeout=self.optional.budget)
+        for bucket, task in tasks.items():
+            if task.done():
+                results[bucket] = task.result()
+                self.optional_stats[bucket].record(time.monotonic() - started_at, late=False)
+                continue
+            logger.debug("%s 搜索超出预算 %.1fs，结果不再等待", bucket, self.optional.budget)
+            self._background.add(task)
+            task.add_done_callback(
+                lambda finished, bucket=bucket: self._finish_late_optional(
+                    bucket, finished, started_at
+                )
+            )
+        return results
+
+    def _finish_late_optional(
+        self, bucket: str, task: "asyncio.Task[object]", started_at: float
+    ) -> None:
+        self._background.discard(task)
+        if not task.cancelled():
+            self.optional_stats[bucket].record(time.monotonic() - started_at, late=True)
+
+    def optional_snapshot(self) -> dict[str, object]:
+        return {
+            "providers": list(self.optional.providers),
+            "budget_seconds": self.optional.budget,
+            **{bucket: stats.snapshot() for bucket, stats in self.optional_stats.items()},
+        }
+
+    def fanout_providers(self) -> list[str]:
+        providers = []
         if self.tavily_api_key:
-            tavily_results = await self.tavily_search(query, 6)
-            results["web"] = tavily_results
-            results["wikipedia"] = []
-            results["academic"] = []
-        else:
-            logger.warning("Tavily 不可用，使用备用搜索方案")
-            try:
-                google_results = await self.google_search(query, 8)
-                if google_results:
-                    results["web"] = google_results
-                else:
-                    results["web"] = await self.duckduckgo_search(query, 8)
-            except Exception as e:
-                logger.warning("Google搜索失败 (%s)，使用DuckDuckGo搜索", e)
-                results["web"] = await self.duckduckgo_search(query, 8)
+            providers.append("tavily")
+        if self.serpapi_key:
+            providers.append("google")
+        providers.append("duckduckgo")
+        return [provider for provider in providers if not self.quota.exhausted(provider)]
+
+    async def fanout_search(
+        self,
+        query: str,
+        num_results: int = 8,
+        *,
+        cost_tracker: "CostTracker | None" = None,
+    ) -> list[dict[str, object]]:
+        """并行查询所有已配置的搜索源，用 RRF 合并。
+
+        每个搜索源有独立超时；达到法定数（quorum 个搜索源返回非空结果）或总时间预算用尽即返回，
+        其余请求被取消，因此延迟取决于最快的健康搜索源而不是失败源耗时之和。
+        """
+        providers = self.fanout_providers()
+        loop = asyncio.get_running_loop()
+        started_at = loop.time()
+        tasks = {
+            asyncio.create_task(
+                self._search_provider(
+                    provider,
+                    query,
+                    num_results,
+                    cost_tracker,
+                    timeout=self.fanout.provider_timeout,
+                )
+            ): provider
+            for provider in providers
+        }
+        ranked: dict[str, list[dict[str, object]]] = {}
+        pending = set(tasks)
+        try:
+            while pending:
+                remaining = self.fanout.budget - (loop.time() - started_at)
+                if remaining <= 0:
+                    break
+                done, pending = await asyncio.wait(
+                    pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    ranked[tasks[task]] = task.result()
+                if sum(1 for results in ranked.values() if results) >= self.fanout.quorum:
+                    break
+        finally:
+            for task in pending:
+                task.cancel()
+        if pending:
+            logger.debug(
+                "并行搜索已满足法定数或时间预算，放弃: %s",
+                ", ".join(tasks[task] for task in pending),
+            )
+        return reciprocal_rank_fusion(
+            [ranked[provider] for provider in providers if provider in ranked],
+            k=self.fanout.rrf_k,
+            limit=num_results,
+        )
 
-            results["wikipedia"] = []
-            results["academic"] = []
+    async def comprehensive_search(
+        self,
+        query: str,
+        *,
+        cost_tracker: "CostTracker | None" = None,
+    ) -> dict[str, list[dict[str, object]]]:
+        """综合搜索，优先使用 Tavily，避免超时问题；SEARCH_FANOUT 开启时并行查询所有搜索源。
 
-        return results
+        维基百科与学术搜索与主搜索并行，主搜索完成后最多再等预算秒数。
+        各搜索源的结果按 查询+搜索源+结果数 缓存；传入 cost_tracker 时记录每次搜索及是否命中缓存。
+        """
+        started_at = time.monotonic()
+        optional_tasks = self._start_optional_searches(query, cost_tracker)
+        try:
+            if self.fanout.enabled:
+                web = await self.fanout_search(query, 8, cost_tracker=cost_tracker)
+            else:
+                web = await self._sequential_web_search(query, cost_tracker)
+        except BaseException:
+            for task in optional_tasks.values():
+                task.cancel()
+            raise
+
+        return {
+            "web": web,
+            "wikipedia": [],
+            "academic": [],
+            **await self._collect_optional_searches(optional_tasks, started_at),
+        }
+
+    async def _sequential_web_search(
+        self, query: str, cost_tracker: "CostTracker | None"
+    ) -> list[dict[str, object]]:
+        tavily_open = self.circuit_breakers["tavily"].state is CircuitState.OPEN
+        if self.tavily_api_key and not tavily_open and not self.quota.exhausted("tavily"):
+            results = await self.tavily_search(query, 6, cost_tracker=cost_tracker)
+            # 本次请求恰好用完配额时同样改用备用方案
+            if results or not self.quota.exhausted("tavily"):
+                return results
+
+        logger.warning("Tavily 不可用、已熔断或配额用尽，使用备用搜索方案")
+        try:
+            google_results = await self.google_search(query, 8, cost_tracker=cost_tracker)
+            if google_results:
+                return google_results
+            return await self.duckduckgo_search(query, 8, cost_tracker=cost_tracker)
+        except Exception as e:
+            logger.warning("Google搜索失败 (%s)，使用DuckDuckGo搜索", e)
+            return await self.duckduckgo_search(query, 8, cost_tracker=cost_tracker)
+
+    def rate_limit_snapshot(self) -> dict[str, dict[str, object]]:
+        return {name: limiter.snapshot() for name, limiter in self.rate_limits.items()}
+
+    def circuit_snapshot(self) -> dict[str, dict[str, object]]:
+        return {
+            name: breaker.snapshot() for name, breaker in self.circuit_breakers.items()
+        }
 
 
 # 全局实例
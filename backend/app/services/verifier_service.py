@@ -1,19 +1,46 @@
 from __future__ import annotations
 
-import json
+import asyncio
 import logging
 
 from ..llms.deepseek_llm import DeepSeekLLM
 from ..models.research_task import Citation
+from ..research.cost_tracker import CostTracker
+from ..research.deadline import Deadline
+from ..utils.json_parser import JSON_STOP_SEQUENCES
+from ..utils.json_parser import parse_json_object
 
 logger = logging.getLogger(__name__)
 
+VERIFIER_SYSTEM_PROMPT = """\
+你是研究质量审校员。请判断用户给出的分析是否被证据充分支持。
+
+请只返回 JSON：
+{
+  "passed": true,
+  "score": 0.0,
+  "issues": ["问题1"],
+  "summary": "一句话结论"
+}\
+"""
+
+VERIFIER_PROMPT_TEMPLATE = """\
+分析：
+{analysis}
+
+证据压缩：
+{compressed_evidence}
+
+引用：
+{citation_text}\
+"""
+
 
 class VerifierService:
     """Critic pass for section outputs with deterministic fallback."""
 
     def __init__(self) -> None:
-        self.llm = DeepSeekLLM()
+        self.llm = DeepSeekLLM(profile="verification")
 
     async def verify_section(
         self,
@@ -21,11 +48,15 @@ class VerifierService:
         analysis: str,
         citations: list[Citation],
         compressed_evidence: str,
+        cost_tracker: CostTracker | None = None,
+        deadline: Deadline | None = None,
     ) -> dict[str, object]:
         llm_result = await self._verify_with_llm(
             analysis=analysis,
             citations=citations,
             compressed_evidence=compressed_evidence,
+            cost_tracker=cost_tracker,
+            deadline=deadline,
         )
         if llm_result is not None:
             return llm_result
@@ -41,48 +72,53 @@ class VerifierService:
         analysis: str,
         citations: list[Citation],
         compressed_evidence: str,
+        cost_tracker: CostTracker | None = None,
+        deadline: Deadline | None = None,
     ) -> dict[str, object] | None:
         if not analysis.strip() or not compressed_evidence.strip():
             return None
+        if deadline is not None and deadline.expired:
+            return None
 
         citation_text = "\n".join(
             f"- {citation.title}: {citation.link}" for citation in citations[:5]
         )
-        prompt = f"""
-你是研究质量审校员。请判断下面的分析是否被证据充分支持。
-
-分析：
-{analysis}
-
-证据压缩：
-{compressed_evidence}
-
-引用：
-{citation_text or "无"}
-
-请只返回 JSON：
-{{
-  "passed": true,
-  "score": 0.0,
-  "issues": ["问题1"],
-  "summary": "一句话结论"
-}}
-"""
+        prompt = VERIFIER_PROMPT_TEMPLATE.format(
+            analysis=analysis,
+            compressed_evidence=compressed_evidence,
+            citation_text=citation_text or "无",
+        )
         try:
-            response = await self.llm._acall(prompt)
+            response = await asyncio.wait_for(
+                self.llm._acall(
+                    prompt,
+                    system_prompt=VERIFIER_SYSTEM_PROMPT,
+                    json_mode=True,
+                    stop=JSON_STOP_SEQUENCES,
+                    step="verification",
+                    cost_tracker=cost_tracker,
+                ),
+                deadline.timeout() if deadline is not None else None,
+            )
             parsed = self._parse_json(response)
             if parsed is None:
                 return None
-            parsed.setdefault("issues", [])
-            parsed.setdefault("score", 0.5)
-            parsed.setdefault("passed", False)
-            parsed.setdefault("summary", "")
-            parsed["method"] = "llm_critic"
-            return parsed
+            return self.normalize_verdict(parsed, "llm_critic")
         except Exception as exc:  # noqa: BLE001
             logger.warning("verifier llm critic failed: %s", exc)
             return None
 
+    def normalize_verdict(
+        self, parsed: dict[str, object], method: str
+    ) -> dict[str, object]:
+        """补齐 LLM 核查结论的缺省字段并标注来源方法。"""
+        parsed.setdefault("issues", [])
+        parsed.setdefault("score", 0.5)
+        parsed.setdefault("passed", False)
+        parsed.setdefault("summary", "")
+        parsed["method"] = method
+        return parsed
+
     def _deterministic_verify(
         self,
         *,
@@ -108,16 +144,7 @@ class VerifierService:
         }
 
     def _parse_json(self, response: str) -> dict[str, object] | None:
-        text = response.strip()
-        if "```json" in text:
-            text = text.split("```json", 1)[1].split("```", 1)[0].strip()
-        elif text.startswith("```"):
-            text = text.split("```", 1)[1].rsplit("```", 1)[0].strip()
-        try:
-            parsed = json.loads(text)
-        except json.JSONDecodeError:
-            return None
-        return parsed if isinstance(parsed, dict) else None
+        return parse_json_object(response)
 
 
 verifier_service = VerifierService()
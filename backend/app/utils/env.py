@@ -1,9 +1,13 @@
 from __future__ import annotations
 
+import logging
+import os
 from pathlib import Path
 
 from dotenv import load_dotenv
 
+logger = logging.getLogger(__name__)
+
 
 def load_project_env() -> None:
     """Load environment variables from stable project locations.
@@ -20,3 +24,27 @@ def load_project_env() -> None:
         load_dotenv(backend_env)
     if root_env.exists():
         load_dotenv(root_env)
+
+
+def env_int(name: str, default: int) -> int:
+    """读取整数环境变量；未设置时返回默认值，无法解析时记录警告并返回默认值。"""
+    raw = os.getenv(name)
+    if raw is None:
+        return default
+    try:
+        return int(raw)
+    except ValueError:
+        logger.warning("Invalid integer env %s=%r, using default %d", name, raw, default)
+        return default
+
+
+def env_float(name: str, default: float) -> float:
+    """读取浮点环境变量；未设置时返回默认值，无法解析时记录警告并返回默认值。"""
+    raw = os.getenv(name)
+    if raw is None:
+        return default
+    try:
+        return float(raw)
+    except ValueError:
+        logger.warning("Invalid float env %s=%r, using default %.2f", name, raw, default)
+        return default
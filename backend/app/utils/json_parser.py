@@ -0,0 +1,200 @@
+from __future__ import annotations
+
+import json
+import re
+
+_TRAILING_SCALAR = re.compile(r"[\w.+-]+$")
+
+# 结构化（JSON 模式）步骤的停止序列：顶格的 } 只出现在缩进输出的顶层对象结尾，
+# 紧跟空行的 } 是单行输出的结尾；在这里截停省掉模型附在 JSON 后面的解释文字。
+# 停止序列本身不会出现在输出里，缺的 } 由 parse_json_object 的截断修复补回
+JSON_STOP_SEQUENCES = ["\n}", "}\n\n"]
+
+
+def extract_json_text(text: str) -> str:
+    """去掉 Markdown 代码块和 JSON 前后的说明文字，返回从第一个 { 或 [ 开始的内容。"""
+    text = text.strip()
+    if "```" in text:
+        fenced = text.split("```", 1)[1]
+        if fenced.startswith("json"):
+            fenced = fenced[len("json"):]
+        text = fenced.split("```", 1)[0].strip()
+    starts = [index for index in (text.find("{"), text.find("[")) if index >= 0]
+    return text[min(starts):] if starts else ""
+
+
+def repair_json(text: str) -> str:
+    """补全被截断的 JSON：闭合未结束的字符串和括号，去掉悬空的逗号、键和冒号。
+
+    只处理"前缀合法、后面被截断"的情况，例如达到 max_tokens 或流式输出尚未结束。
+    """
+    stack, in_string, escaped, end = _scan(text)
+    repaired = text[:end]
+    if in_string and end == len(text):
+        if escaped:
+            repaired = repaired[:-1]
+        repaired += '"'
+    repaired = repaired.rstrip()
+    if not in_string:
+        # 截断在数字或 true/false/null 中间（如 "score": 0.）时丢掉这个不完整的值
+        scalar = _TRAILING_SCALAR.search(repaired)
+        if scalar is not None and not _is_json_scalar(scalar.group()):
+            repaired = repaired[:scalar.start()]
+    while True:
+        trimmed = repaired.rstrip()
+        if trimmed.endswith((",", ":")):
+            trimmed = trimmed[:-1].rstrip()
+        # 对象里只有键没有值（"key" 或 "key":）时把这个键也去掉
+        if stack and stack[-1] == "}" and trimmed.endswith('"'):
+            key_start = _dangling_key_start(trimmed)
+            if key_start is not None:
+                trimmed = trimmed[:key_start].rstrip()
+                if trimmed.endswith(","):
+                    trimmed = trimmed[:-1].rstrip()
+        if trimmed == repaired:
+            break
+        repaired = trimmed
+    return repaired + "".join(reversed(stack))
+
+
+def _scan(text: str) -> tuple[list[str], bool, bool, int]:
+    """扫描 JSON 前缀，返回 (待闭合括号栈, 是否停在字符串内, 是否停在转义符后, 有效结尾)。"""
+    scanner = _JSONScanner()
+    scanner.feed(text)
+    return scanner.stack, scanner.in_string, scanner.escaped, scanner.end
+
+
+class _JSONScanner:
+    """Character-level JSON prefix scanner whose state survives between feeds.
+
+    ``end`` is the number of characters that belong to the JSON value: it stops
+    at the closing bracket of the top-level value (trailing text is ignored) or
+    at an unmatched closing bracket. With ``skip_prefix`` everything before the
+    first ``{`` or ``[`` (prose, a code-fence opener) is skipped.
+    """
+
+    def __init__(self, *, skip_prefix: bool = False) -> None:
+        self.stack: list[str] = []
+        self.in_string = False
+        self.escaped = False
+        self.end = 0
+        self.done = False
+        self._waiting = skip_prefix
+
+    def feed(self, text: str) -> bool:
+        """扫描新增文本，返回其中是否有括号开闭或字符串闭合（结构可能有新内容）。"""
+        changed = False
+        for char in text:
+            if self.done:
+                break
+            if self._waiting:
+                if char not in "{[":
+                    self.end += 1
+                    continue
+                self._waiting = False
+            index = self.end
+            self.end += 1
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+                    changed = True
+                continue
+            if char == '"':
+                self.in_string = True
+            elif char in "{[":
+                self.stack.append("}" if char == "{" else "]")
+                changed = True
+            elif char in "}]":
+                if not self.stack:
+                    self.end = index
+                    self.done = True
+                    break
+                self.stack.pop()
+                changed = True
+                if not self.stack:
+                    # 顶层对象已经完整，忽略后面的多余文字
+                    self.done = True
+        return changed
+
+
+def _is_json_scalar(token: str) -> bool:
+    try:
+        json.loads(token)
+    except json.JSONDecodeError:
+        return False
+    return True
+
+
+def _dangling_key_start(text: str) -> int | None:
+    """text 以字符串结尾且该字符串是对象里没有值的键时，返回它的起始下标。"""
+    index = len(text) - 2
+    while index >= 0:
+        if text[index] == '"' and (index == 0 or text[index - 1] != "\\"):
+            break
+        index -= 1
+    if index < 0:
+        return None
+    before = text[:index].rstrip()
+    # 键前面是 { 或 ,；值前面是 :
+    if before.endswith(("{", ",")):
+        return index
+    return None
+
+
+def parse_json_object(text: str) -> dict[str, object] | None:
+    """宽松解析 LLM 输出中的 JSON 对象，容忍代码块、前后说明文字和截断。"""
+    candidate = extract_json_text(text)
+    if not candidate:
+        return None
+    for attempt in (candidate, repair_json(candidate)):
+        try:
+            parsed = json.loads(attempt)
+        except json.JSONDecodeError:
+            continue
+        return parsed if isinstance(parsed, dict) else None
+    return None
+
+
+class IncrementalJSONParser:
+    """Feed streamed text and read the best-effort JSON object parsed so far.
+
+    Each character is scanned once; the scanner state is kept between feeds.
+    The buffer is only re-parsed when a delta opens or closes a bracket or
+    closes a string, so the number of parses grows with the number of JSON
+    values rather than with the number of streamed chunks. Between those
+    points ``value`` keeps the last snapshot (a string still being generated
+    is not extended character by character).
+    """
+
+    def __init__(self) -> None:
+        self._buffer: list[str] = []
+        self._scanner = _JSONScanner(skip_prefix=True)
+        # 解析出 value 时是否停在字符串内（数组最后一项还没生成完）
+        self._value_in_string = False
+        self.value: dict[str, object] | None = None
+
+    def feed(self, delta: str) -> dict[str, object] | None:
+        self._buffer.append(delta)
+        if self._scanner.feed(delta):
+            parsed = parse_json_object(self.text)
+            if parsed is not None:
+                self.value = parsed
+                self._value_in_string = self._scanner.in_string
+        return self.value
+
+    def closed_items(self, key: str) -> list[object]:
+        """返回 key 对应数组中已经完整输出的元素，不含仍在生成中的最后一个字符串。"""
+        items = (self.value or {}).get(key)
+        if not isinstance(items, list):
+            return []
+        if self._value_in_string and items and isinstance(items[-1], str):
+            return items[:-1]
+        return list(items)
+
+    @property
+    def text(self) -> str:
+        return "".join(self._buffer)
@@ -0,0 +1,24 @@
+from __future__ import annotations
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate for providers that do not return usage metadata.
+
+    Latin text is roughly four characters per token; CJK characters are
+    closer to 0.6 tokens each, so they are counted separately.
+    """
+    if not text:
+        return 0
+    cjk_chars = sum(1 for char in text if _is_cjk(char))
+    other_chars = len(text) - cjk_chars
+    return max(1, round(other_chars / 4 + cjk_chars * 0.6))
+
+
+def _is_cjk(char: str) -> bool:
+    code = ord(char)
+    return (
+        0x4E00 <= code <= 0x9FFF  # CJK Unified Ideographs
+        or 0x3400 <= code <= 0x4DBF  # Extension A
+        or 0x3000 <= code <= 0x303F  # CJK 标点
+        or 0xFF00 <= code <= 0xFFEF  # 全角字符
+    )
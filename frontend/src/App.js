@@ -19,6 +19,8 @@ function AppContent() {
   const [isResearching, setIsResearching] = useState(false);
   const [researchData, setResearchData] = useState(null);
   const [streamingData, setStreamingData] = useState([]);
+  const [reportDraft, setReportDraft] = useState('');
+  const [quickAnswer, setQuickAnswer] = useState('');
   const [error, setError] = useState(null);
   const [backendStatus, setBackendStatus] = useState('checking');
   const [sidebarOpen, setSidebarOpen] = useState(false);
@@ -100,6 +102,65 @@ function AppContent() {
     }
   };
 
+  /**
+   * 处理开始/恢复研究共用的流式事件。
+   * adoptServerTaskId: 用服务端返回的任务 ID 替换临时 ID（仅新研究）；
+   * keepCompletionTime: 完成时用报告时间更新历史记录（恢复的研究）。
+   */
+  const handleStreamUpdate = (research, update, { adoptServerTaskId = false, keepCompletionTime = false } = {}) => {
+    // 报告增量只拼接到草稿预览，不进入进度日志
+    if (update.type === 'report_delta') {
+      setReportDraft((prev) => prev + (update.data?.delta || ''));
+      return;
+    }
+    // 初步回答增量同样只用于预览；完整的 quick_answer 事件会覆盖拼接结果
+    if (update.type === 'quick_answer_delta') {
+      setQuickAnswer((prev) => prev + (update.data?.delta || ''));
+      return;
+    }
+    if (update.type === 'quick_answer') {
+      setQuickAnswer(update.data?.answer || '');
+    }
+    const normalizedUpdate = {
+      ...update,
+      timestamp: update.timestamp || new Date().toISOString(),
+    };
+    setStreamingData((prev) => [...prev, normalizedUpdate]);
+
+    const serverTaskId = normalizedUpdate.data?.task_id || normalizedUpdate.data?.id;
+    if (adoptServerTaskId && serverTaskId && serverTaskId !== research.id) {
+      replaceResearchId(research.id, serverTaskId);
+      research.id = serverTaskId;
+      research.isTemporaryId = false;
+      activeResearchRef.current = research;
+    }
+
+    // 如果研究完成，设置最终数据
+    if (normalizedUpdate.type === 'report_complete') {
+      setResearchData(normalizedUpdate.data);
+      // 更新历史记录
+      updateResearch(research.id, {
+        result: normalizedUpdate.data,
+        status: 'completed',
+        ...(keepCompletionTime && {
+          timestamp: normalizedUpdate.data.timestamp || normalizedUpdate.timestamp,
+        }),
+      });
+      activeResearchRef.current = null;
+    } else if (normalizedUpdate.type === 'error') {
+      setError(normalizedUpdate.message);
+      updateResearch(research.id, {
+        status: 'failed',
+        error: normalizedUpdate.message,
+      });
+      activeResearchRef.current = null;
+    } else if (normalizedUpdate.type === 'step_retry') {
+      updateResearch(research.id, {
+        status: 'in_progress',
+      });
+    }
+  };
+
   const handleStartResearch = async (query) => {
     const requestController = new AbortController();
     activeRequestControllerRef.current = requestController;
@@ -107,6 +168,8 @@ function AppContent() {
     setError(null);
     setResearchData(null);
     setStreamingData([]);
+    setReportDraft('');
+    setQuickAnswer('');
 
     // 添加到历史记录
     const research = addResearch({
@@ -117,40 +180,11 @@ function AppContent() {
 
     try {
       // 使用流式API
-      await researchAPI.startResearchStream(query, (update) => {
-        const normalizedUpdate = {
-          ...update,
-          timestamp: update.timestamp || new Date().toISOString(),
-        };
-        setStreamingData((prev) => [...prev, normalizedUpdate]);
-
-        const serverTaskId = normalizedUpdate.data?.task_id || normalizedUpdate.data?.id;
-        if (serverTaskId && serverTaskId !== research.id) {
-          replaceResearchId(research.id, serverTaskId);
-          research.id = serverTaskId;
-          research.isTemporaryId = false;
-          activeResearchRef.current = research;
-        }
-
-        // 如果研究完成，设置最终数据
-        if (normalizedUpdate.type === 'report_complete') {
-          setResearchData(normalizedUpdate.data);
-          // 更新历史记录
-          updateResearch(research.id, {
-            result: normalizedUpdate.data,
-            status: 'completed',
-          });
-          activeResearchRef.current = null;
-        } else if (normalizedUpdate.type === 'error') {
-          setError(normalizedUpdate.message);
-          updateResearch(research.id, {
-            status: 'failed',
-            error: normalizedUpdate.message,
-          });
-          activeResearchRef.current = null;
-        }
-      }, { signal: requestController.signal });
-
+      await researchAPI.startResearchStream(
+        query,
+        (update) => handleStreamUpdate(research, update, { adoptServerTaskId: true }),
+        { signal: requestController.signal },
+      );
     } catch (err) {
       console.error('研究失败:', err);
 
@@ -215,37 +249,16 @@ function AppContent() {
     setError(null);
     setResearchData(null);
     setStreamingData([]);
+    setReportDraft('');
+    setQuickAnswer('');
     setCurrentResearch(research);
 
     try {
-      await researchAPI.resumeResearchStream(research.id, (update) => {
-        const normalizedUpdate = {
-          ...update,
-          timestamp: update.timestamp || new Date().toISOString(),
-        };
-        setStreamingData((prev) => [...prev, normalizedUpdate]);
-
-        if (normalizedUpdate.type === 'report_complete') {
-          setResearchData(normalizedUpdate.data);
-          updateResearch(research.id, {
-            result: normalizedUpdate.data,
-            status: 'completed',
-            timestamp: normalizedUpdate.data.timestamp || normalizedUpdate.timestamp,
-          });
-          activeResearchRef.current = null;
-        } else if (normalizedUpdate.type === 'error') {
-          setError(normalizedUpdate.message);
-          updateResearch(research.id, {
-            status: 'failed',
-            error: normalizedUpdate.message,
-          });
-          activeResearchRef.current = null;
-        } else if (normalizedUpdate.type === 'step_retry') {
-          updateResearch(research.id, {
-            status: 'in_progress',
-          });
-        }
-      }, { signal: requestController.signal });
+      await researchAPI.resumeResearchStream(
+        research.id,
+        (update) => handleStreamUpdate(research, update, { keepCompletionTime: true }),
+        { signal: requestController.signal },
+      );
     } catch (err) {
       if (err.message === '研究已停止') {
         markResearchStopped(research);
@@ -267,6 +280,8 @@ function AppContent() {
     setCurrentResearch(null);
     setResearchData(null);
     setStreamingData([]);
+    setReportDraft('');
+    setQuickAnswer('');
     setError(null);
 
     // 移动端关闭侧边栏
@@ -296,6 +311,8 @@ function AppContent() {
         setIsResearching(false);
         setResearchData(null);
         setStreamingData([]);
+        setReportDraft('');
+        setQuickAnswer('');
         setError(null);
         return;
       }
@@ -313,6 +330,8 @@ function AppContent() {
 
       setError(null);
       setStreamingData([]);
+      setReportDraft('');
+      setQuickAnswer('');
       setResearchData(null);
       setIsResearching(activeStatuses.has(currentResearch.status));
 
@@ -529,7 +548,7 @@ function AppContent() {
             {isResearching && (
               <div className="mt-8">
                 {streamingData.length > 0 ? (
-                  <StreamingResults updates={streamingData} />
+                  <StreamingResults updates={streamingData} reportDraft={reportDraft} quickAnswer={quickAnswer} />
                 ) : (
                   <LoadingSpinner message="正在进行深度研究..." />
                 )}
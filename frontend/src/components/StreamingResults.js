@@ -9,7 +9,7 @@ import {
   Zap,
 } from 'lucide-react';
 
-const StreamingResults = ({ updates }) => {
+const StreamingResults = ({ updates, reportDraft = '', quickAnswer = '' }) => {
   const scrollContainerRef = useRef(null);
   const [animatingIndex, setAnimatingIndex] = useState(null);
   const prevLengthRef = useRef(0);
@@ -383,6 +383,38 @@ const StreamingResults = ({ updates }) => {
         </div>
       )}
 
+      {/* Quick answer from initial search snippets, replaced once the report starts streaming */}
+      {quickAnswer && !reportDraft && !isComplete && (
+        <div className="px-6 py-4 border-b border-border-light">
+          <div className="flex items-center gap-2 mb-2">
+            <Zap className="w-4 h-4" style={{ color: '#054d28' }} />
+            <p className="text-xs font-semibold text-text-tertiary">初步回答（基于初始搜索，深度研究进行中）</p>
+          </div>
+          <div
+            className="rounded-xl px-5 py-4 max-h-80 overflow-y-auto text-text-primary whitespace-pre-wrap"
+            style={{ background: '#F5F8F2', fontSize: '14px', fontWeight: 400, lineHeight: 1.6 }}
+          >
+            {quickAnswer}
+          </div>
+        </div>
+      )}
+
+      {/* Report draft (streamed report_delta) */}
+      {reportDraft && !isComplete && (
+        <div className="px-6 py-4 border-b border-border-light">
+          <div className="flex items-center gap-2 mb-2">
+            <FileText className="w-4 h-4" style={{ color: '#054d28' }} />
+            <p className="text-xs font-semibold text-text-tertiary">报告草稿（生成中）</p>
+          </div>
+          <div
+            className="rounded-xl px-5 py-4 max-h-80 overflow-y-auto text-text-primary whitespace-pre-wrap"
+            style={{ background: '#F5F8F2', fontSize: '14px', fontWeight: 400, lineHeight: 1.6 }}
+          >
+            {reportDraft}
+          </div>
+        </div>
+      )}
+
       {/* Update log */}
       <div className="p-6">
         <div
@@ -3,8 +3,16 @@ from __future__ import annotations
 import sys
 from pathlib import Path
 
+import pytest
+
 
 ROOT = Path(__file__).resolve().parents[1]
 root_str = str(ROOT)
 if root_str not in sys.path:
     sys.path.insert(0, root_str)
+
+
+@pytest.fixture(autouse=True)
+def isolated_search_quota_db(tmp_path, monkeypatch):
+    """搜索配额默认持久化到 backend/data；测试中改写到临时目录，避免改动真实计数。"""
+    monkeypatch.setenv("SEARCH_QUOTA_DB_PATH", str(tmp_path / "search_quota.db"))
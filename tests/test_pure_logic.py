@@ -13,6 +13,7 @@ from __future__ import annotations
 
 import os
 import sqlite3
+from unittest.mock import AsyncMock
 from unittest.mock import MagicMock
 
 # ── 避免导入时触发真实 DB / env 初始化 ──────────────────────────────────────
@@ -25,13 +26,23 @@ from backend.app.core.orchestrator import ResearchOrchestrator
 from backend.app.models.research_task import Citation
 from backend.app.models.research_task import ResearchSection
 from backend.app.research.conductor import ResearchConductor
+from backend.app.research.deadline import Deadline
 from backend.app.research.writer import ResearchWriter
 from backend.app.research.source_curator import SourceCurator, _score_source
 from backend.app.research.models import ResearchSource
+from backend.app.research.models import SubQueryContext
+from backend.app.services.adaptive_limiter import AdaptiveConcurrencyLimiter
+from backend.app.services.circuit_breaker import CircuitBreaker
+from backend.app.services.circuit_breaker import CircuitState
 from backend.app.services.content_extraction_service import ContentExtractionService
 from backend.app.services.deepseek_service import DeepSeekService
 from backend.app.services.evidence_store import EvidenceStore
+from backend.app.services.llm_cache import LLMResponseCache
+from backend.app.services.rate_limiter import LLMRateLimiter
 from backend.app.services.research_repository import ResearchRepository
+from backend.app.services.retry_policy import RetryClass
+from backend.app.services.retry_policy import RetryPolicy
+from backend.app.services.retry_policy import RetryRule
 from backend.app.services.search_tools import SearchTools
 from backend.app.services.verifier_service import VerifierService
 from backend.app.research.cost_tracker import CostTracker
@@ -71,6 +82,7 @@ class TestResearchConductor:
                 self.evidence_store = EvidenceStore()
                 self.task_id = "task-1"
                 self.repository = repository
+                self.research_deadline = Deadline.after(None)
 
         conductor = ResearchConductor(ResearcherStub(repository))
         source = ResearchSource(
@@ -82,16 +94,16 @@ class TestResearchConductor:
             extracted_content="DeepSeek 被用于企业知识库和客服自动化，提升响应速度和准确率。",
         )
 
-        async def fake_search(query: str, max_results: int = 8):  # noqa: ARG001
+        async def fake_search(query: str, max_results: int = 8, deadline=None):  # noqa: ANN001, ARG001
             return [source]
 
         async def fake_plan(**kwargs):  # noqa: ANN003
-            return ["DeepSeek 企业应用案例"]
+            yield "DeepSeek 企业应用案例"
 
-        async def fake_scrape(sources, visited_urls, max_sources: int = 8):  # noqa: ANN001, ARG001
+        async def fake_scrape(sources, visited_urls, max_sources: int = 8, deadline=None):  # noqa: ANN001, ARG001
             return sources
 
-        async def fake_context(query: str, sources):  # noqa: ANN001, ARG001
+        async def fake_context(query: str, sources, deadline=None):  # noqa: ANN001, ARG001
             return "企业落地集中在知识库、客服和内部助手场景。"
 
         async def fake_verify(**kwargs):  # noqa: ANN003
@@ -103,7 +115,7 @@ class TestResearchConductor:
             }
 
         monkeypatch.setattr(conductor.retriever, "search", fake_search)
-        monkeypatch.setattr(conductor.query_planner, "plan", fake_plan)
+        monkeypatch.setattr(conductor.query_planner, "plan_stream", fake_plan)
         monkeypatch.setattr(conductor.scraper, "scrape", fake_scrape)
         monkeypatch.setattr(conductor.context_manager, "get_context", fake_context)
         monkeypatch.setattr(
@@ -139,6 +151,606 @@ class TestResearchConductor:
             ).fetchone()[0]
         assert evidence_count == 2
 
+    def _fused_conductor(self, monkeypatch, fused_result):  # noqa: ANN001
+        class ResearcherStub:
+            query = "DeepSeek"
+            max_sub_queries = 1
+            max_concurrency = 1
+            cost_tracker = CostTracker()
+            visited_urls: set[str] = set()
+            sub_queries: list[str] = []
+            research_sources: list = []
+            evidence_store = EvidenceStore()
+            task_id = None
+            repository = None
+            research_deadline = Deadline.after(None)
+
+        conductor = ResearchConductor(ResearcherStub())
+        conductor.fused_verification = True
+        source = ResearchSource(
+            title="Case", link="https://example.com/a", source="web", query="q",
+            snippet="DeepSeek 用于客服。",
+        )
+        calls: list[str] = []
+
+        async def fake_search(query, max_results=8, deadline=None):  # noqa: ANN001, ARG001
+            return [source]
+
+        async def fake_plan(**kwargs):  # noqa: ANN003
+            return
+            yield
+
+        async def fake_scrape(sources, visited_urls, max_sources=8, deadline=None):  # noqa: ANN001, ARG001
+            return sources
+
+        async def fake_fused(query, sources, **kwargs):  # noqa: ANN001, ANN003, ARG001
+            calls.append("fused")
+            return fused_result
+
+        async def fake_context(query, sources, deadline=None):  # noqa: ANN001, ARG001
+            calls.append("context")
+            return "两次调用的上下文"
+
+        async def fake_verify(**kwargs):  # noqa: ANN003
+            calls.append("verify")
+            return {"passed": False, "score": 0.4, "issues": [], "summary": ""}
+
+        monkeypatch.setattr(conductor.retriever, "search", fake_search)
+        monkeypatch.setattr(conductor.query_planner, "plan_stream", fake_plan)
+        monkeypatch.setattr(conductor.scraper, "scrape", fake_scrape)
+        monkeypatch.setattr(conductor.context_manager, "get_verified_context", fake_fused)
+        monkeypatch.setattr(conductor.context_manager, "get_context", fake_context)
+        monkeypatch.setattr(
+            "backend.app.research.conductor.verifier_service.verify_section", fake_verify
+        )
+        return conductor, calls
+
+    def test_fused_mode_uses_single_call(self, monkeypatch):
+        import asyncio
+
+        verdict = {"passed": True, "score": 0.9, "issues": [], "summary": "ok", "method": "llm_fused"}
+        conductor, calls = self._fused_conductor(monkeypatch, ("融合上下文", verdict))
+        contexts = asyncio.run(conductor.conduct_research())
+        assert calls == ["fused"]
+        assert contexts[0].context == "融合上下文"
+        assert contexts[0].verification["method"] == "llm_fused"
+
+    def test_fused_mode_falls_back_to_two_calls(self, monkeypatch):
+        import asyncio
+
+        conductor, calls = self._fused_conductor(monkeypatch, None)
+        contexts = asyncio.run(conductor.conduct_research())
+        assert calls == ["fused", "context", "verify"]
+        assert contexts[0].context == "两次调用的上下文"
+
+    def test_context_manager_parses_fused_response(self, monkeypatch):
+        import asyncio
+
+        from backend.app.research.context_manager import ResearchContextManager
+
+        manager = ResearchContextManager(CostTracker())
+        source = ResearchSource(title="A", link="https://a.example", source="web", query="q", snippet="s")
+        responses = iter([
+            '```json\n{"context": "- 要点", "verification": {"passed": true, "score": 0.8}}\n```',
+            '{"context": "- 要点"}',
+            "不是 JSON",
+        ])
+
+        class FakeLLM:
+            async def _acall(self, prompt, **kwargs):  # noqa: ANN001, ANN003, ARG002
+                assert kwargs["step"] == "context_verification"
+                return next(responses)
+
+        monkeypatch.setattr(manager, "fused_llm", FakeLLM())
+
+        async def run():
+            kwargs = {"citations": [], "compressed_evidence": "证据"}
+            return [
+                await manager.get_verified_context("q", [source], **kwargs)
+                for _ in range(3)
+            ]
+
+        fused, without_verdict, unparsable = asyncio.run(run())
+        assert fused == ("- 要点", {"passed": True, "score": 0.8, "issues": [], "summary": "", "method": "llm_fused"})
+        assert without_verdict[1]["method"] == "deterministic_fallback"
+        assert unparsable is None
+
+
+class TestStreamingPlanner:
+    def _planner(self, deltas, gate=None):  # noqa: ANN001
+        from types import SimpleNamespace
+
+        from backend.app.research.query_planner import QueryPlanner
+
+        planner = QueryPlanner.__new__(QueryPlanner)
+        planner.cost_tracker = None
+
+        class FakeLLM:
+            async def _astream(self, prompt, **kwargs):  # noqa: ANN001, ANN003, ARG002
+                for index, delta in enumerate(deltas):
+                    if gate is not None and index == len(deltas) - 1:
+                        await gate.wait()
+                    yield SimpleNamespace(text=delta)
+
+        planner.llm = FakeLLM()
+        return planner
+
+    def test_yields_each_sub_query_as_its_string_closes(self):
+        import asyncio
+
+        async def run():
+            gate = asyncio.Event()
+            planner = self._planner(
+                ['{"sub_queries": ["A', ' 历史", "B', ' 案例"', ', "C"]}'], gate
+            )
+            received = []
+            async for sub_query in planner.plan_stream(query="q", initial_results=[]):
+                received.append(sub_query)
+                if sub_query == "B 案例":
+                    # 最后一个分片还没放行时，前两个子查询已经产出
+                    assert received == ["A 历史", "B 案例"]
+                    gate.set()
+            return received
+
+        assert asyncio.run(run()) == ["A 历史", "B 案例", "C"]
+
+    def test_falls_back_when_stream_yields_nothing_usable(self):
+        import asyncio
+
+        planner = self._planner(["{}"])
+
+        async def run():
+            return [q async for q in planner.plan_stream(query="q", initial_results=[], max_sub_queries=2)]
+
+        assert asyncio.run(run()) == ["q", "q 历史发展 最新进展"]
+
+    def test_conductor_starts_sub_queries_before_planning_finishes(self, monkeypatch):
+        import asyncio
+
+        class ResearcherStub:
+            query = "DeepSeek"
+            max_sub_queries = 2
+            max_concurrency = 2
+            cost_tracker = CostTracker()
+            visited_urls: set[str] = set()
+            sub_queries: list[str] = []
+            research_sources: list = []
+            research_deadline = Deadline.after(None)
+
+        conductor = ResearchConductor(ResearcherStub())
+        started: list[str] = []
+
+        async def fake_search(query, max_results=8, deadline=None):  # noqa: ANN001, ARG001
+            return []
+
+        async def fake_plan(**kwargs):  # noqa: ANN003
+            yield "子查询 A"
+            await asyncio.sleep(0.01)
+            assert started == ["子查询 A"]
+            yield "子查询 B"
+
+        async def fake_process(step, sub_query, on_event=None, on_started=None):  # noqa: ANN001
+            await on_started()
+            started.append(sub_query)
+            await conductor._emit(on_event, "search_result", "", {"step": step})
+            return SubQueryContext(step=step, query=sub_query)
+
+        monkeypatch.setattr(conductor.retriever, "search", fake_search)
+        monkeypatch.setattr(conductor.query_planner, "plan_stream", fake_plan)
+        monkeypatch.setattr(conductor, "_process_sub_query", fake_process)
+
+        events = []
+
+        async def collect_event(event):  # noqa: ANN001
+            events.append(event)
+
+        asyncio.run(conductor.conduct_research(on_event=collect_event))
+        types = [event["type"] for event in events]
+        assert types.index("plan") < types.index("step_start")
+        plan = next(event for event in events if event["type"] == "plan")
+        assert plan["data"]["sub_queries"] == ["子查询 A", "子查询 B", "DeepSeek"]
+        starts = [event["data"] for event in events if event["type"] == "step_start"]
+        assert {data["total"] for data in starts} == {3}
+
+
+class TestSpeculativePlanning:
+    def _conductor(self, monkeypatch, speculative_plan):  # noqa: ANN001
+        import asyncio
+
+        class ResearcherStub:
+            query = "DeepSeek"
+            max_sub_queries = 2
+            max_concurrency = 2
+            cost_tracker = CostTracker()
+            visited_urls: set[str] = set()
+            sub_queries: list[str] = []
+            research_sources: list = []
+            research_deadline = Deadline.after(None)
+
+        conductor = ResearchConductor(ResearcherStub())
+        conductor.speculative_planning = True
+        planned = asyncio.Event()
+        plan_calls: list[list] = []
+        initial = [
+            ResearchSource(
+                title="DeepSeek 企业应用",
+                link="https://t.example",
+                source="web",
+                query="q",
+                snippet="投机子查询相关的案例与数据",
+            )
+        ]
+
+        async def fake_search(query, max_results=8, deadline=None):  # noqa: ANN001, ARG001
+            if query == "DeepSeek":
+                # 投机规划与初始搜索并行：搜索返回前规划已经产出
+                await asyncio.wait_for(planned.wait(), 1)
+                return initial
+            return []
+
+        async def fake_plan(*, initial_results, fallback=True, **kwargs):  # noqa: ANN001, ANN003
+            plan_calls.append(initial_results)
+            items = speculative_plan if not initial_results else ["基于结果的子查询"]
+            for item in items:
+                yield item
+            planned.set()
+
+        async def fake_process(step, sub_query, on_event=None, on_started=None):  # noqa: ANN001, ARG001
+            return SubQueryContext(step=step, query=sub_query)
+
+        monkeypatch.setattr(conductor.retriever, "search", fake_search)
+        monkeypatch.setattr(conductor.query_planner, "plan_stream", fake_plan)
+        monkeypatch.setattr(conductor, "_process_sub_query", fake_process)
+        return conductor, plan_calls, initial
+
+    def test_speculative_plan_is_kept(self, monkeypatch):
+        import asyncio
+
+        conductor, plan_calls, _ = self._conductor(monkeypatch, ["投机子查询"])
+        contexts = asyncio.run(conductor.conduct_research())
+        assert [context.query for context in contexts] == ["投机子查询", "DeepSeek"]
+        assert plan_calls == [[]]
+
+    def test_rejected_speculative_plan_replans_with_search_results(self, monkeypatch):
+        import asyncio
+
+        conductor, plan_calls, initial = self._conductor(monkeypatch, [])
+        events = []
+
+        async def collect_event(event):  # noqa: ANN001
+            events.append(event)
+
+        contexts = asyncio.run(conductor.conduct_research(on_event=collect_event))
+        assert [context.query for context in contexts] == ["基于结果的子查询", "DeepSeek"]
+        assert plan_calls == [[], initial]
+        plan = next(event for event in events if event["type"] == "plan")
+        assert plan["data"]["speculative"] is False
+
+    def test_off_target_speculative_plan_is_replaced(self, monkeypatch):
+        import asyncio
+
+        conductor, plan_calls, initial = self._conductor(
+            monkeypatch, ["投机子查询", "量子计算硬件路线"]
+        )
+
+        async def fake_process(step, sub_query, on_event=None, on_started=None):  # noqa: ANN001, ARG001
+            if sub_query == "量子计算硬件路线":
+                await asyncio.sleep(10)
+            return SubQueryContext(step=step, query=sub_query)
+
+        monkeypatch.setattr(conductor, "_process_sub_query", fake_process)
+        conductor.speculative_min_grounded = 0.75
+        events = []
+
+        async def collect_event(event):  # noqa: ANN001
+            events.append(event)
+
+        contexts = asyncio.run(conductor.conduct_research(on_event=collect_event))
+        # 偏题的子查询被取消；保留有依据的，按搜索结果补足名额
+        assert [context.query for context in contexts] == ["投机子查询", "基于结果的子查询", "DeepSeek"]
+        assert [context.step for context in contexts] == [1, 3, 4]
+        assert plan_calls == [[], initial]
+        plan = next(event for event in events if event["type"] == "plan")
+        assert plan["data"]["speculative"] is False
+        assert plan["data"]["speculative_dropped"] == ["量子计算硬件路线"]
+
+    def test_mostly_grounded_speculative_plan_is_kept(self, monkeypatch):
+        import asyncio
+
+        conductor, plan_calls, _ = self._conductor(
+            monkeypatch, ["投机子查询", "量子计算硬件路线"]
+        )
+        contexts = asyncio.run(conductor.conduct_research())
+        assert [context.query for context in contexts] == [
+            "投机子查询",
+            "量子计算硬件路线",
+            "DeepSeek",
+        ]
+        assert plan_calls == [[]]
+
+
+class TestQuickAnswer:
+    def _conductor(self, monkeypatch, *, enabled):  # noqa: ANN001
+        import asyncio
+
+        answered = asyncio.Event()
+
+        class WriterStub:
+            async def write_quick_answer(self, *, query, sources, on_delta=None, deadline=None):  # noqa: ANN001, ARG002
+                await on_delta("初步")
+                answered.set()
+                return f"初步回答：{query}（{len(sources)} 个来源）"
+
+        class ResearcherStub:
+            query = "DeepSeek"
+            max_sub_queries = 1
+            max_concurrency = 1
+            cost_tracker = CostTracker()
+            visited_urls: set[str] = set()
+            sub_queries: list[str] = []
+            research_sources: list = []
+            research_deadline = Deadline.after(None)
+            writer = WriterStub()
+
+        conductor = ResearchConductor(ResearcherStub())
+        conductor.quick_answer = enabled
+        initial = [ResearchSource(title="T", link="https://t.example", source="web", query="q")]
+
+        async def fake_search(query, max_results=8, deadline=None):  # noqa: ANN001, ARG001
+            return initial
+
+        async def fake_plan(**kwargs):  # noqa: ANN003
+            yield "子查询 A"
+
+        async def fake_process(step, sub_query, on_event=None, on_started=None):  # noqa: ANN001, ARG001
+            if enabled:
+                # 深度研究与初步回答并行：子查询运行期间初步回答已经送达
+                await asyncio.wait_for(answered.wait(), 1)
+            return SubQueryContext(step=step, query=sub_query)
+
+        monkeypatch.setattr(conductor.retriever, "search", fake_search)
+        monkeypatch.setattr(conductor.query_planner, "plan_stream", fake_plan)
+        monkeypatch.setattr(conductor, "_process_sub_query", fake_process)
+        return conductor
+
+    def _run(self, conductor):  # noqa: ANN001
+        import asyncio
+
+        events = []
+
+        async def collect_event(event):  # noqa: ANN001
+            events.append(event)
+
+        contexts = asyncio.run(conductor.conduct_research(on_event=collect_event))
+        return contexts, events
+
+    def test_quick_answer_is_emitted_while_research_continues(self, monkeypatch):
+        contexts, events = self._run(self._conductor(monkeypatch, enabled=True))
+        types = [event["type"] for event in events]
+
+        assert [context.query for context in contexts] == ["子查询 A", "DeepSeek"]
+        assert types.index("quick_answer_delta") < types.index("quick_answer")
+        assert types.index("quick_answer") < types.index("step_complete")
+        quick = events[types.index("quick_answer")]["data"]
+        assert quick["answer"] == "初步回答：DeepSeek（1 个来源）"
+        assert quick["preliminary"] is True
+        assert quick["sources"][0]["link"] == "https://t.example"
+
+    def test_disabled_by_default(self, monkeypatch):
+        monkeypatch.delenv("RESEARCH_QUICK_ANSWER", raising=False)
+        conductor = self._conductor(monkeypatch, enabled=False)
+        assert ResearchConductor(conductor.researcher).quick_answer is False
+        _, events = self._run(conductor)
+        assert not any(event["type"].startswith("quick_answer") for event in events)
+
+
+class TestStagePipeline:
+    def test_search_for_later_sub_query_overlaps_llm_work(self, monkeypatch):
+        import asyncio
+
+        from backend.app.research.conductor import StageLimits
+
+        monkeypatch.setenv("RESEARCH_LLM_CONCURRENCY", "1")
+        monkeypatch.setenv("RESEARCH_SEARCH_CONCURRENCY", "2")
+        assert StageLimits.from_env(3) == StageLimits(search=2, fetch=4, llm=1)
+
+        class ResearcherStub:
+            query = "DeepSeek"
+            max_sub_queries = 2
+            max_concurrency = 1
+            cost_tracker = CostTracker()
+            visited_urls: set[str] = set()
+            sub_queries: list[str] = []
+            research_sources: list = []
+            evidence_store = EvidenceStore()
+            task_id = None
+            repository = None
+            research_deadline = Deadline.after(None)
+
+        conductor = ResearchConductor(ResearcherStub())
+        source = ResearchSource(title="T", link="https://t.example", source="web", query="q")
+        searched: dict[str, asyncio.Event] = {}
+
+        async def fake_search(query, max_results=8, deadline=None):  # noqa: ANN001, ARG001
+            searched.setdefault(query, asyncio.Event()).set()
+            return [source]
+
+        async def fake_plan(**kwargs):  # noqa: ANN003
+            yield "子查询 A"
+            yield "子查询 B"
+
+        async def fake_scrape(sources, visited_urls, max_sources=8, deadline=None):  # noqa: ANN001, ARG001
+            return sources
+
+        async def fake_context(query, sources, deadline=None):  # noqa: ANN001, ARG001
+            if query == "子查询 A":
+                # 占着唯一的 LLM 名额时，另一个子查询的搜索仍能进行
+                event = searched.setdefault("子查询 B", asyncio.Event())
+                await asyncio.wait_for(event.wait(), 1)
+            return f"{query} 上下文"
+
+        async def fake_verify(**kwargs):  # noqa: ANN003
+            return {"passed": True}
+
+        monkeypatch.setattr(conductor.retriever, "search", fake_search)
+        monkeypatch.setattr(conductor.query_planner, "plan_stream", fake_plan)
+        monkeypatch.setattr(conductor.scraper, "scrape", fake_scrape)
+        monkeypatch.setattr(conductor.context_manager, "get_context", fake_context)
+        monkeypatch.setattr(
+            "backend.app.research.conductor.verifier_service.verify_section", fake_verify
+        )
+
+        contexts = asyncio.run(conductor.conduct_research())
+        assert [context.context for context in contexts] == [
+            "子查询 A 上下文",
+            "子查询 B 上下文",
+            "DeepSeek 上下文",
+        ]
+
+
+    def test_step_start_waits_for_search_slot(self, monkeypatch):
+        import asyncio
+
+        monkeypatch.setenv("RESEARCH_SEARCH_CONCURRENCY", "1")
+
+        class ResearcherStub:
+            query = "DeepSeek"
+            max_sub_queries = 2
+            max_concurrency = 3
+            cost_tracker = CostTracker()
+            visited_urls: set[str] = set()
+            sub_queries: list[str] = []
+            research_sources: list = []
+            evidence_store = EvidenceStore()
+            task_id = None
+            repository = None
+            research_deadline = Deadline.after(None)
+
+        conductor = ResearchConductor(ResearcherStub())
+
+        async def fake_search(query, max_results=8, deadline=None):  # noqa: ANN001, ARG001
+            await asyncio.sleep(0.01)
+            return []
+
+        async def fake_plan(**kwargs):  # noqa: ANN003
+            yield "子查询 A"
+            yield "子查询 B"
+
+        async def fake_scrape(sources, visited_urls, max_sources=8, deadline=None):  # noqa: ANN001, ARG001
+            return sources
+
+        async def fake_context(query, sources, deadline=None):  # noqa: ANN001, ARG001
+            return f"{query} 上下文"
+
+        async def fake_verify(**kwargs):  # noqa: ANN003
+            return {"passed": True}
+
+        monkeypatch.setattr(conductor.retriever, "search", fake_search)
+        monkeypatch.setattr(conductor.query_planner, "plan_stream", fake_plan)
+        monkeypatch.setattr(conductor.scraper, "scrape", fake_scrape)
+        monkeypatch.setattr(conductor.context_manager, "get_context", fake_context)
+        monkeypatch.setattr(
+            "backend.app.research.conductor.verifier_service.verify_section", fake_verify
+        )
+        events = []
+
+        async def collect_event(event):  # noqa: ANN001
+            events.append(event)
+
+        asyncio.run(conductor.conduct_research(on_event=collect_event))
+
+        order = [
+            (event["type"], event["data"]["step"])
+            for event in events
+            if event["type"] in {"step_start", "search_result"} and event["data"]["step"] > 0
+        ]
+        # 搜索名额为 1 时，上一个子查询搜索结束后下一个才算开始
+        assert order == [
+            ("step_start", 1),
+            ("search_result", 1),
+            ("step_start", 2),
+            ("search_result", 2),
+            ("step_start", 3),
+            ("search_result", 3),
+        ]
+
+
+class TestEnvHelpers:
+    def test_invalid_values_fall_back_with_warning(self, monkeypatch, caplog):
+        import logging
+
+        from backend.app.utils.env import env_float
+        from backend.app.utils.env import env_int
+
+        monkeypatch.setenv("TEST_ENV_INT", "abc")
+        monkeypatch.setenv("TEST_ENV_FLOAT", "1.5")
+        monkeypatch.delenv("TEST_ENV_MISSING", raising=False)
+        with caplog.at_level(logging.WARNING, logger="backend.app.utils.env"):
+            assert env_int("TEST_ENV_INT", 3) == 3
+            assert env_float("TEST_ENV_FLOAT", 0.0) == 1.5
+            assert env_int("TEST_ENV_MISSING", 7) == 7
+        assert "TEST_ENV_INT" in caplog.text
+
+
+class TestDeadline:
+    def test_unbounded_deadline_never_expires(self):
+        deadline = Deadline.after(None)
+        assert deadline.remaining() is None
+        assert deadline.timeout(5) == 5
+        assert not deadline.expired
+
+    def test_timeout_is_capped_by_remaining_time(self):
+        now = [100.0]
+        deadline = Deadline.after(30, clock=lambda: now[0])
+        assert deadline.timeout(90) == 30
+        assert deadline.shifted(-10).timeout() == 20
+        now[0] = 131.0
+        assert deadline.expired
+        assert deadline.timeout(90) == 0.0
+
+    def test_conductor_skips_sub_queries_after_deadline(self, monkeypatch):
+        import asyncio
+
+        class ResearcherStub:
+            query = "DeepSeek"
+            max_sub_queries = 2
+            max_concurrency = 1
+            cost_tracker = CostTracker()
+            visited_urls: set[str] = set()
+            sub_queries: list[str] = []
+            research_sources: list = []
+            research_deadline = Deadline(0.0, clock=lambda: 1.0)
+
+        conductor = ResearchConductor(ResearcherStub())
+        received = {}
+
+        async def fake_search(query, max_results=8, deadline=None):  # noqa: ANN001, ARG001
+            received["deadline"] = deadline
+            return []
+
+        async def fake_plan(**kwargs):  # noqa: ANN003
+            yield "子查询 A"
+
+        async def fail_process(*args, **kwargs):  # noqa: ANN002, ANN003
+            raise AssertionError("expired sub-queries must not run")
+
+        monkeypatch.setattr(conductor.retriever, "search", fake_search)
+        monkeypatch.setattr(conductor.query_planner, "plan_stream", fake_plan)
+        monkeypatch.setattr(conductor, "_process_sub_query", fail_process)
+
+        events = []
+
+        async def collect_event(event):  # noqa: ANN001
+            events.append(event)
+
+        contexts = asyncio.run(conductor.conduct_research(on_event=collect_event))
+
+        assert [context.status for context in contexts] == ["skipped", "skipped"]
+        assert received["deadline"] is ResearcherStub.research_deadline
+        completed = [event for event in events if event["type"] == "step_complete"]
+        assert {event["data"]["status"] for event in completed} == {"skipped"}
+        assert not [event for event in events if event["type"] == "step_start"]
+
 
 class TestResearchWriter:
     def test_format_context_prefers_sections_with_verification_and_evidence(self):
@@ -232,74 +844,367 @@ class TestResearchWriter:
 
         assert "- [1] A: https://example.com/a\n- [2] B: https://example.com/b" in report
 
+    def test_partial_report_is_marked_and_falls_back_at_deadline(self, monkeypatch):
+        import asyncio
 
-class TestSearchTools:
-    def test_google_search_uses_thread_offload(self, monkeypatch):
-        search_tools = SearchTools()
-        search_tools.serpapi_key = "test-serpapi"
-
-        async def fake_to_thread(func, *args, **kwargs):  # noqa: ANN001
-            return func(*args, **kwargs)
+        writer = ResearchWriter()
 
-        monkeypatch.setattr("backend.app.services.search_tools.asyncio.to_thread", fake_to_thread)
-        monkeypatch.setattr(
-            search_tools,
-            "_sync_google_search",
-            MagicMock(return_value=[{"title": "A", "link": "https://a.com"}]),
+        async def slow_acall(prompt, **kwargs):  # noqa: ANN001, ANN003
+            await asyncio.sleep(10)
+            return "never"
+
+        monkeypatch.setattr(writer.llm, "_acall", slow_acall)
+        report = asyncio.run(
+            writer.write_report(
+                query="DeepSeek",
+                sections=[],
+                context=[],
+                sources=[],
+                deadline=Deadline.after(0.05),
+                incomplete_queries=["未完成方向"],
+            )
         )
 
+        assert report.startswith("> ⚠️ 部分报告")
+        assert "> - 未完成方向" in report
+        assert "降级模式" in report
+
+    def test_report_sends_static_system_prompt_before_task_data(self, monkeypatch):
         import asyncio
 
-        result = asyncio.run(search_tools.google_search("DeepSeek"))
+        from backend.app.research.writer import REPORT_SYSTEM_PROMPT
+        from backend.app.research.writer import REPORT_SYSTEM_ROLE
 
-        search_tools._sync_google_search.assert_called_once_with("DeepSeek", 10)
-        assert result == [{"title": "A", "link": "https://a.com"}]
+        writer = ResearchWriter()
+        seen = []
 
+        async def fake_acall(prompt, **kwargs):  # noqa: ANN001, ANN003
+            seen.append((prompt, kwargs["system_prompt"]))
+            return "report"
 
-# ═══════════════════════════════════════════════════════════════════
-# SourceCurator — 可信度评分
-# ═══════════════════════════════════════════════════════════════════
+        monkeypatch.setattr(writer.llm, "_acall", fake_acall)
+        for query in ("问题一", "问题二"):
+            asyncio.run(
+                writer.write_report(query=query, sections=[], context=[], sources=[])
+            )
 
-class TestScoreSource:
-    def test_gov_domain_gets_high_score(self):
-        source = ResearchSource(title="T", link="https://data.gov.cn/report", snippet="s" * 60, extracted_content="c" * 300)
-        score = _score_source(source)
-        assert score >= 0.7
+        assert seen[0][1] == seen[1][1] == REPORT_SYSTEM_PROMPT
+        assert REPORT_SYSTEM_ROLE in REPORT_SYSTEM_PROMPT
+        assert "问题一" in seen[0][0] and "问题一" not in REPORT_SYSTEM_PROMPT
 
-    def test_academic_domain_gets_high_score(self):
-        source = ResearchSource(title="T", link="https://arxiv.org/abs/1234", snippet="s" * 60, extracted_content="c" * 300)
-        score = _score_source(source)
-        assert score >= 0.7
+    def _drafted_sections(self):
+        return [
+            ResearchSection(
+                id="subquery-1",
+                step=1,
+                title="A 维度",
+                description="desc",
+                status="completed",
+                analysis="A 的研究上下文",
+                citations=[
+                    Citation(title="Alpha", link="https://example.com/alpha", source="web"),
+                    Citation(title="Beta", link="https://example.com/beta", source="web"),
+                ],
+            ),
+            ResearchSection(
+                id="subquery-2",
+                step=2,
+                title="B 维度",
+                description="desc",
+                status="completed",
+                analysis="B 的研究上下文",
+            ),
+        ]
 
-    def test_social_media_gets_low_score(self):
-        source = ResearchSource(title="T", link="https://reddit.com/r/test", snippet="s" * 60, extracted_content="c" * 300)
-        score = _score_source(source)
-        assert score < 0.5
+    def test_section_draft_cites_local_sources(self, monkeypatch):
+        import asyncio
 
-    def test_empty_link_returns_zero(self):
-        source = ResearchSource(title="T", link="", snippet="s")
-        assert _score_source(source) == 0.0
+        from backend.app.research.writer import SECTION_DRAFT_SYSTEM_PROMPT
 
-    def test_authoritative_media_gets_bonus(self):
-        source = ResearchSource(title="T", link="https://www.reuters.com/article/123", snippet="s" * 60, extracted_content="c" * 300)
-        score = _score_source(source)
-        assert score >= 0.7
+        writer = ResearchWriter()
+        seen = []
 
-    def test_no_content_slightly_lower(self):
-        source_with = ResearchSource(title="T", link="https://example.com/a", snippet="s" * 60, extracted_content="c" * 300)
-        source_without = ResearchSource(title="T", link="https://example.com/b", snippet="short", extracted_content="")
-        assert _score_source(source_with) > _score_source(source_without)
+        async def fake_acall(prompt, **kwargs):  # noqa: ANN001, ANN003
+            seen.append((prompt, kwargs))
+            return " 发现 [S2]，另见 [S1]。 "
 
+        monkeypatch.setattr(writer.draft_llm, "_acall", fake_acall)
+        section = self._drafted_sections()[0]
+        draft = asyncio.run(writer.draft_section(query="DeepSeek", section=section))
 
-class TestSourceCurator:
-    curator = SourceCurator()
+        assert draft == "发现 [S2]，另见 [S1]。"
+        prompt, kwargs = seen[0]
+        assert kwargs["step"] == "section_drafting"
+        assert kwargs["system_prompt"] == SECTION_DRAFT_SYSTEM_PROMPT
+        assert "[S1] Alpha - https://example.com/alpha" in prompt
+        assert "[S2] Beta - https://example.com/beta" in prompt
+        assert "A 的研究上下文" in prompt
 
-    def test_deduplicates_by_link(self):
-        sources = [
-            ResearchSource(title="A", link="https://a.com", snippet="content"),
-            ResearchSource(title="A2", link="https://a.com", snippet="other"),
-        ]
-        result = self.curator.curate(sources)
+    def test_merged_report_renumbers_drafts_and_streams_whole_report(self, monkeypatch):
+        import asyncio
+        from types import SimpleNamespace
+
+        writer = ResearchWriter()
+        merge_prompts = []
+
+        async def fake_astream(prompt, **kwargs):  # noqa: ANN001, ANN003
+            merge_prompts.append((prompt, kwargs["step"]))
+            yield SimpleNamespace(text="## 执行摘要\n\n摘要 [1]")
+
+        async def fail_acall(prompt, **kwargs):  # noqa: ANN001, ANN003
+            raise AssertionError("map-reduce mode must not send the full report prompt")
+
+        monkeypatch.setattr(writer.merge_llm, "_astream", fake_astream)
+        monkeypatch.setattr(writer.llm, "_acall", fail_acall)
+        deltas = []
+
+        async def collect_delta(delta):  # noqa: ANN001
+            deltas.append(delta)
+
+        report = asyncio.run(
+            writer.write_report(
+                query="DeepSeek",
+                sections=self._drafted_sections(),
+                context=[],
+                sources=[ResearchSource(title="Beta", link="https://example.com/beta")],
+                on_delta=collect_delta,
+                section_drafts={1: "发现 [S2]，另见 [S1] 与 [S7]。"},
+            )
+        )
+
+        assert report.startswith("# DeepSeek\n\n## 执行摘要")
+        # 全局编号：beta 来自 sources 排第一，alpha 来自章节引用排第二；越界编号被去掉
+        assert "### A 维度\n\n发现 [1]，另见 [2] 与 。" in report
+        assert "### B 维度\n\nB 的研究上下文" in report
+        assert "[1] Beta - https://example.com/beta\n[2] Alpha - https://example.com/alpha" in report
+        assert "".join(deltas) == report
+        assert merge_prompts[0][1] == "report_merge"
+        assert "发现 [1]" in merge_prompts[0][0]
+
+    def test_merge_failure_keeps_section_drafts(self, monkeypatch):
+        import asyncio
+
+        writer = ResearchWriter()
+
+        async def failing_astream(prompt, **kwargs):  # noqa: ANN001, ANN003
+            raise RuntimeError("merge unavailable")
+            yield
+
+        monkeypatch.setattr(writer.merge_llm, "_astream", failing_astream)
+        report = asyncio.run(
+            writer.write_report(
+                query="DeepSeek",
+                sections=self._drafted_sections(),
+                context=[],
+                sources=[],
+                section_drafts={1: "草稿 A"},
+                incomplete_queries=["未完成方向"],
+            )
+        )
+
+        assert report.startswith("> ⚠️ 部分报告")
+        assert "执行摘要生成失败" in report
+        assert "### A 维度\n\n草稿 A" in report
+
+    def test_quick_answer_streams_from_search_snippets(self, monkeypatch):
+        import asyncio
+        from types import SimpleNamespace
+
+        writer = ResearchWriter()
+        prompts = []
+
+        async def fake_astream(prompt, **kwargs):  # noqa: ANN001, ANN003
+            prompts.append((prompt, kwargs["step"]))
+            for delta in ("初步", "回答 [1]"):
+                yield SimpleNamespace(text=delta)
+
+        monkeypatch.setattr(writer.quick_llm, "_astream", fake_astream)
+        deltas = []
+
+        async def collect_delta(delta):  # noqa: ANN001
+            deltas.append(delta)
+
+        sources = [
+            ResearchSource(title="A", link="https://a.example", snippet="DeepSeek 用于客服。"),
+            ResearchSource(title="B", link="https://b.example"),
+        ]
+        answer = asyncio.run(
+            writer.write_quick_answer(query="DeepSeek", sources=sources, on_delta=collect_delta)
+        )
+
+        assert answer == "初步回答 [1]"
+        assert deltas == ["初步", "回答 [1]"]
+        assert prompts[0][1] == "quick_answer"
+        assert "[1] A - https://a.example\nDeepSeek 用于客服。" in prompts[0][0]
+        assert "b.example" not in prompts[0][0]  # 没有摘要的来源不进入提示词
+        # 没有任何摘要时不调用 LLM
+        assert asyncio.run(writer.write_quick_answer(query="q", sources=sources[1:])) == ""
+        assert len(prompts) == 1
+
+
+class TestSearchTools:
+    def test_google_search_calls_provider_directly(self, monkeypatch):
+        search_tools = SearchTools()
+        search_tools.serpapi_key = "test-serpapi"
+
+        monkeypatch.setattr(
+            search_tools,
+            "_google_request",
+            AsyncMock(return_value=[{"title": "A", "link": "https://a.com"}]),
+        )
+
+        import asyncio
+
+        result = asyncio.run(search_tools.google_search("DeepSeek"))
+
+        search_tools._google_request.assert_awaited_once_with("DeepSeek", 10)
+        assert result == [{"title": "A", "link": "https://a.com"}]
+
+    def test_provider_requests_share_one_pooled_client(self):
+        import asyncio
+        import json
+
+        import httpx
+
+        requests_seen = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            requests_seen.append(request)
+            if request.url.host == "api.tavily.com":
+                return httpx.Response(
+                    200,
+                    json={"results": [{"title": "T", "url": "https://t.example", "content": "x" * 400}]},
+                )
+            return httpx.Response(
+                200,
+                json={"organic_results": [{"title": "G", "link": "https://g.example", "snippet": "g"}]},
+            )
+
+        tools = SearchTools(transport=httpx.MockTransport(handler))
+        tools.tavily_api_key = "tvly-key"
+        tools.serpapi_key = "serp-key"
+
+        async def run():
+            tavily = await tools._tavily_request("DeepSeek", 10)
+            client = tools._http_client
+            google = await tools._google_request("DeepSeek", 5)
+            assert tools._http_client is client  # 同一事件循环内复用连接池
+            await tools.aclose()
+            return tavily, google, client
+
+        tavily, google, client = asyncio.run(run())
+
+        assert tavily[0]["link"] == "https://t.example"
+        assert tavily[0]["snippet"].endswith("...") and len(tavily[0]["snippet"]) == 303
+        assert google == [
+            {"title": "G", "link": "https://g.example", "snippet": "g", "source": "google"}
+        ]
+        assert requests_seen[0].headers["Authorization"] == "Bearer tvly-key"
+        assert json.loads(requests_seen[0].content)["max_results"] == 8
+        assert requests_seen[1].url.params["q"] == "DeepSeek"
+        assert client.is_closed and tools._http_client is None
+
+    def test_duckduckgo_reuses_client_per_thread(self, monkeypatch):
+        import asyncio
+
+        created = []
+
+        class FakeDDGS:
+            def __init__(self):
+                created.append(self)
+
+            def text(self, query, max_results=10):  # noqa: ANN001
+                return [{"title": query, "href": "https://d.example", "body": "b"}]
+
+        monkeypatch.setattr("duckduckgo_search.DDGS", FakeDDGS)
+        tools = SearchTools()
+
+        assert tools._sync_duckduckgo_search("a")[0]["link"] == "https://d.example"
+        tools._sync_duckduckgo_search("b")
+        assert len(created) == 1
+        asyncio.run(tools.aclose())
+        tools._sync_duckduckgo_search("c")
+        assert len(created) == 2
+
+    def test_aclose_releases_duckduckgo_clients_from_every_thread(self, monkeypatch):
+        import asyncio
+        import threading
+
+        created = []
+        closed = []
+
+        class FakeDDGS:
+            def __init__(self):
+                created.append(self)
+
+            def __exit__(self, exc_type, exc, tb):  # noqa: ANN001
+                closed.append(self)
+
+            def text(self, query, max_results=10):  # noqa: ANN001
+                return []
+
+        monkeypatch.setattr("duckduckgo_search.DDGS", FakeDDGS)
+        tools = SearchTools()
+
+        workers = [
+            threading.Thread(target=tools._sync_duckduckgo_search, args=("q",))
+            for _ in range(3)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        assert len(created) == 3
+
+        asyncio.run(tools.aclose())
+        assert closed == created
+        assert tools._ddgs_clients == []
+
+
+# ═══════════════════════════════════════════════════════════════════
+# SourceCurator — 可信度评分
+# ═══════════════════════════════════════════════════════════════════
+
+class TestScoreSource:
+    def test_gov_domain_gets_high_score(self):
+        source = ResearchSource(title="T", link="https://data.gov.cn/report", snippet="s" * 60, extracted_content="c" * 300)
+        score = _score_source(source)
+        assert score >= 0.7
+
+    def test_academic_domain_gets_high_score(self):
+        source = ResearchSource(title="T", link="https://arxiv.org/abs/1234", snippet="s" * 60, extracted_content="c" * 300)
+        score = _score_source(source)
+        assert score >= 0.7
+
+    def test_social_media_gets_low_score(self):
+        source = ResearchSource(title="T", link="https://reddit.com/r/test", snippet="s" * 60, extracted_content="c" * 300)
+        score = _score_source(source)
+        assert score < 0.5
+
+    def test_empty_link_returns_zero(self):
+        source = ResearchSource(title="T", link="", snippet="s")
+        assert _score_source(source) == 0.0
+
+    def test_authoritative_media_gets_bonus(self):
+        source = ResearchSource(title="T", link="https://www.reuters.com/article/123", snippet="s" * 60, extracted_content="c" * 300)
+        score = _score_source(source)
+        assert score >= 0.7
+
+    def test_no_content_slightly_lower(self):
+        source_with = ResearchSource(title="T", link="https://example.com/a", snippet="s" * 60, extracted_content="c" * 300)
+        source_without = ResearchSource(title="T", link="https://example.com/b", snippet="short", extracted_content="")
+        assert _score_source(source_with) > _score_source(source_without)
+
+
+class TestSourceCurator:
+    curator = SourceCurator()
+
+    def test_deduplicates_by_link(self):
+        sources = [
+            ResearchSource(title="A", link="https://a.com", snippet="content"),
+            ResearchSource(title="A2", link="https://a.com", snippet="other"),
+        ]
+        result = self.curator.curate(sources)
         assert len(result) == 1
 
     def test_filters_empty_link(self):
@@ -393,6 +1298,102 @@ class TestParseJson:
     def test_returns_none_when_root_is_list(self):
         assert self.svc._parse_json("[1, 2, 3]") is None
 
+    def test_tolerates_truncation_and_surrounding_text(self):
+        raw = '好的：{"passed": true, "issues": ["缺少数据", "来源单一'
+        assert self.svc._parse_json(raw) == {
+            "passed": True,
+            "issues": ["缺少数据", "来源单一"],
+        }
+        assert self.svc._parse_json('{"passed": true, "score": 0.') == {"passed": True}
+        assert self.svc._parse_json('{"summary": "ok"} 以上是结论') == {"summary": "ok"}
+
+
+class TestIncrementalJSONParser:
+    def test_feed_exposes_growing_partial_object(self):
+        from backend.app.utils.json_parser import IncrementalJSONParser
+
+        parser = IncrementalJSONParser()
+        snapshots = [
+            parser.feed(delta)
+            for delta in ['{"sub_q', 'ueries": ["A', '", "B"', ']}']
+        ]
+        assert snapshots[0] == {}
+        assert snapshots[1] == {"sub_queries": ["A"]}
+        assert snapshots[2] == {"sub_queries": ["A", "B"]}
+        assert snapshots[3] == {"sub_queries": ["A", "B"]}
+        assert parser.text == '{"sub_queries": ["A", "B"]}'
+
+    def test_reparses_only_when_a_value_closes(self, monkeypatch):
+        import backend.app.utils.json_parser as json_parser
+
+        parses = []
+        real_parse = json_parser.parse_json_object
+
+        def counting_parse(text):  # noqa: ANN001
+            parses.append(len(text))
+            return real_parse(text)
+
+        monkeypatch.setattr(json_parser, "parse_json_object", counting_parse)
+        parser = json_parser.IncrementalJSONParser()
+        text = '```json\n{"sub_queries": ["' + "长" * 200 + '", "' + "短" * 200 + '"]}\n```'
+        closed = []
+        for char in text:
+            parser.feed(char)
+            closed.append(len(parser.closed_items("sub_queries")))
+
+        # { [ ] } 与键、两个元素共 3 个字符串闭合；逐字符输入 400 多个分片也只解析 7 次
+        assert len(parses) == 7
+        assert parser.value == {"sub_queries": ["长" * 200, "短" * 200]}
+        # 第二项生成过程中只报告已闭合的第一项
+        assert closed[text.index("短") + 10] == 1
+        assert closed[-1] == 2
+
+    def test_planner_salvages_non_json_lines(self):
+        from backend.app.research.query_planner import QueryPlanner
+
+        planner = QueryPlanner.__new__(QueryPlanner)
+        raw = "子查询如下：\n1. 固态电池 成本\n- 固态电池 量产时间"
+        assert planner._parse_sub_queries(raw, 5) == ["固态电池 成本", "固态电池 量产时间"]
+        truncated = '{"sub_queries": ["固态电池 成本", "固态电池 量产'
+        assert planner._parse_sub_queries(truncated, 5) == ["固态电池 成本", "固态电池 量产"]
+
+    def test_structured_steps_send_stop_sequences(self, monkeypatch):
+        import asyncio
+
+        from langchain_core.outputs import GenerationChunk
+
+        from backend.app.research.query_planner import QueryPlanner
+        from backend.app.utils.json_parser import JSON_STOP_SEQUENCES
+
+        planner = QueryPlanner()
+        verifier = VerifierService()
+        seen = {}
+
+        async def fake_astream(prompt, stop=None, **kwargs):  # noqa: ANN001, ANN003
+            seen["planner"] = stop
+            # 缩进输出在顶层 } 之前被停止序列截断
+            for text in ('{\n  "sub_queries": [\n    "固态电池 成本",\n', '    "固态电池 量产"\n  ]'):
+                yield GenerationChunk(text=text)
+
+        async def fake_acall(prompt, stop=None, **kwargs):  # noqa: ANN001, ANN003
+            seen["verifier"] = stop
+            return '{"status": "supported", "confidence": 0.9'
+
+        monkeypatch.setattr(planner.llm, "_astream", fake_astream)
+        monkeypatch.setattr(verifier.llm, "_acall", fake_acall)
+
+        async def run():
+            planned = await planner.plan(query="固态电池", initial_results=[])
+            verdict = await verifier._verify_with_llm(
+                analysis="分析", citations=[], compressed_evidence="证据"
+            )
+            return planned, verdict
+
+        planned, verdict = asyncio.run(run())
+        assert planned == ["固态电池 成本", "固态电池 量产"]
+        assert seen == {"planner": JSON_STOP_SEQUENCES, "verifier": JSON_STOP_SEQUENCES}
+        assert verdict["status"] == "supported"
+
 
 # ═══════════════════════════════════════════════════════════════════
 # ContentExtractionService — HTML 清洗（无网络）
@@ -501,6 +1502,16 @@ class TestBuildPayload:
         assert payload["stream"] is False
         assert payload["messages"][0]["content"] == "hello"
 
+    def test_json_mode_and_stop_sequences_are_sent_and_keyed(self):
+        payload = self.svc._build_payload(
+            "x", max_tokens=100, stream=False, json_mode=True, stop=["\n\n"]
+        )
+        assert payload["response_format"] == {"type": "json_object"}
+        assert payload["stop"] == ["\n\n"]
+        plain = self.svc._build_payload("x", max_tokens=100, stream=False)
+        assert "response_format" not in plain and "stop" not in plain
+        assert self.svc._payload_key(payload) != self.svc._payload_key(plain)
+
     def test_max_tokens_is_capped_at_default_limit(self):
         payload = self.svc._build_payload("x", max_tokens=9999, stream=False)
         assert payload["max_tokens"] == 4000
@@ -540,35 +1551,1707 @@ class TestBuildPayload:
         payload = self.svc._build_payload("x", max_tokens=100, stream=True)
         assert payload["stream"] is True
 
+    def test_system_prompt_is_sent_first(self):
+        payload = self.svc._build_payload(
+            "data", max_tokens=100, stream=False, system_prompt="static"
+        )
+        assert payload["messages"] == [
+            {"role": "system", "content": "static"},
+            {"role": "user", "content": "data"},
+        ]
 
-# ═══════════════════════════════════════════════════════════════════
-# CostTracker
-# ═══════════════════════════════════════════════════════════════════
+    def test_cache_key_covers_system_prompt(self):
+        first = self.svc._payload_key(
+            self.svc._build_payload("u", 100, False, system_prompt="a")
+        )
+        second = self.svc._payload_key(
+            self.svc._build_payload("u", 100, False, system_prompt="b")
+        )
+        assert first != second
 
-class TestCostTracker:
-    def test_estimates_tokens_from_characters(self):
-        assert estimate_tokens("") == 0
-        assert estimate_tokens("abcd") == 1
-        assert estimate_tokens("a" * 40) == 10
 
-    def test_tracks_llm_call_with_configured_rates(self):
-        tracker = CostTracker(
-            input_cost_per_1m_tokens=1.0,
-            output_cost_per_1m_tokens=2.0,
+def _no_delay_retry_policy(max_retries: int = 2) -> RetryPolicy:
+    return RetryPolicy(
+        rules={
+            retry_class: RetryRule(
+                max_retries=0 if retry_class is RetryClass.CLIENT_ERROR else max_retries,
+                base_delay=0.0,
+                max_delay=0.0,
+            )
+            for retry_class in RetryClass
+        }
+    )
+
+
+class TestDeepSeekTransport:
+    def _service(self, handler):  # noqa: ANN001
+        import httpx
+
+        return DeepSeekService(
+            transport=httpx.MockTransport(handler),
+            retry_policy=_no_delay_retry_policy(),
         )
-        tracker.track_llm_call(
-            step="query_planning",
-            prompt="a" * 400,
-            response="b" * 200,
+
+    def test_async_calls_share_one_pooled_client(self):
+        import asyncio
+
+        calls = []
+
+        def handler(request):  # noqa: ANN001
+            import httpx
+
+            calls.append(request.url.path)
+            return httpx.Response(
+                200,
+                json={"choices": [{"message": {"content": "ok"}}]},
+            )
+
+        svc = self._service(handler)
+
+        async def run():
+            first = await svc.generate_response("hello")
+            client = svc._async_client
+            second = await svc.generate_response("again")
+            assert svc._async_client is client
+            await svc.aclose()
+            return first, second
+
+        assert asyncio.run(run()) == ("ok", "ok")
+        assert calls == ["/v1/chat/completions", "/v1/chat/completions"]
+        assert svc._async_client is None
+
+    def test_new_event_loop_gets_fresh_client(self):
+        import asyncio
+
+        import httpx
+
+        svc = self._service(
+            lambda request: httpx.Response(
+                200, json={"choices": [{"message": {"content": "ok"}}]}
+            )
         )
-        summary = tracker.summary()
-        assert summary["pricing_source"] == "defaults_or_env"
-        assert summary["total_input_tokens"] == 100
-        assert summary["total_output_tokens"] == 50
-        assert summary["estimated_cost_usd"] == 0.0002
-        assert summary["calls"][0]["step"] == "query_planning"
 
-    def test_model_defaults_to_deepseek_config(self, monkeypatch):
-        monkeypatch.setenv("DEEPSEEK_MODEL", "deepseek-reasoner")
-        tracker = CostTracker()
-        assert tracker.summary()["model"] == "deepseek-reasoner"
+        async def grab_client():
+            await svc.generate_response("hello")
+            return svc._async_client
+
+        first = asyncio.run(grab_client())
+        second = asyncio.run(grab_client())
+        assert first is not second
+
+    def test_stream_response_yields_deltas_incrementally(self):
+        import asyncio
+        import json
+
+        import httpx
+
+        chunks = [
+            {"choices": [{"delta": {"role": "assistant"}}]},
+            {"choices": [{"delta": {"content": "# 报"}}]},
+            {"choices": [{"delta": {"content": "告"}}]},
+        ]
+        body = "".join(f"data: {json.dumps(chunk)}\n\n" for chunk in chunks)
+        body += "data: [DONE]\n\n"
+
+        def handler(request):  # noqa: ANN001
+            assert json.loads(request.content)["stream"] is True
+            return httpx.Response(
+                200,
+                content=body.encode("utf-8"),
+                headers={"Content-Type": "text/event-stream"},
+            )
+
+        svc = self._service(handler)
+
+        async def collect():
+            return [delta async for delta in svc.stream_response("hello")]
+
+        assert asyncio.run(collect()) == ["# 报", "告"]
+
+    def test_usage_block_is_returned_with_completion(self):
+        import asyncio
+
+        import httpx
+
+        svc = self._service(
+            lambda request: httpx.Response(
+                200,
+                json={
+                    "choices": [{"message": {"content": "ok"}}],
+                    "usage": {
+                        "prompt_tokens": 12,
+                        "completion_tokens": 3,
+                        "prompt_cache_hit_tokens": 8,
+                        "prompt_cache_miss_tokens": 4,
+                    },
+                },
+            )
+        )
+        completion = asyncio.run(svc.complete("hello"))
+        assert completion.has_usage
+        assert (completion.prompt_tokens, completion.completion_tokens) == (12, 3)
+        assert completion.prompt_cache_hit_tokens == 8
+        assert completion.latency_seconds >= 0
+
+    def test_stream_usage_chunk_is_captured(self):
+        import asyncio
+        import json
+
+        import httpx
+
+        chunks = [
+            {"choices": [{"delta": {"content": "hi"}}]},
+            {"choices": [], "usage": {"prompt_tokens": 5, "completion_tokens": 1}},
+        ]
+        body = "".join(f"data: {json.dumps(chunk)}\n\n" for chunk in chunks)
+        body += "data: [DONE]\n\n"
+        requests_seen = []
+
+        def handler(request):  # noqa: ANN001
+            requests_seen.append(json.loads(request.content))
+            return httpx.Response(200, text=body)
+
+        svc = self._service(handler)
+        usage = {}
+
+        async def run():
+            return [d async for d in svc.stream_response("hello", usage=usage)]
+
+        assert asyncio.run(run()) == ["hi"]
+        assert usage == {"prompt_tokens": 5, "completion_tokens": 1}
+        assert requests_seen[0]["stream_options"] == {"include_usage": True}
+
+    def test_stream_response_raises_on_error_status(self):
+        import asyncio
+
+        import httpx
+        import pytest
+
+        svc = self._service(lambda request: httpx.Response(503, text="busy"))
+
+        async def collect():
+            return [delta async for delta in svc.stream_response("hello")]
+
+        with pytest.raises(Exception, match="503"):
+            asyncio.run(collect())
+
+    def test_sync_path_reuses_session(self):
+        svc = DeepSeekService()
+        assert svc._get_session() is svc._get_session()
+        assert svc._sync_timeout() == (
+            svc.config.connect_timeout,
+            svc.config.read_timeout,
+        )
+
+
+class TestRetryPolicy:
+    policy = RetryPolicy()
+
+    def test_classifies_status_codes(self):
+        assert self.policy.classify_status(429) is RetryClass.RATE_LIMITED
+        assert self.policy.classify_status(503) is RetryClass.SERVER_ERROR
+        assert self.policy.classify_status(408) is RetryClass.TIMEOUT
+        assert self.policy.classify_status(401) is RetryClass.CLIENT_ERROR
+
+    def test_client_errors_are_not_retried_by_default(self):
+        assert self.policy.next_delay(RetryClass.CLIENT_ERROR, 0) is None
+
+    def test_backoff_grows_and_is_capped(self):
+        policy = RetryPolicy(
+            rules={RetryClass.SERVER_ERROR: RetryRule(max_retries=10, base_delay=1.0, max_delay=4.0)},
+            jitter=0.0,
+        )
+        delays = [policy.next_delay(RetryClass.SERVER_ERROR, attempt) for attempt in range(4)]
+        assert delays == [1.0, 2.0, 4.0, 4.0]
+        assert policy.next_delay(RetryClass.SERVER_ERROR, 10) is None
+
+    def test_jitter_stays_within_ceiling(self):
+        for _ in range(20):
+            delay = self.policy.next_delay(RetryClass.RATE_LIMITED, 1)
+            assert 2.0 <= delay <= 4.0
+
+    def test_retry_after_is_honoured(self):
+        assert self.policy.next_delay(RetryClass.RATE_LIMITED, 0, retry_after=7.0) == 7.0
+        assert self.policy.next_delay(RetryClass.RATE_LIMITED, 0, retry_after=600.0) is None
+
+    def test_parse_retry_after_supports_seconds_and_http_date(self):
+        from datetime import datetime, timedelta, timezone
+        from email.utils import format_datetime
+
+        assert RetryPolicy.parse_retry_after("3") == 3.0
+        assert RetryPolicy.parse_retry_after(None) is None
+        assert RetryPolicy.parse_retry_after("garbage") is None
+        future = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=30), usegmt=True)
+        assert 25 <= RetryPolicy.parse_retry_after(future) <= 30
+
+
+class TestDeepSeekRetries:
+    def _service(self, responses):  # noqa: ANN001
+        import httpx
+
+        calls = []
+
+        def handler(request):  # noqa: ANN001
+            calls.append(request)
+            return responses[min(len(calls), len(responses)) - 1]
+
+        svc = DeepSeekService(
+            transport=httpx.MockTransport(handler),
+            retry_policy=_no_delay_retry_policy(),
+        )
+        return svc, calls
+
+    def test_server_error_is_retried_and_reported(self):
+        import asyncio
+
+        import httpx
+
+        svc, calls = self._service(
+            [
+                httpx.Response(503, text="busy"),
+                httpx.Response(429, text="slow down", headers={"Retry-After": "0"}),
+                httpx.Response(200, json={"choices": [{"message": {"content": "ok"}}]}),
+            ]
+        )
+        completion = asyncio.run(svc.complete("hello"))
+        assert completion.text == "ok"
+        assert completion.retries == 2
+        assert completion.retry_reasons == {"server_error": 1, "rate_limited": 1}
+        assert len(calls) == 3
+
+    def test_client_error_fails_fast(self):
+        import asyncio
+
+        import httpx
+        import pytest
+
+        from backend.app.services.deepseek_service import DeepSeekAPIError
+
+        svc, calls = self._service([httpx.Response(401, text="bad key")])
+        with pytest.raises(DeepSeekAPIError) as excinfo:
+            asyncio.run(svc.complete("hello"))
+        assert excinfo.value.status_code == 401
+        assert excinfo.value.retry_class is RetryClass.CLIENT_ERROR
+        assert len(calls) == 1
+
+    def test_exhausted_retries_carry_stats(self):
+        import asyncio
+
+        import httpx
+        import pytest
+
+        from backend.app.services.deepseek_service import DeepSeekAPIError
+
+        svc, calls = self._service([httpx.Response(500, text="down")])
+        with pytest.raises(DeepSeekAPIError) as excinfo:
+            asyncio.run(svc.complete("hello"))
+        assert excinfo.value.retries == 2
+        assert len(calls) == 3
+
+
+class TestCircuitBreaker:
+    def _breaker(self, now):  # noqa: ANN001
+        return CircuitBreaker(
+            "test", failure_threshold=2, reset_timeout=10, clock=lambda: now[0]
+        )
+
+    def test_opens_after_consecutive_failures_and_rejects(self):
+        now = [0.0]
+        breaker = self._breaker(now)
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        assert breaker.state is CircuitState.CLOSED
+        breaker.record_failure()
+        assert breaker.state is CircuitState.OPEN
+        assert breaker.allow_request() is False
+        assert breaker.snapshot()["rejected"] == 1
+
+    def test_half_open_probe_closes_or_reopens(self):
+        now = [0.0]
+        breaker = self._breaker(now)
+        breaker.record_failure()
+        breaker.record_failure()
+        now[0] = 10.0
+        assert breaker.allow_request() is True
+        assert breaker.allow_request() is False  # 同一时刻只放行一个探测
+        breaker.record_failure()
+        assert breaker.state is CircuitState.OPEN
+
+        now[0] = 20.0
+        assert breaker.allow_request() is True
+        breaker.record_success()
+        assert breaker.state is CircuitState.CLOSED
+        assert breaker.snapshot()["times_opened"] == 2
+
+    def test_abandoned_half_open_probe_releases_slot(self):
+        now = [0.0]
+        breaker = self._breaker(now)
+        breaker.record_failure()
+        breaker.record_failure()
+        now[0] = 10.0
+        with breaker.probe() as allowed:
+            assert allowed is True
+            assert breaker.allow_request() is False
+        # 没有记录结果的探测退出后归还名额，熔断器保持半开
+        assert breaker.state is CircuitState.HALF_OPEN
+        assert breaker.allow_request() is True
+        # allow_request 放行后从不回报的探测在冷却时长后过期
+        assert breaker.allow_request() is False
+        now[0] = 20.0
+        assert breaker.allow_request() is True
+
+    def test_cancelled_llm_probe_does_not_wedge_breaker(self):
+        import asyncio
+
+        import httpx
+
+        now = [0.0]
+        calls = []
+
+        async def handler(request):  # noqa: ANN001
+            calls.append(request)
+            if len(calls) == 1:
+                await asyncio.sleep(1)
+            return httpx.Response(200, json={"choices": [{"message": {"content": "ok"}}]})
+
+        breaker = CircuitBreaker(
+            "deepseek", failure_threshold=1, reset_timeout=10, clock=lambda: now[0]
+        )
+        breaker.record_failure()
+        now[0] = 10.0
+        svc = DeepSeekService(
+            transport=httpx.MockTransport(handler),
+            retry_policy=_no_delay_retry_policy(max_retries=0),
+            circuit_breaker=breaker,
+        )
+
+        async def run():
+            try:
+                await asyncio.wait_for(svc.complete("probe"), 0.05)
+            except TimeoutError:
+                pass
+            return await svc.complete("after")
+
+        completion = asyncio.run(run())
+        assert completion.text == "ok"
+        assert breaker.state is CircuitState.CLOSED
+
+    def test_open_llm_circuit_fails_fast_without_http(self):
+        import asyncio
+
+        import httpx
+        import pytest
+
+        from backend.app.services.deepseek_service import DeepSeekCircuitOpenError
+
+        calls = []
+
+        def handler(request):  # noqa: ANN001
+            calls.append(request)
+            return httpx.Response(503, text="down")
+
+        svc = DeepSeekService(
+            transport=httpx.MockTransport(handler),
+            retry_policy=_no_delay_retry_policy(max_retries=5),
+            circuit_breaker=CircuitBreaker("deepseek", failure_threshold=2),
+        )
+
+        async def run():
+            for _ in range(2):
+                with pytest.raises(DeepSeekCircuitOpenError):
+                    await svc.complete("hello")
+
+        asyncio.run(run())
+        # 第一次调用失败两次后熔断、不再重试；第二次调用根本不发请求
+        assert len(calls) == 2
+
+    def test_search_skips_open_tavily_and_uses_fallback(self, monkeypatch):
+        import asyncio
+
+        from backend.app.services.search_tools import OptionalSearchConfig
+
+        tools = SearchTools()
+        tools.tavily_api_key = "key"
+        tools.serpapi_key = None
+        tools.optional = OptionalSearchConfig(providers=())
+        tools.circuit_breakers["tavily"] = CircuitBreaker("tavily", failure_threshold=1)
+        tools.circuit_breakers["tavily"].record_failure()
+
+        async def fake_ddg(query, num_results=10, cost_tracker=None):  # noqa: ANN001, ARG001
+            return [{"title": "D", "link": "https://d.example"}]
+
+        monkeypatch.setattr(tools, "duckduckgo_search", fake_ddg)
+        monkeypatch.setattr(
+            tools, "_tavily_request", AsyncMock(side_effect=AssertionError)
+        )
+
+        results = asyncio.run(tools.comprehensive_search("q"))
+        assert results["web"] == [{"title": "D", "link": "https://d.example"}]
+        assert tools.circuit_snapshot()["tavily"]["state"] == "open"
+
+
+class TestSearchFanout:
+    def _tools(self, **fanout):  # noqa: ANN003
+        from backend.app.services.search_tools import FanoutConfig
+
+        from backend.app.services.search_quota import SearchQuotaTracker
+        from backend.app.services.search_tools import OptionalSearchConfig
+
+        tools = SearchTools()
+        tools.tavily_api_key = "tvly"
+        tools.serpapi_key = "serp"
+        tools.cache.enabled = False
+        tools.fanout = FanoutConfig(enabled=True, **fanout)
+        tools.optional = OptionalSearchConfig(providers=())
+        tools.quota = SearchQuotaTracker()
+        return tools
+
+    def test_rrf_dedups_urls_and_rewards_agreement(self):
+        from backend.app.services.search_tools import reciprocal_rank_fusion
+
+        tavily = [
+            {"title": "A", "link": "https://a.example/page"},
+            {"title": "B", "link": "https://b.example"},
+        ]
+        google = [
+            {"title": "B2", "link": "http://www.b.example/"},
+            {"title": "C", "link": "https://c.example#top"},
+            {"title": "no link", "link": ""},
+        ]
+
+        merged = reciprocal_rank_fusion([tavily, google], k=60)
+
+        # b.example 被两个搜索源返回，排名第一；保留排名更靠前的那条
+        assert [item["title"] for item in merged] == ["B2", "A", "C"]
+        assert reciprocal_rank_fusion([tavily, google], limit=1) == merged[:1]
+
+    def test_fanout_returns_at_quorum_without_waiting_for_slow_provider(self, monkeypatch):
+        import asyncio
+
+        tools = self._tools(quorum=2, budget=5.0)
+        slow_cancelled = []
+
+        async def fast(results):  # noqa: ANN001
+            return results
+
+        async def slow(query, num_results):  # noqa: ANN001, ARG001
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                slow_cancelled.append(True)
+                raise
+
+        monkeypatch.setattr(
+            tools, "_tavily_request", lambda q, n: fast([{"title": "T", "link": "https://t.example"}])
+        )
+        monkeypatch.setattr(
+            tools, "_google_request", lambda q, n: fast([{"title": "G", "link": "https://g.example"}])
+        )
+        monkeypatch.setattr(tools, "_duckduckgo_request", slow)
+
+        async def run():
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            results = await tools.comprehensive_search("q")
+            elapsed = loop.time() - started
+            await asyncio.sleep(0)
+            return results, elapsed
+
+        results, elapsed = asyncio.run(run())
+
+        assert elapsed < 1
+        assert [item["link"] for item in results["web"]] == ["https://t.example", "https://g.example"]
+        assert slow_cancelled == [True]
+        # 被取消的搜索源不计入熔断
+        assert tools.circuit_breakers["duckduckgo"].snapshot()["consecutive_failures"] == 0
+
+    def test_fanout_cancelled_half_open_probe_is_released(self, monkeypatch):
+        import asyncio
+
+        tools = self._tools(quorum=1, budget=5.0)
+        now = [0.0]
+        breaker = CircuitBreaker("google", failure_threshold=1, reset_timeout=10, clock=lambda: now[0])
+        breaker.record_failure()
+        now[0] = 10.0
+        tools.circuit_breakers["google"] = breaker
+
+        async def fast(query, num_results):  # noqa: ANN001, ARG001
+            return [{"title": "T", "link": "https://t.example"}]
+
+        async def slow(query, num_results):  # noqa: ANN001, ARG001
+            await asyncio.sleep(5)
+
+        monkeypatch.setattr(tools, "_tavily_request", fast)
+        monkeypatch.setattr(tools, "_google_request", slow)
+        monkeypatch.setattr(tools, "_duckduckgo_request", slow)
+
+        async def run():
+            results = await tools.fanout_search("q")
+            await asyncio.sleep(0)  # 让被取消的任务执行完清理
+            return results
+
+        assert asyncio.run(run())[0]["title"] == "T"
+        assert breaker.state is CircuitState.HALF_OPEN
+        assert breaker.allow_request() is True
+
+    def test_fanout_per_provider_timeout_counts_as_failure(self, monkeypatch):
+        import asyncio
+
+        tools = self._tools(quorum=3, provider_timeout=0.05, budget=2.0)
+
+        async def hang(query, num_results):  # noqa: ANN001, ARG001
+            await asyncio.sleep(5)
+
+        async def ddg(query, num_results):  # noqa: ANN001, ARG001
+            return [{"title": "D", "link": "https://d.example"}]
+
+        monkeypatch.setattr(tools, "_tavily_request", hang)
+        monkeypatch.setattr(tools, "_google_request", hang)
+        monkeypatch.setattr(tools, "_duckduckgo_request", ddg)
+
+        results = asyncio.run(tools.fanout_search("q"))
+
+        assert results == [{"title": "D", "link": "https://d.example"}]
+        assert tools.circuit_breakers["tavily"].snapshot()["consecutive_failures"] == 1
+        assert tools.circuit_breakers["google"].snapshot()["consecutive_failures"] == 1
+
+
+class TestOptionalSearch:
+    def test_wikipedia_request_picks_language_and_strips_markup(self):
+        import asyncio
+
+        import httpx
+
+        seen = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            seen.append(request.url)
+            return httpx.Response(
+                200,
+                json={
+                    "query": {
+                        "search": [
+                            {"title": "深度 学习", "snippet": '<span class="searchmatch">深度</span>学习'}
+                        ]
+                    }
+                },
+            )
+
+        tools = SearchTools(transport=httpx.MockTransport(handler))
+        results = asyncio.run(tools._wikipedia_request("深度学习", 3))
+
+        assert seen[0].host == "zh.wikipedia.org"
+        assert seen[0].params["srlimit"] == "3"
+        assert results == [
+            {
+                "title": "深度 学习",
+                "link": "https://zh.wikipedia.org/wiki/%E6%B7%B1%E5%BA%A6_%E5%AD%A6%E4%B9%A0",
+                "snippet": "深度学习",
+                "source": "wikipedia",
+            }
+        ]
+
+    def test_optional_results_merge_in_time_and_late_ones_are_dropped(self, monkeypatch):
+        import asyncio
+
+        from backend.app.services.search_tools import OptionalSearchConfig
+
+        tools = SearchTools()
+        tools.tavily_api_key = "key"
+        tools.optional = OptionalSearchConfig(providers=("wikipedia", "academic"), budget=0.1)
+
+        async def web(query, num_results, *, cost_tracker=None):  # noqa: ANN001, ARG001
+            return [{"title": "W", "link": "https://w.example"}]
+
+        async def wiki(query, num_results, *, cost_tracker=None):  # noqa: ANN001, ARG001
+            return [{"title": "Wiki", "link": "https://zh.wikipedia.org/wiki/Q"}]
+
+        async def academic(query, num_results, *, cost_tracker=None):  # noqa: ANN001, ARG001
+            await asyncio.sleep(0.3)
+            return [{"title": "Paper", "link": "https://arxiv.org/abs/1"}]
+
+        monkeypatch.setattr(tools, "tavily_search", web)
+        monkeypatch.setattr(tools, "wikipedia_search", wiki)
+        monkeypatch.setattr(tools, "academic_search", academic)
+
+        async def run():
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            results = await tools.comprehensive_search("q")
+            elapsed = loop.time() - started
+            late_before = tools.optional_stats["academic"].late
+            await asyncio.sleep(0.4)
+            return results, elapsed, late_before
+
+        results, elapsed, late_before = asyncio.run(run())
+
+        assert elapsed < 0.25
+        assert results["web"][0]["title"] == "W"
+        assert results["wikipedia"][0]["title"] == "Wiki"
+        assert results["academic"] == []
+        snapshot = tools.optional_snapshot()
+        assert snapshot["wikipedia"]["in_time"] == 1
+        # 迟到的学术搜索在后台完成后才记录耗时
+        assert late_before == 0
+        assert snapshot["academic"]["late"] == 1
+        assert snapshot["academic"]["latency_max_seconds"] >= 0.3
+
+    def test_optional_budget_starts_when_primary_search_finishes(self, monkeypatch):
+        import asyncio
+
+        from backend.app.services.search_tools import OptionalSearchConfig
+
+        tools = SearchTools()
+        tools.tavily_api_key = "key"
+        tools.optional = OptionalSearchConfig(providers=("wikipedia", "academic"), budget=0.1)
+
+        async def slow_web(query, num_results, *, cost_tracker=None):  # noqa: ANN001, ARG001
+            await asyncio.sleep(0.3)
+            return [{"title": "W", "link": "https://w.example"}]
+
+        async def wiki(query, num_results, *, cost_tracker=None):  # noqa: ANN001, ARG001
+            await asyncio.sleep(0.2)
+            return [{"title": "Wiki", "link": "https://zh.wikipedia.org/wiki/Q"}]
+
+        async def academic(query, num_results, *, cost_tracker=None):  # noqa: ANN001, ARG001
+            await asyncio.sleep(0.35)
+            return [{"title": "Paper", "link": "https://arxiv.org/abs/1"}]
+
+        monkeypatch.setattr(tools, "tavily_search", slow_web)
+        monkeypatch.setattr(tools, "wikipedia_search", wiki)
+        monkeypatch.setattr(tools, "academic_search", academic)
+
+        results = asyncio.run(tools.comprehensive_search("q"))
+
+        # 两者都超过了从发起算起的预算，但都在主搜索完成后的预算内返回
+        assert results["wikipedia"][0]["title"] == "Wiki"
+        assert results["academic"][0]["title"] == "Paper"
+        assert tools.optional_stats["academic"].latency_max >= 0.35
+
+    def test_academic_search_is_opt_in(self, monkeypatch):
+        from backend.app.services.search_tools import OptionalSearchConfig
+
+        monkeypatch.delenv("SEARCH_OPTIONAL_PROVIDERS", raising=False)
+        assert OptionalSearchConfig.from_env().providers == ("wikipedia",)
+        monkeypatch.setenv("SEARCH_OPTIONAL_PROVIDERS", "wikipedia, academic")
+        assert OptionalSearchConfig.from_env().providers == ("wikipedia", "academic")
+
+    def test_retriever_reserves_slots_for_optional_buckets(self, monkeypatch):
+        import asyncio
+
+        from backend.app.research.retriever import ResearchRetriever
+
+        async def fake_search(query, *, cost_tracker=None):  # noqa: ANN001, ARG001
+            return {
+                "web": [{"title": f"W{i}", "link": f"https://w{i}.example"} for i in range(8)],
+                "wikipedia": [{"title": "Wiki", "link": "https://zh.wikipedia.org/wiki/Q"}],
+                "academic": [{"title": "Paper", "link": "https://arxiv.org/abs/1"}],
+            }
+
+        monkeypatch.setattr(
+            "backend.app.research.retriever.search_tools.comprehensive_search", fake_search
+        )
+
+        sources = asyncio.run(ResearchRetriever().search("q", max_results=8))
+
+        assert [source.title for source in sources] == [
+            "W0", "W1", "W2", "W3", "W4", "W5", "Wiki", "Paper"
+        ]
+        assert sources[-1].source == "academic"
+
+
+class TestSearchQuota:
+    def test_rate_limiter_allows_burst_then_paces_to_qps(self):
+        import asyncio
+
+        from backend.app.services.search_quota import ProviderRateLimiter
+
+        limiter = ProviderRateLimiter("tavily", qps=20, burst=2)
+
+        async def run():
+            return [await limiter.acquire() for _ in range(4)]
+
+        waits = asyncio.run(run())
+
+        assert waits[:2] == [0.0, 0.0]
+        assert all(wait >= 0.04 for wait in waits[2:])
+        assert limiter.snapshot()["throttled"] == 2
+        assert limiter.snapshot()["granted"] == 4
+
+    def test_daily_quota_persists_and_resets_next_day(self, tmp_path):
+        from backend.app.services.search_quota import SearchQuotaTracker
+
+        now = [86400.0 * 100]
+        db_path = str(tmp_path / "quota.db")
+
+        def tracker():
+            return SearchQuotaTracker(
+                daily_limits={"tavily": 2}, db_path=db_path, clock=lambda: now[0]
+            )
+
+        first = tracker()
+        assert [first.try_consume("tavily") for _ in range(3)] == [True, True, False]
+        assert first.exhausted("tavily")
+
+        restarted = tracker()
+        assert restarted.try_consume("tavily") is False
+        assert restarted.usage("tavily") == 2
+        assert restarted.try_consume("google") is True  # 未设上限的搜索源只计数
+
+        now[0] += 86400
+        assert restarted.exhausted("tavily") is False
+        assert restarted.try_consume("tavily") is True
+        assert restarted.snapshot()["tavily"]["used"] == 1
+
+    def test_quota_rejection_releases_half_open_probe(self, monkeypatch):
+        import asyncio
+
+        from backend.app.services.search_quota import SearchQuotaTracker
+
+        tools = SearchTools()
+        tools.tavily_api_key = "key"
+        tools.cache.enabled = False
+        tools.quota = SearchQuotaTracker(daily_limits={"tavily": 1})
+        tools.quota.try_consume("tavily")  # 其他进程已用完今日配额，本进程尚未察觉
+        now = [0.0]
+        breaker = CircuitBreaker("tavily", failure_threshold=1, reset_timeout=10, clock=lambda: now[0])
+        breaker.record_failure()
+        now[0] = 10.0
+        tools.circuit_breakers["tavily"] = breaker
+        monkeypatch.setattr(tools, "_tavily_request", AsyncMock(side_effect=AssertionError))
+
+        assert asyncio.run(tools.tavily_search("q")) == []
+        assert breaker.state is CircuitState.HALF_OPEN
+        assert breaker.allow_request() is True
+
+    def test_snapshot_reads_memory_without_touching_db(self, tmp_path, monkeypatch):
+        import asyncio
+
+        from backend.app.services.search_quota import SearchQuotaTracker
+
+        tracker = SearchQuotaTracker(daily_limits={"google": 5}, db_path=str(tmp_path / "q.db"))
+        assert asyncio.run(tracker.consume("google")) is True
+
+        def fail_connect(*args, **kwargs):  # noqa: ANN002, ANN003
+            raise AssertionError("snapshot must not open the database")
+
+        monkeypatch.setattr("backend.app.services.search_quota.sqlite3.connect", fail_connect)
+        assert tracker.snapshot()["google"]["used"] == 1
+
+    def test_default_db_path_is_inside_backend_package(self, monkeypatch):
+        from pathlib import Path
+
+        from backend.app.services.search_quota import SearchQuotaTracker
+
+        monkeypatch.delenv("SEARCH_QUOTA_DB_PATH", raising=False)
+        db_path = Path(SearchQuotaTracker.from_env().db_path)
+        assert db_path.is_absolute()
+        assert db_path.parent == Path(__file__).resolve().parents[1] / "backend" / "data"
+
+    def test_exhausted_tavily_routes_to_next_provider(self, monkeypatch):
+        import asyncio
+
+        from backend.app.services.search_quota import SearchQuotaTracker
+        from backend.app.services.search_tools import OptionalSearchConfig
+
+        tools = SearchTools()
+        tools.tavily_api_key = "key"
+        tools.serpapi_key = None
+        tools.cache.enabled = False
+        tools.optional = OptionalSearchConfig(providers=())
+        tools.quota = SearchQuotaTracker(daily_limits={"tavily": 1})
+
+        tavily = AsyncMock(return_value=[{"title": "T", "link": "https://t.example"}])
+        ddg = AsyncMock(return_value=[{"title": "D", "link": "https://d.example"}])
+        monkeypatch.setattr(tools, "_tavily_request", tavily)
+        monkeypatch.setattr(tools, "_duckduckgo_request", ddg)
+
+        async def run():
+            first = await tools.comprehensive_search("q1")
+            second = await tools.comprehensive_search("q2")
+            third = await tools.comprehensive_search("q3")
+            return first, second, third
+
+        first, second, third = asyncio.run(run())
+
+        assert first["web"][0]["title"] == "T"
+        assert second["web"][0]["title"] == "D"  # 配额恰好用尽的那次也立即改用备选源
+        assert third["web"][0]["title"] == "D"
+        assert tavily.await_count == 1
+        snapshot = tools.quota.snapshot()
+        assert snapshot["tavily"] == {
+            "used": 1,
+            "daily_limit": 1,
+            "exhausted": True,
+            "rejected": 1,
+        }
+        assert snapshot["duckduckgo"]["used"] == 2
+        assert tools.rate_limit_snapshot()["tavily"]["granted"] == 2
+
+
+class TestSearchCache:
+    def _cache(self, now, **kwargs):  # noqa: ANN001, ANN003
+        from backend.app.services.search_cache import SearchResultCache
+
+        return SearchResultCache(clock=lambda: now[0], **kwargs)
+
+    def test_normalized_query_hits_until_provider_ttl_expires(self):
+        now = [0.0]
+        cache = self._cache(now, ttl_seconds=100, provider_ttls={"google": 10})
+        results = [{"title": "A", "link": "https://a.example"}]
+        cache.put("tavily", "DeepSeek  企业应用", 6, results)
+        cache.put("google", "DeepSeek", 6, results)
+
+        assert cache.get("tavily", " deepseek 企业应用 ", 6) == results
+        assert cache.get("tavily", "DeepSeek 企业应用", 8) is None  # 结果数不同
+        assert cache.get("duckduckgo", "DeepSeek 企业应用", 6) is None  # 搜索源不同
+        now[0] = 11.0
+        assert cache.get("google", "DeepSeek", 6) is None
+        assert cache.get("tavily", "DeepSeek 企业应用", 6) == results
+        assert cache.snapshot()["hits"] == 2
+
+    def test_lru_eviction_and_empty_results_not_stored(self):
+        now = [0.0]
+        cache = self._cache(now, max_entries=2)
+        cache.put("tavily", "empty", 6, [])
+        for query in ("a", "b"):
+            cache.put("tavily", query, 6, [{"link": query}])
+        cache.get("tavily", "a", 6)
+        cache.put("tavily", "c", 6, [{"link": "c"}])
+
+        assert cache.get("tavily", "empty", 6) is None
+        assert cache.get("tavily", "b", 6) is None  # 最久未使用的被淘汰
+        assert cache.get("tavily", "a", 6) == [{"link": "a"}]
+
+    def test_sqlite_tier_survives_new_instance(self, tmp_path):
+        now = [0.0]
+        db_path = str(tmp_path / "search_cache.db")
+        self._cache(now, db_path=db_path).put("tavily", "q", 6, [{"link": "x"}])
+
+        cache = self._cache(now, db_path=db_path)
+        assert cache.get("tavily", "Q", 6) == [{"link": "x"}]
+        now[0] = 7200.0
+        assert self._cache(now, db_path=db_path).get("tavily", "q", 6) is None
+
+    def test_repeated_search_hits_cache_and_is_reported_in_cost_summary(self, monkeypatch):
+        import asyncio
+
+        from backend.app.services.search_cache import SearchResultCache
+
+        from backend.app.services.search_tools import OptionalSearchConfig
+
+        tools = SearchTools()
+        tools.tavily_api_key = "key"
+        tools.cache = SearchResultCache()
+        tools.optional = OptionalSearchConfig(providers=())
+        calls = []
+
+        async def fake_tavily(query, num_results=10):  # noqa: ANN001
+            calls.append(query)
+            return [{"title": "A", "link": "https://a.example", "source": "tavily"}]
+
+        monkeypatch.setattr(tools, "_tavily_request", fake_tavily)
+        tracker = CostTracker()
+
+        async def run():
+            first = await tools.comprehensive_search("DeepSeek", cost_tracker=tracker)
+            second = await tools.comprehensive_search("deepseek ", cost_tracker=tracker)
+            return first, second
+
+        first, second = asyncio.run(run())
+        assert first == second
+        assert calls == ["DeepSeek"]
+        summary = tracker.summary()
+        assert summary["search_calls"] == 1
+        assert summary["search_cache_hits"] == 1
+        assert summary["total_tokens"] == 0
+
+    def test_persistent_tier_does_not_block_the_event_loop(self, tmp_path, monkeypatch):
+        import asyncio
+        import threading
+
+        import backend.app.services.search_cache as search_cache
+
+        from backend.app.services.search_tools import OptionalSearchConfig
+
+        real_connect = search_cache.sqlite3.connect
+
+        def connect(*args, **kwargs):  # noqa: ANN002, ANN003
+            if threading.current_thread() is threading.main_thread():
+                raise AssertionError("search cache must not open SQLite on the event loop")
+            return real_connect(*args, **kwargs)
+
+        monkeypatch.setattr(search_cache.sqlite3, "connect", connect)
+        db_path = str(tmp_path / "search_cache.db")
+        tools = SearchTools()
+        tools.tavily_api_key = "key"
+        tools.cache = search_cache.SearchResultCache(db_path=db_path)
+        tools.optional = OptionalSearchConfig(providers=())
+        calls = []
+
+        async def fake_tavily(query, num_results=10):  # noqa: ANN001
+            calls.append(query)
+            return [{"title": "A", "link": "https://a.example", "source": "tavily"}]
+
+        monkeypatch.setattr(tools, "_tavily_request", fake_tavily)
+        asyncio.run(tools.comprehensive_search("DeepSeek"))
+        # 新实例的内存层为空，只能从 SQLite 层读到结果
+        tools.cache = search_cache.SearchResultCache(db_path=db_path)
+        asyncio.run(tools.comprehensive_search("DeepSeek"))
+        assert calls == ["DeepSeek"]
+        assert tools.cache.snapshot()["hits"] == 1
+
+
+class TestAdaptiveConcurrency:
+    def _limiter(self, now, **kwargs):  # noqa: ANN001, ANN003
+        options = {"initial": 2, "floor": 1, "ceiling": 4, "latency_target": 1.0, "cooldown": 5.0}
+        options.update(kwargs)
+        return AdaptiveConcurrencyLimiter("test", clock=lambda: now[0], **options)
+
+    def test_additive_increase_when_saturated_and_fast(self):
+        import asyncio
+
+        now = [0.0]
+        limiter = self._limiter(now)
+
+        async def call():
+            async with limiter.slot():
+                await asyncio.sleep(0)
+
+        async def run():
+            await asyncio.gather(*(call() for _ in range(limiter.limit)))
+            assert limiter.limit == 2  # 每个满载窗口约 +1，不会一次跳变
+            for _ in range(10):
+                await asyncio.gather(*(call() for _ in range(limiter.limit)))
+
+        asyncio.run(run())
+        assert limiter.limit == 4  # 不超过上限
+        assert limiter.snapshot()["increases"] > 0
+
+    def test_no_increase_when_underused_or_slow(self):
+        import asyncio
+
+        now = [0.0]
+        limiter = self._limiter(now, initial=4)
+
+        async def run():
+            for _ in range(10):
+                async with limiter.slot():
+                    pass
+            async with limiter.slot() as slot:
+                slot.mark_success(latency=5.0)
+
+        asyncio.run(run())
+        assert limiter.limit == 4
+        assert limiter.snapshot()["increases"] == 0
+
+    def test_multiplicative_decrease_on_timeout_with_cooldown(self):
+        import asyncio
+
+        import pytest
+
+        now = [0.0]
+        limiter = self._limiter(now, initial=4)
+
+        async def timeout():
+            async with limiter.slot():
+                raise TimeoutError
+
+        async def run():
+            for _ in range(3):
+                with pytest.raises(TimeoutError):
+                    await timeout()
+            assert limiter.limit == 2  # 冷却期内的连续超时只减一次
+            now[0] = 10.0
+            async with limiter.slot() as slot:
+                slot.mark_overloaded()
+
+        asyncio.run(run())
+        assert limiter.limit == 1
+        snapshot = limiter.snapshot()
+        assert snapshot["decreases"] == 2
+        assert snapshot["overloads"] == 4
+
+    def test_limits_in_flight_and_serves_fifo(self):
+        import asyncio
+
+        now = [0.0]
+        limiter = self._limiter(now, initial=1, ceiling=1)
+        order = []
+
+        async def call(name):  # noqa: ANN001
+            async with limiter.slot():
+                order.append((name, limiter.in_flight))
+                await asyncio.sleep(0)
+
+        async def run():
+            await asyncio.gather(*(call(name) for name in "abc"))
+
+        asyncio.run(run())
+        assert order == [("a", 1), ("b", 1), ("c", 1)]
+
+    def test_llm_429_shrinks_llm_limit(self):
+        import asyncio
+
+        import httpx
+
+        responses = iter([429, 200])
+
+        def handler(request):  # noqa: ANN001, ARG001
+            status = next(responses)
+            if status == 429:
+                return httpx.Response(429, text="slow down")
+            return httpx.Response(200, json={"choices": [{"message": {"content": "ok"}}]})
+
+        limiter = AdaptiveConcurrencyLimiter("llm", initial=8, floor=2, ceiling=16)
+        svc = DeepSeekService(
+            transport=httpx.MockTransport(handler),
+            retry_policy=_no_delay_retry_policy(max_retries=2),
+            concurrency=limiter,
+        )
+        svc.api_key = "test"
+
+        completion = asyncio.run(svc.complete("hello"))
+        assert completion.text == "ok"
+        assert limiter.limit == 4
+        assert limiter.snapshot()["overloads"] == 1
+
+    def test_fetch_timeout_counts_as_overload(self, monkeypatch):
+        import asyncio
+
+        import requests
+
+        def fake_get(*args, **kwargs):  # noqa: ANN002, ANN003, ARG001
+            raise requests.Timeout("slow page")
+
+        monkeypatch.setattr(requests, "get", fake_get)
+        svc = ContentExtractionService()
+        svc.concurrency = AdaptiveConcurrencyLimiter("fetch", initial=8, floor=2, ceiling=32)
+
+        assert asyncio.run(svc.extract_content("https://example.com")) == ""
+        assert svc.concurrency.limit == 4
+
+
+class TestStandInServer:
+    def _service(self, **config):  # noqa: ANN003
+        import httpx
+
+        from backend.app.llms.stand_in_server import StandInConfig
+        from backend.app.llms.stand_in_server import create_stand_in_app
+        from backend.app.services.deepseek_service import DeepSeekConfig
+
+        app = create_stand_in_app(
+            StandInConfig(latency_median_seconds=0, tokens_per_second=0, seed=1, **config)
+        )
+        svc = DeepSeekService(
+            DeepSeekConfig(
+                model="deepseek-chat",
+                temperature=0.2,
+                max_output_tokens=100,
+                max_prompt_chars=0,
+                base_url="http://stand-in/v1",
+            ),
+            transport=httpx.ASGITransport(app=app),
+            retry_policy=_no_delay_retry_policy(max_retries=0),
+        )
+        return svc, app
+
+    def test_base_url_comes_from_env(self, monkeypatch):
+        from backend.app.services.deepseek_service import DeepSeekConfig
+
+        monkeypatch.setenv("DEEPSEEK_BASE_URL", "http://127.0.0.1:8100/v1/")
+        assert DeepSeekService(DeepSeekConfig.from_env()).base_url == "http://127.0.0.1:8100/v1"
+
+    def test_planner_and_verifier_answers_parse(self):
+        import asyncio
+
+        from backend.app.research.query_planner import QUERY_PLANNER_PROMPT
+        from backend.app.research.query_planner import QUERY_PLANNER_SYSTEM_PROMPT
+        from backend.app.research.query_planner import QueryPlanner
+        from backend.app.services.verifier_service import VERIFIER_SYSTEM_PROMPT
+
+        svc, _ = self._service()
+        prompt = QUERY_PLANNER_PROMPT.format(
+            query="固态电池", initial_results_block="（无）", max_sub_queries=2
+        )
+
+        async def run():
+            planned = await svc.complete(prompt, system_prompt=QUERY_PLANNER_SYSTEM_PROMPT)
+            verified = await svc.complete("分析", system_prompt=VERIFIER_SYSTEM_PROMPT)
+            return planned, verified
+
+        planned, verified = asyncio.run(run())
+        sub_queries = QueryPlanner.__new__(QueryPlanner)._parse_sub_queries(planned.text, 5)
+        assert sub_queries == ["固态电池 历史发展", "固态电池 最新进展"]
+        assert '"passed": true' in verified.text
+        assert planned.has_usage
+
+    def test_stream_report_with_usage(self):
+        import asyncio
+
+        from backend.app.research.writer import REPORT_SYSTEM_PROMPT
+
+        svc, _ = self._service(stream_chunk_chars=5)
+        usage: dict[str, int] = {}
+
+        async def collect():
+            return [
+                delta
+                async for delta in svc.stream_response(
+                    "## 原始研究问题\n固态电池", system_prompt=REPORT_SYSTEM_PROMPT, usage=usage
+                )
+            ]
+
+        deltas = asyncio.run(collect())
+        assert len(deltas) > 1
+        assert "## 执行摘要" in "".join(deltas)
+        assert usage["completion_tokens"] > 0
+
+    def test_stop_sequences_truncate_output(self):
+        import asyncio
+
+        from backend.app.services.verifier_service import VERIFIER_SYSTEM_PROMPT
+
+        svc, _ = self._service()
+        completion = asyncio.run(
+            svc.complete(
+                "分析", system_prompt=VERIFIER_SYSTEM_PROMPT, json_mode=True, stop=['"score"']
+            )
+        )
+        assert completion.text.startswith('{"passed": true')
+        assert "score" not in completion.text
+
+    def test_rate_limit_returns_retry_after(self):
+        import asyncio
+
+        import pytest
+
+        from backend.app.services.deepseek_service import DeepSeekAPIError
+
+        svc, app = self._service(rate_limit_rate=1.0, retry_after_seconds=2)
+        with pytest.raises(DeepSeekAPIError) as excinfo:
+            asyncio.run(svc.complete("hello"))
+        assert excinfo.value.status_code == 429
+        assert app.state.stand_in.active == 0
+
+
+class TestGenerationProfiles:
+    def test_step_defaults_and_env_overrides(self, monkeypatch):
+        monkeypatch.setenv("DEEPSEEK_PROFILE_VERIFICATION_MODEL", "deepseek-lite")
+        monkeypatch.setenv("DEEPSEEK_PROFILE_VERIFICATION_MAX_TOKENS", "200")
+        svc = DeepSeekService()
+
+        verification = svc.profile_for("verification")
+        assert verification.model == "deepseek-lite"
+        assert verification.max_tokens == 200
+        assert verification.temperature == 0.0
+        assert svc.profile_for("query_planning").max_tokens < svc.config.max_output_tokens
+        assert svc.profile_for("report_writing").max_tokens == svc.config.max_output_tokens
+        assert svc.profile_for("unknown").max_tokens == svc.config.max_output_tokens
+
+    def test_llm_picks_up_profile_unless_overridden(self):
+        from backend.app.llms.deepseek_llm import DeepSeekLLM
+        from backend.app.services.deepseek_service import deepseek_service
+
+        profile = deepseek_service.profile_for("verification")
+        llm = DeepSeekLLM(profile="verification")
+        assert llm.max_tokens == profile.max_tokens
+        assert llm.request_timeout == profile.timeout
+        assert DeepSeekLLM(profile="verification", max_tokens=50).max_tokens == 50
+        assert VerifierService().llm.profile == "verification"
+
+    def test_profile_timeout_is_sent_per_request(self):
+        import asyncio
+
+        import httpx
+
+        seen = []
+
+        def handler(request):  # noqa: ANN001
+            seen.append(request.extensions["timeout"])
+            return httpx.Response(200, json={"choices": [{"message": {"content": "ok"}}]})
+
+        svc = DeepSeekService(transport=httpx.MockTransport(handler))
+        asyncio.run(svc.complete("hello", timeout=12.5))
+        assert seen[0]["read"] == 12.5
+        assert seen[0]["connect"] == svc.config.connect_timeout
+
+
+class TestLLMRateLimiter:
+    def test_in_flight_cap_queues_fifo(self):
+        import asyncio
+
+        limiter = LLMRateLimiter(max_in_flight=1)
+        order = []
+
+        async def worker(name):  # noqa: ANN001
+            async with limiter.acquire():
+                order.append(name)
+                await asyncio.sleep(0)
+
+        async def run():
+            async with limiter.acquire():
+                tasks = [asyncio.create_task(worker(name)) for name in ("b", "c")]
+                await asyncio.sleep(0)
+                assert limiter.queue_depth == 2
+                assert limiter.in_flight == 1
+            await asyncio.gather(*tasks)
+
+        asyncio.run(run())
+        assert order == ["b", "c"]
+        assert limiter.queue_depth == 0
+        assert limiter.in_flight == 0
+
+    def test_tokens_per_minute_waits_for_refill(self):
+        import asyncio
+
+        now = [0.0]
+        limiter = LLMRateLimiter(tokens_per_minute=600, clock=lambda: now[0])
+
+        async def run():
+            async with limiter.acquire(600) as waited:
+                assert waited == 0.0
+            pending = asyncio.create_task(_hold(limiter, 300))
+            await asyncio.sleep(0)
+            assert limiter.queue_depth == 1
+            now[0] = 30.0
+            limiter._dispatch()
+            return await pending
+
+        assert asyncio.run(run()) == 30.0
+
+    def test_cancelled_waiter_leaves_queue(self):
+        import asyncio
+
+        limiter = LLMRateLimiter(max_in_flight=1)
+
+        async def run():
+            async with limiter.acquire():
+                waiter = asyncio.create_task(_hold(limiter, 0))
+                await asyncio.sleep(0)
+                waiter.cancel()
+                await asyncio.gather(waiter, return_exceptions=True)
+                assert limiter.queue_depth == 0
+            assert limiter.snapshot()["in_flight"] == 0
+
+        asyncio.run(run())
+
+
+async def _hold(limiter, tokens):  # noqa: ANN001
+    async with limiter.acquire(tokens) as waited:
+        return waited
+
+
+class TestSingleFlight:
+    def _service(self, release, calls):  # noqa: ANN001
+        import httpx
+
+        async def handler(request):  # noqa: ANN001
+            calls.append(request)
+            await release.wait()
+            return httpx.Response(
+                200, json={"choices": [{"message": {"content": "shared"}}]}
+            )
+
+        return DeepSeekService(
+            transport=httpx.MockTransport(handler),
+            retry_policy=_no_delay_retry_policy(),
+        )
+
+    def test_identical_concurrent_prompts_issue_one_request(self):
+        import asyncio
+
+        calls = []
+
+        async def run():
+            release = asyncio.Event()
+            svc = self._service(release, calls)
+            tasks = [asyncio.create_task(svc.complete("same")) for _ in range(3)]
+            different = asyncio.create_task(svc.complete("other"))
+            await asyncio.sleep(0.01)
+            release.set()
+            return await asyncio.gather(*tasks), await different
+
+        results, different = asyncio.run(run())
+        assert [r.text for r in results] == ["shared"] * 3
+        assert [r.shared for r in results] == [False, True, True]
+        assert different.shared is False
+        assert len(calls) == 2
+
+    def test_cancelled_waiter_does_not_cancel_shared_call(self):
+        import asyncio
+
+        calls = []
+
+        async def run():
+            release = asyncio.Event()
+            svc = self._service(release, calls)
+            owner = asyncio.create_task(svc.complete("same"))
+            joiner = asyncio.create_task(svc.complete("same"))
+            await asyncio.sleep(0.01)
+            owner.cancel()
+            await asyncio.sleep(0)
+            release.set()
+            result = await joiner
+            assert owner.cancelled()
+            return result, svc._inflight
+
+        result, inflight = asyncio.run(run())
+        assert result.text == "shared"
+        assert inflight == {}
+        assert len(calls) == 1
+
+    def test_last_waiter_leaving_cancels_underlying_call(self):
+        import asyncio
+
+        calls = []
+
+        async def run():
+            release = asyncio.Event()
+            svc = self._service(release, calls)
+            waiter = asyncio.create_task(svc.complete("same"))
+            await asyncio.sleep(0.01)
+            entry = next(iter(svc._inflight.values()))
+            waiter.cancel()
+            await asyncio.gather(waiter, return_exceptions=True)
+            await asyncio.sleep(0)
+            return entry.task.cancelled(), svc._inflight
+
+        cancelled, inflight = asyncio.run(run())
+        assert cancelled
+        assert inflight == {}
+
+
+class TestLLMResponseCache:
+    def test_memory_tier_evicts_least_recently_used_by_bytes(self):
+        key_a, key_b, key_c = "a" * 8, "b" * 8, "c" * 8
+        cache = LLMResponseCache(enabled=True, memory_max_bytes=40)
+        cache.put(key_a, "x" * 10)
+        cache.put(key_b, "y" * 10)
+        assert cache.get(key_a) == "x" * 10
+        cache.put(key_c, "z" * 10)
+        assert cache.get(key_b) is None
+        assert cache.get(key_a) == "x" * 10
+        assert cache.snapshot()["memory_bytes"] <= 40
+
+    def test_sqlite_tier_survives_restart_until_ttl(self, tmp_path, monkeypatch):
+        import backend.app.services.llm_cache as llm_cache
+
+        db_path = str(tmp_path / "llm_cache.db")
+        LLMResponseCache(enabled=True, db_path=db_path, ttl_seconds=60).put("k", "v")
+
+        restarted = LLMResponseCache(enabled=True, db_path=db_path, ttl_seconds=60)
+        assert restarted.get("k") == "v"
+
+        expired = LLMResponseCache(enabled=True, db_path=db_path, ttl_seconds=60)
+        real_time = llm_cache.time.time
+        monkeypatch.setattr(llm_cache.time, "time", lambda: real_time() + 120)
+        assert expired.get("k") is None
+
+    def test_async_access_runs_sqlite_off_the_event_loop(self, tmp_path, monkeypatch):
+        import asyncio
+        import threading
+
+        import backend.app.services.llm_cache as llm_cache
+
+        real_connect = llm_cache.sqlite3.connect
+        worker_threads = []
+
+        def connect(*args, **kwargs):  # noqa: ANN002, ANN003
+            if threading.current_thread() is threading.main_thread():
+                raise AssertionError("SQLite must not be opened on the event loop thread")
+            worker_threads.append(threading.current_thread())
+            return real_connect(*args, **kwargs)
+
+        monkeypatch.setattr(llm_cache.sqlite3, "connect", connect)
+        db_path = str(tmp_path / "llm_cache.db")
+
+        async def run():
+            await LLMResponseCache(enabled=True, db_path=db_path).aput("k", "v")
+            restarted = LLMResponseCache(enabled=True, db_path=db_path)
+            return await restarted.aget("k"), await restarted.aget("k"), await restarted.aget("x")
+
+        assert asyncio.run(run()) == ("v", "v", None)
+        # 第二次读取命中内存层，不再访问数据库
+        assert len(worker_threads) == 5
+
+    def test_default_db_path_is_inside_backend_package(self, monkeypatch):
+        from pathlib import Path
+
+        monkeypatch.delenv("DEEPSEEK_CACHE_DB_PATH", raising=False)
+        db_path = Path(LLMResponseCache.from_env().db_path)
+        assert db_path.is_absolute()
+        assert db_path.parent == Path(__file__).resolve().parents[1] / "backend" / "data"
+
+    def test_key_changes_with_generation_parameters(self):
+        base = dict(model="m", temperature=0.2, max_tokens=100, prompt="p")
+        key = LLMResponseCache.make_key(**base)
+        assert key == LLMResponseCache.make_key(**base)
+        assert key != LLMResponseCache.make_key(**{**base, "temperature": 0.3})
+        assert key != LLMResponseCache.make_key(**{**base, "max_tokens": 200})
+
+    def test_service_serves_repeated_step_prompt_from_cache(self):
+        import asyncio
+
+        import httpx
+
+        calls = []
+
+        def handler(request):  # noqa: ANN001
+            calls.append(request)
+            return httpx.Response(
+                200, json={"choices": [{"message": {"content": "plan"}}]}
+            )
+
+        svc = DeepSeekService(
+            transport=httpx.MockTransport(handler),
+            retry_policy=_no_delay_retry_policy(),
+            response_cache=LLMResponseCache(
+                enabled=True, steps=frozenset({"query_planning"})
+            ),
+        )
+
+        async def run():
+            first = await svc.complete("q", step="query_planning")
+            second = await svc.complete("q", step="query_planning")
+            other = await svc.complete("q", step="verification")
+            return first, second, other
+
+        first, second, other = asyncio.run(run())
+        assert (first.cache_status, second.cache_status) == ("miss", "hit")
+        assert second.text == "plan" and second.cached
+        assert other.cache_status == "off"
+        assert len(calls) == 2
+
+
+# ═══════════════════════════════════════════════════════════════════
+# CostTracker
+# ═══════════════════════════════════════════════════════════════════
+
+class TestCostTracker:
+    def test_estimates_tokens_from_characters(self):
+        assert estimate_tokens("") == 0
+        assert estimate_tokens("abcd") == 1
+        assert estimate_tokens("a" * 40) == 10
+        assert estimate_tokens("研究" * 10) == 12
+
+    def test_tracks_llm_call_with_configured_rates(self):
+        tracker = CostTracker(
+            input_cost_per_1m_tokens=1.0,
+            output_cost_per_1m_tokens=2.0,
+        )
+        tracker.track_llm_call(
+            step="query_planning",
+            prompt="a" * 400,
+            response="b" * 200,
+        )
+        summary = tracker.summary()
+        assert summary["pricing_source"] == "defaults_or_env"
+        assert summary["total_input_tokens"] == 100
+        assert summary["total_output_tokens"] == 50
+        assert summary["estimated_cost_usd"] == 0.0002
+        assert summary["calls"][0]["step"] == "query_planning"
+
+    def test_summary_reports_retries_and_failures(self):
+        from backend.app.services.deepseek_service import DeepSeekAPIError
+        from backend.app.services.deepseek_service import DeepSeekCompletion
+
+        tracker = CostTracker()
+        tracker.track_llm_call(
+            step="verification",
+            prompt="p",
+            response="r",
+            completion=DeepSeekCompletion(
+                text="r",
+                retries=2,
+                retry_backoff_seconds=3.5,
+                retry_reasons={"rate_limited": 2},
+            ),
+        )
+        tracker.track_llm_failure(
+            step="report_writing",
+            error=DeepSeekAPIError(
+                "down",
+                retry_class=RetryClass.SERVER_ERROR,
+                retries=3,
+                backoff_seconds=6.0,
+            ),
+        )
+        summary = tracker.summary()
+        assert summary["total_retries"] == 5
+        assert summary["total_retry_backoff_seconds"] == 9.5
+        assert summary["failed_calls"] == 1
+        assert summary["calls"][0]["retry_reasons"] == {"rate_limited": 2}
+
+    def test_cache_hits_are_free_and_counted(self):
+        from backend.app.services.deepseek_service import DeepSeekCompletion
+
+        tracker = CostTracker()
+        for status in ("miss", "hit"):
+            tracker.track_llm_call(
+                step="query_planning",
+                prompt="a" * 400,
+                response="b" * 200,
+                completion=DeepSeekCompletion(text="b" * 200, cache_status=status),
+            )
+        summary = tracker.summary()
+        assert summary["llm_cache_hits"] == 1
+        assert summary["llm_cache_misses"] == 1
+        assert summary["total_input_tokens"] == 100
+        assert summary["calls"][1]["estimated_cost_usd"] == 0.0
+
+    def test_prefers_provider_usage_over_estimate(self):
+        from backend.app.services.deepseek_service import DeepSeekCompletion
+
+        tracker = CostTracker(
+            input_cost_per_1m_tokens=1.0,
+            output_cost_per_1m_tokens=2.0,
+            input_cache_hit_cost_per_1m_tokens=0.1,
+        )
+        tracker.track_llm_call(
+            step="context_compression",
+            prompt="上下文" * 100,
+            response="摘要",
+            completion=DeepSeekCompletion(
+                text="摘要",
+                prompt_tokens=300,
+                completion_tokens=50,
+                prompt_cache_hit_tokens=200,
+                prompt_cache_miss_tokens=100,
+                latency_seconds=1.5,
+            ),
+        )
+        summary = tracker.summary()
+        assert summary["estimated"] is False
+        assert summary["total_input_tokens"] == 300
+        assert summary["total_output_tokens"] == 50
+        assert summary["total_prompt_cache_hit_tokens"] == 200
+        assert summary["total_llm_latency_seconds"] == 1.5
+        assert summary["estimated_cost_usd"] == 0.00022
+
+    def test_reports_prompt_cache_hit_ratio_per_step(self):
+        from backend.app.services.deepseek_service import DeepSeekCompletion
+
+        tracker = CostTracker()
+        for hit, miss in ((0, 400), (300, 100)):
+            tracker.track_llm_call(
+                step="context_compression",
+                prompt="p",
+                response="r",
+                completion=DeepSeekCompletion(
+                    text="r",
+                    prompt_tokens=hit + miss,
+                    completion_tokens=10,
+                    prompt_cache_hit_tokens=hit,
+                    prompt_cache_miss_tokens=miss,
+                ),
+            )
+        tracker.track_llm_call(step="verification", prompt="p", response="r")
+        by_step = tracker.summary()["prompt_cache_by_step"]
+        assert by_step == {
+            "context_compression": {
+                "hit_tokens": 300,
+                "miss_tokens": 500,
+                "hit_ratio": 0.375,
+            }
+        }
+
+    def test_falls_back_to_estimate_without_usage(self):
+        tracker = CostTracker()
+        tracker.track_llm_call(step="verification", prompt="a" * 40, response="b")
+        assert tracker.calls[0]["estimated"] is True
+        assert tracker.summary()["estimated"] is True
+
+    def test_coalesced_calls_are_not_billed_twice(self):
+        from backend.app.services.deepseek_service import DeepSeekCompletion
+
+        tracker = CostTracker()
+        for shared in (False, True):
+            tracker.track_llm_call(
+                step="query_planning",
+                prompt="a" * 400,
+                response="b",
+                completion=DeepSeekCompletion(text="b", shared=shared),
+            )
+        summary = tracker.summary()
+        assert summary["llm_coalesced_calls"] == 1
+        assert summary["total_input_tokens"] == 100
+
+    def test_model_defaults_to_deepseek_config(self, monkeypatch):
+        monkeypatch.setenv("DEEPSEEK_MODEL", "deepseek-reasoner")
+        tracker = CostTracker()
+        assert tracker.summary()["model"] == "deepseek-reasoner"
+
+    def test_prices_each_call_at_its_own_model_rate(self, monkeypatch):
+        from backend.app.services.deepseek_service import DeepSeekCompletion
+
+        monkeypatch.setenv("DEEPSEEK_REASONER_INPUT_COST_PER_1M_TOKENS", "10")
+        tracker = CostTracker(
+            model="deepseek-chat",
+            input_cost_per_1m_tokens=1.0,
+            output_cost_per_1m_tokens=2.0,
+        )
+        for model in (None, "deepseek-reasoner"):
+            tracker.track_llm_call(
+                step="verification",
+                prompt="p",
+                response="r",
+                completion=DeepSeekCompletion(
+                    text="r", prompt_tokens=1_000_000, completion_tokens=0
+                ),
+                model=model,
+            )
+        summary = tracker.summary()
+        assert [call["model"] for call in summary["calls"]] == [
+            "deepseek-chat",
+            "deepseek-reasoner",
+        ]
+        assert [call["estimated_cost_usd"] for call in summary["calls"]] == [1.0, 10.0]
+        assert summary["by_model"]["deepseek-reasoner"]["calls"] == 1
+        assert summary["by_model"]["deepseek-reasoner"]["output_cost_per_1m_tokens"] == 2.0
+
+    def test_llm_tracks_the_model_that_served_the_call(self, monkeypatch):
+        import asyncio
+
+        from backend.app.llms.deepseek_llm import DeepSeekLLM
+        from backend.app.services.deepseek_service import DeepSeekCompletion
+        from backend.app.services.deepseek_service import deepseek_service
+
+        served = iter(["deepseek-reasoner", None])
+
+        async def fake_complete(prompt, max_tokens, **kwargs):
+            return DeepSeekCompletion(text="ok", model=next(served))
+
+        monkeypatch.setattr(deepseek_service, "complete", fake_complete)
+        tracker = CostTracker(model="deepseek-chat")
+        llm = DeepSeekLLM(model_name="deepseek-lite")
+        for _ in range(2):
+            asyncio.run(llm.ainvoke("q", step="verification", cost_tracker=tracker))
+        assert [call["model"] for call in tracker.calls] == [
+            "deepseek-reasoner",
+            "deepseek-lite",
+        ]
+
+    def test_llm_estimate_counts_the_system_prompt(self, monkeypatch):
+        import asyncio
+
+        from backend.app.llms.deepseek_llm import DeepSeekLLM
+        from backend.app.services.deepseek_service import DeepSeekCompletion
+        from backend.app.services.deepseek_service import deepseek_service
+
+        async def fake_complete(prompt, max_tokens, **kwargs):
+            return DeepSeekCompletion(text="ok")
+
+        monkeypatch.setattr(deepseek_service, "complete", fake_complete)
+        tracker = CostTracker()
+        asyncio.run(
+            DeepSeekLLM().ainvoke(
+                "a" * 40,
+                step="verification",
+                cost_tracker=tracker,
+                system_prompt="s" * 400,
+            )
+        )
+        assert tracker.calls[0]["estimated"] is True
+        assert tracker.calls[0]["input_tokens"] == estimate_tokens("s" * 400 + "\n" + "a" * 40)
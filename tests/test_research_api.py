@@ -46,6 +46,7 @@ def test_non_stream_research_returns_final_payload(monkeypatch, client: TestClie
         query: str,
         user_id: int | None = None,
         guest_id: str | None = None,
+        deadline_seconds: float | None = None,
     ):
         yield {"type": "planning", "message": "planning", "data": None}
         yield {
@@ -88,6 +89,7 @@ def test_non_stream_research_allows_anonymous_access(monkeypatch) -> None:
         query: str,
         user_id: int | None = None,
         guest_id: str | None = None,
+        deadline_seconds: float | None = None,
     ):
         yield {
             "type": "report_complete",
@@ -130,6 +132,7 @@ def test_stream_research_emits_error_event_on_failure(
         query: str,
         user_id: int | None = None,
         guest_id: str | None = None,
+        deadline_seconds: float | None = None,
     ):
         raise RuntimeError("boom")
         yield {"type": "report_complete", "message": "unused", "data": None}
@@ -163,6 +166,7 @@ def test_stream_research_can_include_error_detail_when_enabled(
         query: str,
         user_id: int | None = None,
         guest_id: str | None = None,
+        deadline_seconds: float | None = None,
     ):
         raise RuntimeError("boom")
         yield {"type": "report_complete", "message": "unused", "data": None}
@@ -639,3 +643,140 @@ def test_research_agent_emits_gpt_researcher_payload(monkeypatch) -> None:
     assert report_complete["data"]["sections"][0]["evidence_ids"] == context.evidence_ids
     assert task.cost_summary["total_tokens"] > 0
     assert task.sections[0].tool == "research_conductor"
+
+
+def test_research_agent_streams_report_deltas_before_completion(monkeypatch) -> None:
+    agent = ResearchAgent(query="DeepSeek enterprise", max_concurrency=1)
+    task = ResearchTask(id="task-stream", query="DeepSeek enterprise")
+    context = SubQueryContext(step=1, query="DeepSeek 企业落地案例有哪些？", context="发现 A")
+
+    async def fake_conduct_research(on_event=None):  # noqa: ANN001
+        return [context]
+
+    async def fake_write_report(on_delta=None, **kwargs):  # noqa: ANN001, ANN003
+        for delta in ["# 报告", "\n\n正文"]:
+            await on_delta(delta)
+        return "# 报告\n\n正文"
+
+    monkeypatch.setattr(agent.conductor, "conduct_research", fake_conduct_research)
+    monkeypatch.setattr(agent.writer, "write_report", fake_write_report)
+
+    events = []
+
+    async def collect() -> None:
+        async for event in agent.run(task):
+            events.append(event)
+
+    import asyncio
+
+    asyncio.run(collect())
+
+    event_types = [event["type"] for event in events]
+    deltas = [event["data"]["delta"] for event in events if event["type"] == "report_delta"]
+    assert deltas == ["# 报告", "\n\n正文"]
+    assert event_types.index("report_generating") < event_types.index("report_delta")
+    assert event_types.index("report_delta") < event_types.index("report_complete")
+    report_complete = events[-1]
+    assert report_complete["data"]["report"] == "# 报告\n\n正文"
+
+
+def test_research_agent_drafts_sections_while_research_continues(monkeypatch) -> None:
+    import asyncio
+
+    agent = ResearchAgent(query="DeepSeek enterprise", max_concurrency=1, map_reduce_report=True)
+    task = ResearchTask(id="task-map-reduce", query="DeepSeek enterprise")
+    first = SubQueryContext(step=1, query="子查询 A", context="发现 A")
+    second = SubQueryContext(step=2, query="子查询 B", context="发现 B")
+    drafted: list[str] = []
+    writer_calls = []
+
+    async def fake_conduct_research(on_event=None):  # noqa: ANN001
+        await on_event(
+            {"type": "plan", "message": "子查询规划完成", "data": {"sub_queries": ["子查询 A", "子查询 B"]}}
+        )
+        await on_event(
+            {
+                "type": "step_complete",
+                "message": "done",
+                "data": {"step": 1, "title": "子查询 A", "status": "completed", "analysis": "发现 A"},
+            }
+        )
+        # 第二个子查询还在研究时，第一个章节的草稿已经写好
+        for _ in range(50):
+            if drafted:
+                break
+            await asyncio.sleep(0.01)
+        assert drafted == ["子查询 A"]
+        await on_event(
+            {
+                "type": "step_complete",
+                "message": "done",
+                "data": {"step": 2, "title": "子查询 B", "status": "skipped"},
+            }
+        )
+        return [first, second]
+
+    async def fake_draft_section(*, query, section, deadline=None):  # noqa: ANN001, ARG001
+        drafted.append(section.title)
+        return f"草稿：{section.analysis}"
+
+    async def fake_write_report(**kwargs):  # noqa: ANN003
+        writer_calls.append(kwargs)
+        return "# report"
+
+    monkeypatch.setattr(agent.conductor, "conduct_research", fake_conduct_research)
+    monkeypatch.setattr(agent.writer, "draft_section", fake_draft_section)
+    monkeypatch.setattr(agent.writer, "write_report", fake_write_report)
+
+    events = []
+
+    async def collect() -> None:
+        async for event in agent.run(task):
+            events.append(event)
+
+    asyncio.run(collect())
+
+    event_types = [event["type"] for event in events]
+    assert drafted == ["子查询 A"]  # 跳过的子查询不起草
+    assert event_types.index("section_draft") < event_types.index("report_generating")
+    assert writer_calls[0]["section_drafts"] == {1: "草稿：发现 A"}
+
+
+def test_research_agent_marks_report_partial_when_sub_queries_skipped(monkeypatch) -> None:
+    agent = ResearchAgent(
+        query="DeepSeek enterprise",
+        max_concurrency=1,
+        deadline_seconds=60,
+    )
+    task = ResearchTask(id="task-partial", query="DeepSeek enterprise")
+    done = SubQueryContext(step=1, query="已完成子查询", context="发现 A")
+    skipped = SubQueryContext(step=2, query="被跳过子查询", status="skipped")
+    writer_calls = []
+
+    async def fake_conduct_research(on_event=None):  # noqa: ANN001
+        assert agent.research_deadline.remaining() <= 30
+        return [done, skipped]
+
+    async def fake_write_report(**kwargs):  # noqa: ANN003
+        writer_calls.append(kwargs)
+        return "# report"
+
+    monkeypatch.setattr(agent.conductor, "conduct_research", fake_conduct_research)
+    monkeypatch.setattr(agent.writer, "write_report", fake_write_report)
+
+    events = []
+
+    async def collect() -> None:
+        async for event in agent.run(task):
+            events.append(event)
+
+    import asyncio
+
+    asyncio.run(collect())
+
+    assert task.partial is True
+    assert events[-1]["data"]["partial"] is True
+    assert [section.status for section in task.sections] == ["completed", "skipped"]
+    assert [item.query for item in writer_calls[0]["context"]] == ["已完成子查询"]
+    assert writer_calls[0]["incomplete_queries"] == ["被跳过子查询"]
+    assert writer_calls[0]["deadline"] is agent.deadline